@@ -3,14 +3,14 @@ from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from app.api.deps import get_db
 from app.models.pipeline import PipelineRun, BlockRun, BlockStatus
+import mimetypes
 import os
-from pathlib import Path
 from app.models.pipeline import Block
 
 router = APIRouter()
 
 # Configure output directory (where your CSV files are saved)
-OUTPUT_DIR = "/app/outputs"
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/app/outputs")
 
 @router.get("/pipeline/{pipeline_run_id}/files")
 async def get_pipeline_files(pipeline_run_id: int, db: Session = Depends(get_db)):
@@ -34,13 +34,15 @@ async def get_pipeline_files(pipeline_run_id: int, db: Session = Depends(get_db)
                 result = block_run.output_data["result"]
                 if "file_info" in result:
                     file_info = result["file_info"]
-                    files.append({
-                        "block_name": block_run.block.name,
-                        "filename": file_info.get("filename"),
-                        "file_size": file_info.get("file_size"),
-                        "records_written": file_info.get("records_written"),
-                        "download_url": f"/api/v1/downloads/pipeline/{pipeline_run_id}/file/{file_info.get('filename')}"
-                    })
+                    # A parquet output is a directory: each of its part files is a download of its own
+                    for filename in file_info.get("part_files") or [file_info.get("filename")]:
+                        files.append({
+                            "block_name": block_run.block.name,
+                            "filename": filename,
+                            "file_size": file_info.get("file_size"),
+                            "records_written": file_info.get("records_written"),
+                            "download_url": f"/api/v1/downloads/pipeline/{pipeline_run_id}/file/{filename}"
+                        })
         
         return {
             "pipeline_run_id": pipeline_run_id,
@@ -49,10 +51,12 @@ async def get_pipeline_files(pipeline_run_id: int, db: Session = Depends(get_db)
             "total_files": len(files)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get pipeline files: {str(e)}")
 
-@router.get("/pipeline/{pipeline_run_id}/file/{filename}")
+@router.get("/pipeline/{pipeline_run_id}/file/{filename:path}")
 async def download_pipeline_file(pipeline_run_id: int, filename: str, db: Session = Depends(get_db)):
     """Download a specific file from a pipeline run"""
     try:
@@ -61,26 +65,34 @@ async def download_pipeline_file(pipeline_run_id: int, filename: str, db: Sessio
         if not pipeline_run:
             raise HTTPException(status_code=404, detail="Pipeline run not found")
         
-        # Check if file exists in output directory
-        file_path = os.path.join(OUTPUT_DIR, filename)
-        print(f"Download File path: {file_path}")
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        # Security check: ensure file is within output directory
-        real_path = os.path.realpath(file_path)
+        # Security check before touching the filesystem: the resolved path must stay inside the output directory
         output_dir = os.path.realpath(OUTPUT_DIR)
-        if not real_path.startswith(output_dir):
+        real_path = os.path.realpath(os.path.join(output_dir, filename))
+        print(f"Download File path: {real_path}")
+        if os.path.commonpath([real_path, output_dir]) != output_dir:
             raise HTTPException(status_code=403, detail="Access denied")
         
+        # Parquet outputs are directories; their part files are downloaded one by one
+        if not os.path.isfile(real_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        
         # Return file as download
         return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='text/csv',
-            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            path=real_path,
+            filename=os.path.basename(filename),
+            media_type=_media_type(filename),
+            headers={'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"'}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error downloading file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+
+def _media_type(filename: str) -> str:
+    """Content type of an output file; compressed files (.csv.gz, .csv.zst) are served as opaque bytes"""
+    media_type, encoding = mimetypes.guess_type(filename)
+    if encoding or not media_type:
+        return 'application/octet-stream'
+    return media_type
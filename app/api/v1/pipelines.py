@@ -1,54 +1,66 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from app.api.deps import get_db
-from app.models.pipeline import Pipeline, PipelineRun
-from app.schemas.pipeline import PipelineCreate, PipelineRunCreate
+from app.models.pipeline import Pipeline, PipelineRun, BlockRun, BlockRunShard, BlockStatus
+from app.schemas.pipeline import PipelineCreate, PipelineRunCreate, PipelineBatchExecute
+from app.services.csv_upload import UploadRejected, save_csv_upload
 from app.services.orchestrator import Orchestrator
-from typing import List
+from workers.constants import BACKEND_NAMES, ROUTING_PRIORITY_NAMES
+from workers.metering import USAGE_FIELDS
+from typing import List, Optional
 import os
-import shutil
+import uuid
 
 router = APIRouter()
+# Started and stopped with the application (see app.main startup/shutdown), not on import
 orchestrator = Orchestrator()
 
+UPLOAD_DIR = "/app/uploads"
+
 @router.post("/upload-csv")
 async def upload_csv_and_create_pipeline(
     file: UploadFile = File(...),
+    streaming: bool = False,
+    backend: Optional[str] = None,
+    priority: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Upload CSV file and create a sample pipeline based on it"""
+    """Upload CSV file and create a sample pipeline based on it (streaming=true pipelines blocks by micro-batch,
+    backend picks the classification blocks' inference backend, e.g. "local" for offline runs, and priority routes
+    their model: "urgent" to the fastest, "bulk" to the cheapest)"""
+    if backend is not None and backend not in BACKEND_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown inference backend: {backend}")
+    if priority is not None and priority not in ROUTING_PRIORITY_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {priority}")
+    # Validate file type
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Only CSV files are allowed")
+    try:
+        # Stream the body to disk without blocking the event loop; hash, row count and columns come with it
+        upload = await save_csv_upload(file, UPLOAD_DIR)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
     try:
-        # Validate file type
-        if not file.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail="Only CSV files are allowed")
-        
-        # Create uploads directory if it doesn't exist
-        upload_dir = "/app/uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Save the uploaded file
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Create pipeline based on the uploaded CSV
-        pipeline_id = orchestrator.create_pipeline_from_csv(db, file_path, file.filename)
+        pipeline_id = orchestrator.create_pipeline_from_csv(db, upload["file_path"], file.filename, streaming, backend, priority)
         
         return {
             "message": "CSV uploaded and pipeline created successfully",
             "pipeline_id": pipeline_id,
-            "file_path": file_path,
-            "filename": file.filename
+            "filename": file.filename,
+            **upload,
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/pipelines")
-def create_pipeline(pipeline: PipelineCreate, db: Session = Depends(get_db)):
-    """Create a new pipeline"""
+def create_pipeline(pipeline: PipelineCreate, streaming: bool = False, db: Session = Depends(get_db)):
+    """Create a new pipeline (streaming=true pipelines its blocks by micro-batch)"""
     print("Creating sample pipeline")
-    created_pipeline = orchestrator.create_sample_pipeline(db)
+    created_pipeline = orchestrator.create_sample_pipeline(db, streaming)
     return created_pipeline
 
 @router.get("/pipelines")
@@ -74,6 +86,99 @@ def execute_pipeline(pipeline_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/pipelines/batch-execute")
+def execute_pipelines_batch(batch: PipelineBatchExecute, db: Session = Depends(get_db)):
+    """Execute many pipelines (or one new pipeline per uploaded CSV) under a single batch id"""
+    if batch.file_paths:
+        upload_dir = os.path.realpath(UPLOAD_DIR)
+        for file_path in batch.file_paths:
+            real_path = os.path.realpath(file_path)
+            if not real_path.startswith(upload_dir + os.sep) or not os.path.isfile(real_path):
+                raise HTTPException(status_code=400, detail=f"Not an uploaded file: {file_path}")
+    
+    try:
+        pipeline_ids = batch.pipeline_ids or orchestrator.create_pipelines_from_csv_files(db, batch.file_paths, batch.streaming, batch.backend, batch.priority)
+        batch_id = uuid.uuid4().hex
+        pipeline_runs = orchestrator.execute_pipelines_batch(db, pipeline_ids, batch_id)
+        
+        return {
+            "message": "Batch execution started",
+            "batch_id": batch_id,
+            "pipeline_run_ids": [pipeline_run.id for pipeline_run in pipeline_runs],
+            "pipeline_ids": pipeline_ids,
+            "total_runs": len(pipeline_runs)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/pipelines/batches/{batch_id}")
+def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """Get run status counts for a batch"""
+    counts = db.query(PipelineRun.status, func.count(PipelineRun.id)).filter(
+        PipelineRun.batch_id == batch_id
+    ).group_by(PipelineRun.status).all()
+    if not counts:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    status_counts = {status.value: count for status, count in counts}
+    return {
+        "batch_id": batch_id,
+        "total_runs": sum(status_counts.values()),
+        "status_counts": status_counts
+    }
+
+@router.get("/pipelines/block-runs/{block_run_id}/shards")
+def get_block_run_shards(block_run_id: int, db: Session = Depends(get_db)):
+    """Get shard progress for a data-parallel block run"""
+    block_run = db.query(BlockRun).filter(BlockRun.id == block_run_id).first()
+    if not block_run:
+        raise HTTPException(status_code=404, detail="Block run not found")
+    
+    shards = db.query(BlockRunShard).filter(
+        BlockRunShard.block_run_id == block_run_id
+    ).order_by(BlockRunShard.shard_index).all()
+    return {
+        "block_run_id": block_run_id,
+        "status": block_run.status.value,
+        "shards_total": block_run.shards_total or 0,
+        "shards_completed": sum(1 for shard in shards if shard.status == BlockStatus.COMPLETED),
+        "shards": [
+            {
+                "shard_index": shard.shard_index,
+                "start_row": shard.start_row,
+                "end_row": shard.end_row,
+                "status": shard.status.value,
+                "error_message": shard.error_message,
+            }
+            for shard in shards
+        ]
+    }
+
+@router.get("/pipelines/runs/{pipeline_run_id}/usage")
+def get_pipeline_run_usage(pipeline_run_id: int, db: Session = Depends(get_db)):
+    """Get a pipeline run's LLM usage ledger: run totals and each block run's share"""
+    pipeline_run = db.query(PipelineRun).filter(PipelineRun.id == pipeline_run_id).first()
+    if not pipeline_run:
+        raise HTTPException(status_code=404, detail="Pipeline run not found")
+    
+    block_runs = db.query(BlockRun).filter(BlockRun.pipeline_run_id == pipeline_run_id).order_by(BlockRun.id).all()
+    return {
+        "pipeline_run_id": pipeline_run_id,
+        "status": pipeline_run.status.value,
+        "totals": {field: getattr(pipeline_run, field) or 0 for field in USAGE_FIELDS},
+        "block_runs": [
+            {
+                "block_run_id": block_run.id,
+                "block_id": block_run.block_id,
+                "status": block_run.status.value,
+                **{field: getattr(block_run, field) for field in USAGE_FIELDS},
+            }
+            for block_run in block_runs
+        ]
+    }
+
 @router.get("/pipelines/{pipeline_id}/runs")
 def get_pipeline_runs(pipeline_id: int, db: Session = Depends(get_db)):
     """Get all runs for a pipeline"""
@@ -17,16 +17,24 @@ class KafkaClient:
             )
         return self.producer
     
-    def publish_event(self, topic: str, event_data: Dict[str, Any], key: str = None):
-        """Publish event to Kafka topic"""
+    def publish_event(self, topic: str, event_data: Dict[str, Any], key: str = None, flush: bool = True):
+        """Publish event to Kafka topic (pass flush=False to batch several sends before one flush())"""
         try:
             producer = self.get_producer()
             producer.send(topic, key=key, value=event_data)
-            producer.flush()
+            if flush:
+                producer.flush()
             # print(f"📡 [KAFKA] Published event to topic '{topic}'")
         except Exception as e:
             print(f"❌ Error publishing to Kafka: {e}")
 
+    def flush(self):
+        """Flush events sent with flush=False"""
+        try:
+            self.get_producer().flush()
+        except Exception as e:
+            print(f"❌ Error flushing Kafka producer: {e}")
+
     def get_consumer(self):
         """Get Kafka consumer for reading events"""
         if not hasattr(self, 'consumer') or not self.consumer:
@@ -2,13 +2,13 @@ import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import api_router
+from app.api.v1 import pipelines
 from app.core import settings
 from app.core.kafka_client import KafkaClient
 import json
 import asyncio
 import threading
 from typing import List
-from contextlib import asynccontextmanager
 import time
 from datetime import datetime
 
@@ -277,19 +277,22 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 # Remove the async Kafka consumer function since we're using threads now
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
+# (startup/shutdown handlers: the pinned FastAPI 0.61 ignores a lifespan= argument)
+async def startup():
     print("Starting up FastAPI application...")
     # No need to start Kafka consumer here - it starts when first WebSocket connects
-    yield
-    # Shutdown
+    # The orchestrator joins the instance ring and consumes completion streams only while the app is serving
+    pipelines.orchestrator.start()
+
+async def shutdown():
     print("Shutting down FastAPI application...")
     manager._stop_kafka_consumer()
+    pipelines.orchestrator.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    lifespan=lifespan
+    on_startup=[startup],
+    on_shutdown=[shutdown]
 )
 
 # Add CORS middleware for frontend
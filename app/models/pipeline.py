@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, JSON, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.base_class import Base
@@ -22,6 +22,10 @@ class BlockStatus(str, enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class EdgeMode(str, enum.Enum):
+    BATCH = "batch"    # downstream starts after the upstream block completes
+    STREAM = "stream"  # downstream starts with the upstream and consumes its micro-batches
+
 class Pipeline(Base):
     __tablename__ = "pipelines"
     
@@ -35,6 +39,9 @@ class Pipeline(Base):
 
 class Block(Base):
     __tablename__ = "blocks"
+    __table_args__ = (
+        Index("ix_blocks_pipeline_id_order", "pipeline_id", "order"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     pipeline_id = Column(Integer, ForeignKey("pipelines.id"))
@@ -50,24 +57,41 @@ class BlockDependency(Base):
     __tablename__ = "block_dependencies"
     
     id = Column(Integer, primary_key=True, index=True)
-    block_id = Column(Integer, ForeignKey("blocks.id"))
+    block_id = Column(Integer, ForeignKey("blocks.id"), index=True)
     depends_on_id = Column(Integer, ForeignKey("blocks.id"))
+    mode = Column(Enum(EdgeMode), default=EdgeMode.BATCH)
 
 class PipelineRun(Base):
     __tablename__ = "pipeline_runs"
     
     id = Column(Integer, primary_key=True, index=True)
-    pipeline_id = Column(Integer, ForeignKey("pipelines.id"))
+    pipeline_id = Column(Integer, ForeignKey("pipelines.id"), index=True)
     status = Column(Enum(PipelineStatus), default=PipelineStatus.QUEUED)
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Blocks still to complete; the run is done when this reaches zero
+    remaining_blocks = Column(Integer)
+    # Runs launched together through the batch execute endpoint share this id
+    batch_id = Column(String, index=True)
+    # LLM usage ledger (see workers.metering.USAGE_FIELDS), summed over the run's block runs
+    llm_calls = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    llm_seconds = Column(Float)
+    llm_retries = Column(Integer)
+    cache_hits = Column(Integer)
+    cost_usd = Column(Float)
     
     pipeline = relationship("Pipeline", back_populates="runs")
     block_runs = relationship("BlockRun", back_populates="pipeline_run")
 
 class BlockRun(Base):
     __tablename__ = "block_runs"
+    __table_args__ = (
+        Index("uq_block_runs_pipeline_run_id_block_id", "pipeline_run_id", "block_id", unique=True),
+        Index("ix_block_runs_pipeline_run_id_status", "pipeline_run_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     pipeline_run_id = Column(Integer, ForeignKey("pipeline_runs.id"))
@@ -78,9 +102,43 @@ class BlockRun(Base):
     input_data = Column(JSON)
     output_data = Column(JSON)
     error_message = Column(Text)
+    # Upstream blocks still to complete; the block is dispatched when this reaches zero
+    remaining_dependencies = Column(Integer)
+    # Data-parallel blocks run as shards; the merge job is enqueued when shards_remaining reaches zero (then -1)
+    shards_total = Column(Integer)
+    shards_remaining = Column(Integer)
+    # LLM usage ledger (see workers.metering.USAGE_FIELDS), NULL for blocks that make no LLM calls
+    llm_calls = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    llm_seconds = Column(Float)
+    llm_retries = Column(Integer)
+    cache_hits = Column(Integer)
+    cost_usd = Column(Float)
     
     pipeline_run = relationship("PipelineRun", back_populates="block_runs")
     block = relationship("Block")
+    shards = relationship("BlockRunShard", back_populates="block_run", order_by="BlockRunShard.shard_index")
+
+class BlockRunShard(Base):
+    __tablename__ = "block_run_shards"
+    __table_args__ = (
+        Index("uq_block_run_shards_block_run_id_shard_index", "block_run_id", "shard_index", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    block_run_id = Column(Integer, ForeignKey("block_runs.id"))
+    shard_index = Column(Integer)
+    # Half-open range [start_row, end_row) of the block's input rows
+    start_row = Column(Integer)
+    end_row = Column(Integer)
+    status = Column(Enum(BlockStatus), default=BlockStatus.PENDING)
+    started_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    output_data = Column(JSON)
+    error_message = Column(Text)
+    
+    block_run = relationship("BlockRun", back_populates="shards")
 
 class Artifact(Base):
     __tablename__ = "artifacts"
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator, validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from workers.constants import BACKEND_NAMES, ROUTING_PRIORITY_NAMES
 
 class PipelineCreate(BaseModel):
     pass
@@ -24,4 +25,33 @@ class PipelineRun(PipelineRunCreate):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PipelineBatchExecute(BaseModel):
+    """Either existing pipeline ids or uploaded CSV paths (one new pipeline per file)"""
+    pipeline_ids: Optional[List[int]] = None
+    file_paths: Optional[List[str]] = None
+    # New CSV pipelines use streaming edges between their blocks
+    streaming: bool = False
+    # Inference backend of new CSV pipelines' classification blocks (default INFERENCE_BACKEND)
+    backend: Optional[str] = None
+    # Model routing priority of their classification blocks ("urgent", "normal" or "bulk")
+    priority: Optional[str] = None
+
+    @validator("backend")
+    def check_backend(cls, value):
+        if value is not None and value not in BACKEND_NAMES:
+            raise ValueError(f"Unknown inference backend: {value} (available: {', '.join(BACKEND_NAMES)})")
+        return value
+
+    @validator("priority")
+    def check_priority(cls, value):
+        if value is not None and value not in ROUTING_PRIORITY_NAMES:
+            raise ValueError(f"Unknown priority: {value} (available: {', '.join(ROUTING_PRIORITY_NAMES)})")
+        return value
+
+    @root_validator
+    def check_exactly_one_source(cls, values):
+        if bool(values.get("pipeline_ids")) == bool(values.get("file_paths")):
+            raise ValueError("Provide either pipeline_ids or file_paths")
+        return values
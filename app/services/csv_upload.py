@@ -0,0 +1,93 @@
+from typing import Any, Dict
+import csv
+import hashlib
+import io
+import os
+import tempfile
+
+import aiofiles
+import aiofiles.os
+import numpy as np
+
+from workers.csv_index import RowIndexBuilder, save_row_index
+
+# Bytes read from the request body per await; bounds the upload's memory use
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+# Uploads larger than this are rejected while streaming (nothing is kept)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# The header line must end within this many bytes
+UPLOAD_MAX_HEADER_BYTES = int(os.getenv("UPLOAD_MAX_HEADER_BYTES", 64 * 1024))
+
+
+class UploadRejected(ValueError):
+    """The upload is not an acceptable CSV; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def save_csv_upload(upload, directory: str) -> Dict[str, Any]:
+    """Stream an UploadFile to directory/<filename> chunk by chunk without blocking the event loop.
+
+    While streaming, the body is hashed (SHA-256), its rows are counted and
+    its row-offset index is built, and the header is sniffed for the columns,
+    so callers get {file_path, sha256, size_bytes, row_count, columns} without
+    parsing the file again. The file only appears at its path once it is
+    complete and valid.
+    """
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, os.path.basename(upload.filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".tmp")
+    os.close(fd)
+
+    digest = hashlib.sha256()
+    builder = RowIndexBuilder()
+    header = b""
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if builder.size + len(chunk) > UPLOAD_MAX_BYTES:
+                    raise UploadRejected(f"Upload exceeds {UPLOAD_MAX_BYTES} bytes", status_code=413)
+                if builder.header_end is None:
+                    header += chunk[:UPLOAD_MAX_HEADER_BYTES + 1 - len(header)]
+                digest.update(chunk)
+                builder.feed(np.frombuffer(chunk, dtype=np.uint8))
+                if (builder.header_end if builder.header_end is not None else builder.size) > UPLOAD_MAX_HEADER_BYTES:
+                    raise UploadRejected(f"CSV header line exceeds {UPLOAD_MAX_HEADER_BYTES} bytes")
+                await out.write(chunk)
+
+        columns = _sniff_columns(header[:builder.header_end] if builder.header_end is not None else header)
+        await aiofiles.os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+
+    # The CSV reader block finds this index next to the file instead of scanning it again
+    index = builder.index(file_path)
+    save_row_index(file_path, index)
+    return {
+        "file_path": file_path,
+        "sha256": digest.hexdigest(),
+        "size_bytes": builder.size,
+        "row_count": index["row_count"],
+        "columns": columns,
+    }
+
+
+def _sniff_columns(header: bytes) -> list:
+    """Column names of the header line"""
+    try:
+        line = header.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise UploadRejected("CSV header is not valid UTF-8")
+    columns = next(csv.reader(io.StringIO(line)), [])
+    if not any(column.strip() for column in columns):
+        raise UploadRejected("CSV file has no header row")
+    if len(set(columns)) != len(columns):
+        raise UploadRejected("CSV header has duplicate column names")
+    return columns
@@ -0,0 +1,318 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, sessionmaker
+from app.models.pipeline import Block, BlockDependency, BlockRun, PipelineRun, EdgeMode
+import json
+import os
+import threading
+
+# Redis keys and TTLs for the shared plan cache
+PLAN_KEY = "dag_plan:{pipeline_id}"
+PLAN_VERSION_KEY = "dag_plan_version:{pipeline_id}"
+RUN_MAP_KEY = "dag_run_map:{pipeline_run_id}"
+PLAN_CACHE_TTL = int(os.getenv("DAG_PLAN_CACHE_TTL", 86400))
+RUN_MAP_CACHE_TTL = int(os.getenv("DAG_RUN_MAP_CACHE_TTL", 86400))
+RUN_MAP_CACHE_SIZE = int(os.getenv("DAG_RUN_MAP_CACHE_SIZE", 4096))
+
+# Block attributes that change the shape of the plan (config changes do not)
+STRUCTURAL_BLOCK_ATTRS = ("pipeline_id", "order")
+
+
+class DagPlan:
+    """Compiled execution plan for a pipeline: adjacency lists, reverse edges and topological levels"""
+
+    def __init__(self, pipeline_id: int, block_order: List[int], dependencies: Dict[int, List[int]], version: int = 0,
+                 stream_edges: Iterable[Tuple[int, int]] = ()):
+        self.pipeline_id = pipeline_id
+        self.version = version
+        self.block_order = list(block_order)
+        self.dependencies = {block_id: list(dependencies.get(block_id, [])) for block_id in self.block_order}
+        # (block_id, depends_on_id) edges in streaming mode; every other edge is a batch edge
+        self.stream_edges: Set[Tuple[int, int]] = {tuple(edge) for edge in stream_edges}
+        self.stream_upstream: Dict[int, int] = {}
+        for block_id, depends_on_id in sorted(self.stream_edges):
+            if block_id in self.stream_upstream:
+                raise ValueError(f"Block {block_id} has more than one streaming input")
+            self.stream_upstream[block_id] = depends_on_id
+
+        # Reverse edges: block_id -> blocks that depend on it
+        self.successors: Dict[int, List[int]] = {block_id: [] for block_id in self.block_order}
+        for block_id in self.block_order:
+            for dep_id in self.dependencies[block_id]:
+                if dep_id in self.successors:
+                    self.successors[dep_id].append(block_id)
+
+        self.levels = self._compute_levels()
+        self.roots = list(self.levels[0]) if self.levels else []
+
+    def _compute_levels(self) -> List[List[int]]:
+        """Group blocks into topological levels (Kahn's algorithm), keeping block order within a level"""
+        indegree = {block_id: len(self.dependencies[block_id]) for block_id in self.block_order}
+        current = [block_id for block_id in self.block_order if indegree[block_id] == 0]
+        position = {block_id: index for index, block_id in enumerate(self.block_order)}
+        levels = []
+        visited = 0
+
+        while current:
+            levels.append(current)
+            visited += len(current)
+            following = []
+            for block_id in current:
+                for succ_id in self.successors[block_id]:
+                    indegree[succ_id] -= 1
+                    if indegree[succ_id] == 0:
+                        following.append(succ_id)
+            current = sorted(following, key=position.get)
+
+        if visited != len(self.block_order):
+            raise ValueError(f"Pipeline {self.pipeline_id} has a dependency cycle")
+        return levels
+
+    def indegree(self, block_id: int) -> int:
+        return len(self.dependencies.get(block_id, []))
+
+    def is_stream_edge(self, block_id: int, depends_on_id: int) -> bool:
+        return (block_id, depends_on_id) in self.stream_edges
+
+    def successors_by_mode(self, block_id: int, stream: bool) -> List[int]:
+        """Successors released when block_id starts (stream edges) or completes (batch edges)"""
+        return [
+            succ_id for succ_id in self.successors.get(block_id, [])
+            if self.is_stream_edge(succ_id, block_id) == stream
+        ]
+
+    def siblings(self, block_id: int) -> List[int]:
+        """Other blocks fed by exactly the same (non-empty) set of batch inputs, in block order"""
+        inputs = set(self.dependencies.get(block_id, []))
+        if not inputs or block_id in self.stream_upstream:
+            return []
+        return [
+            other_id for other_id in self.block_order
+            if other_id != block_id and other_id not in self.stream_upstream and set(self.dependencies[other_id]) == inputs
+        ]
+
+    @classmethod
+    def compile(cls, db: Session, pipeline_id: int, version: int = 0) -> "DagPlan":
+        """Build a plan with two queries: the pipeline's blocks and all of their dependencies"""
+        block_order = [
+            row.id for row in db.query(Block.id).filter(Block.pipeline_id == pipeline_id).order_by(Block.order, Block.id)
+        ]
+        dependencies: Dict[int, List[int]] = {}
+        stream_edges = []
+        rows = db.query(BlockDependency.block_id, BlockDependency.depends_on_id, BlockDependency.mode).join(
+            Block, Block.id == BlockDependency.block_id
+        ).filter(Block.pipeline_id == pipeline_id).all()
+        for block_id, depends_on_id, mode in rows:
+            dependencies.setdefault(block_id, []).append(depends_on_id)
+            if mode == EdgeMode.STREAM:
+                stream_edges.append((block_id, depends_on_id))
+        return cls(pipeline_id, block_order, dependencies, version, stream_edges)
+
+    def to_dict(self) -> Dict:
+        return {
+            "pipeline_id": self.pipeline_id,
+            "version": self.version,
+            "block_order": self.block_order,
+            "dependencies": {str(k): v for k, v in self.dependencies.items()},
+            "stream_edges": sorted(self.stream_edges),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DagPlan":
+        dependencies = {int(k): v for k, v in data.get("dependencies", {}).items()}
+        return cls(
+            data["pipeline_id"], data["block_order"], dependencies, data.get("version", 0), data.get("stream_edges", [])
+        )
+
+
+class RunMap:
+    """Mapping of block_id -> block_run_id for a single pipeline run"""
+
+    def __init__(self, pipeline_run_id: int, pipeline_id: int, block_runs: Dict[int, int]):
+        self.pipeline_run_id = pipeline_run_id
+        self.pipeline_id = pipeline_id
+        self.block_runs = dict(block_runs)
+
+    def to_dict(self) -> Dict:
+        return {
+            "pipeline_run_id": self.pipeline_run_id,
+            "pipeline_id": self.pipeline_id,
+            "block_runs": {str(k): v for k, v in self.block_runs.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RunMap":
+        block_runs = {int(k): v for k, v in data.get("block_runs", {}).items()}
+        return cls(data["pipeline_run_id"], data["pipeline_id"], block_runs)
+
+
+class DagPlanCache:
+    """Two-tier (in-process + Redis) cache of compiled plans and run maps.
+
+    Plans are versioned by a Redis counter that is bumped whenever a pipeline's
+    blocks or dependencies change, so every process drops its stale copy.
+    """
+
+    def __init__(self, redis_conn, session_factory: Optional[sessionmaker] = None):
+        self.redis_conn = redis_conn
+        self._plans: Dict[int, DagPlan] = {}
+        self._run_maps: "OrderedDict[int, RunMap]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Structural edits committed through this session factory invalidate plans; close() stops listening
+        self._session_factory = session_factory
+        if session_factory is not None:
+            for name, listener in self._session_listeners():
+                event.listen(session_factory, name, listener)
+
+    def close(self):
+        """Remove the session listeners registered by this cache"""
+        if self._session_factory is None:
+            return
+        for name, listener in self._session_listeners():
+            if event.contains(self._session_factory, name, listener):
+                event.remove(self._session_factory, name, listener)
+        self._session_factory = None
+
+    def _session_listeners(self) -> List[Tuple[str, object]]:
+        return [
+            ("after_flush", self._collect_structural_changes),
+            ("after_commit", self._apply_pending_invalidations),
+            ("after_rollback", self._discard_pending_invalidations),
+        ]
+
+    def get_plan(self, db: Session, pipeline_id: int) -> DagPlan:
+        """Return the current plan, compiling and publishing it on a cache miss"""
+        version, cached_raw = self._redis_get_many(
+            PLAN_VERSION_KEY.format(pipeline_id=pipeline_id),
+            PLAN_KEY.format(pipeline_id=pipeline_id)
+        )
+        version = int(version) if version else 0
+
+        with self._lock:
+            plan = self._plans.get(pipeline_id)
+        if plan and plan.version == version:
+            return plan
+
+        plan = None
+        if cached_raw:
+            try:
+                cached = DagPlan.from_dict(json.loads(cached_raw))
+                if cached.version == version:
+                    plan = cached
+            except (ValueError, KeyError) as e:
+                print(f"⚠️  Ignoring unreadable cached plan for pipeline {pipeline_id}: {e}")
+
+        if plan is None:
+            plan = DagPlan.compile(db, pipeline_id, version)
+            self._redis_set(PLAN_KEY.format(pipeline_id=pipeline_id), json.dumps(plan.to_dict()), PLAN_CACHE_TTL)
+            print(f"🧭 Compiled DAG plan for pipeline {pipeline_id} (v{version}, {len(plan.block_order)} blocks, {len(plan.levels)} levels)")
+
+        with self._lock:
+            self._plans[pipeline_id] = plan
+        return plan
+
+    def invalidate(self, pipeline_id: int):
+        """Drop the plan for a pipeline in this process and, via the version counter, in every other one"""
+        with self._lock:
+            self._plans.pop(pipeline_id, None)
+        try:
+            pipe = self.redis_conn.pipeline()
+            pipe.incr(PLAN_VERSION_KEY.format(pipeline_id=pipeline_id))
+            pipe.delete(PLAN_KEY.format(pipeline_id=pipeline_id))
+            pipe.execute()
+        except Exception as e:
+            print(f"Error invalidating DAG plan in Redis: {e}")
+
+    def store_run_map(self, run_map: RunMap):
+        self._remember_run_map(run_map)
+        self._redis_set(
+            RUN_MAP_KEY.format(pipeline_run_id=run_map.pipeline_run_id),
+            json.dumps(run_map.to_dict()),
+            RUN_MAP_CACHE_TTL
+        )
+
+    def get_run_map(self, db: Session, pipeline_run_id: int) -> Optional[RunMap]:
+        """Return the block_id -> block_run_id map for a run (block runs never change once created)"""
+        with self._lock:
+            run_map = self._run_maps.get(pipeline_run_id)
+            if run_map:
+                self._run_maps.move_to_end(pipeline_run_id)
+                return run_map
+
+        cached_raw, = self._redis_get_many(RUN_MAP_KEY.format(pipeline_run_id=pipeline_run_id))
+        if cached_raw:
+            try:
+                run_map = RunMap.from_dict(json.loads(cached_raw))
+                self._remember_run_map(run_map)
+                return run_map
+            except (ValueError, KeyError) as e:
+                print(f"⚠️  Ignoring unreadable cached run map for run {pipeline_run_id}: {e}")
+
+        pipeline_id = db.query(PipelineRun.pipeline_id).filter(PipelineRun.id == pipeline_run_id).scalar()
+        if pipeline_id is None:
+            return None
+        rows = db.query(BlockRun.block_id, BlockRun.id).filter(BlockRun.pipeline_run_id == pipeline_run_id).all()
+        run_map = RunMap(pipeline_run_id, pipeline_id, {block_id: block_run_id for block_id, block_run_id in rows})
+        self.store_run_map(run_map)
+        return run_map
+
+    def _remember_run_map(self, run_map: RunMap):
+        with self._lock:
+            self._run_maps[run_map.pipeline_run_id] = run_map
+            self._run_maps.move_to_end(run_map.pipeline_run_id)
+            while len(self._run_maps) > RUN_MAP_CACHE_SIZE:
+                self._run_maps.popitem(last=False)
+
+    def _redis_get_many(self, *keys) -> List[Optional[bytes]]:
+        try:
+            return self.redis_conn.mget(keys)
+        except Exception as e:
+            print(f"Error reading DAG plan cache from Redis: {e}")
+            return [None] * len(keys)
+
+    def _redis_set(self, key: str, value: str, ttl: int):
+        try:
+            self.redis_conn.setex(key, ttl, value)
+        except Exception as e:
+            print(f"Error writing DAG plan cache to Redis: {e}")
+
+    # Session hooks: collect pipelines whose structure changed, invalidate after commit
+
+    def _collect_structural_changes(self, session: Session, flush_context):
+        changed: Set[int] = session.info.setdefault("dag_plan_invalidations", set())
+        dependency_block_ids = set()
+
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, Block) and obj.pipeline_id is not None:
+                changed.add(obj.pipeline_id)
+            elif isinstance(obj, BlockDependency) and obj.block_id is not None:
+                dependency_block_ids.add(obj.block_id)
+
+        for obj in session.dirty:
+            if isinstance(obj, Block):
+                for attr in STRUCTURAL_BLOCK_ATTRS:
+                    history = inspect(obj).attrs[attr].history
+                    if history.has_changes():
+                        changed.update(value for value in history.sum() if value is not None)
+            elif isinstance(obj, BlockDependency):
+                # Any edit (endpoints or mode) changes the plan of the dependency's old and new pipeline
+                dependency_block_ids.update(
+                    value for value in [obj.block_id, *inspect(obj).attrs.block_id.history.sum()] if value is not None
+                )
+
+        if dependency_block_ids:
+            with session.no_autoflush:
+                rows = session.execute(
+                    select(Block.pipeline_id).where(Block.id.in_(dependency_block_ids))
+                ).all()
+            changed.update(row.pipeline_id for row in rows if row.pipeline_id is not None)
+
+    def _apply_pending_invalidations(self, session: Session):
+        changed = session.info.pop("dag_plan_invalidations", None)
+        for pipeline_id in changed or ():
+            self.invalidate(pipeline_id)
+
+    def _discard_pending_invalidations(self, session: Session):
+        session.info.pop("dag_plan_invalidations", None)
@@ -1,187 +1,271 @@
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
-from app.models.pipeline import Pipeline, PipelineRun, Block, BlockRun, BlockStatus, PipelineStatus, BlockDependency
+from typing import List, Dict, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, sessionmaker
+from app.models.pipeline import Pipeline, PipelineRun, Block, BlockRun, BlockStatus, PipelineStatus, BlockDependency, Artifact, BlockRunShard
 from app.core.kafka_client import KafkaClient
+from app.database.session import SessionLocal
 from datetime import datetime
 import json
+import math
 import os
+import atexit
+import socket
 import threading
 import time
-from rq import Queue
+import uuid
+from collections import Counter, defaultdict
+from rq import Queue, Retry
 from redis import Redis
-from workers.universal_worker import process_task
-import pandas as pd
-from app.models.pipeline import BlockType
+from redis.exceptions import ResponseError
+from workers.universal_worker import (
+    process_task,
+    process_shard,
+    process_fused,
+    merge_shards,
+    COMPLETION_STREAM,
+    COMPLETION_PARTITIONS,
+    completion_stream_for_partition,
+    SHARD_RATE_KEY,
+)
+from workers.edge_stream import edge_stream_key
+from workers.constants import INFERENCE_BACKEND
+from workers.llm_client import LLM_MODEL
+from workers.metering import USAGE_FIELDS
+from app.models.pipeline import BlockType, EdgeMode
+from app.services.dag_plan import DagPlan, DagPlanCache, RunMap
+from app.services.partitioning import HashRing, InstanceRegistry, HEARTBEAT_INTERVAL
+
+# Consumer group settings for the block completion stream
+COMPLETION_GROUP = os.getenv("COMPLETION_GROUP", "orchestrator")
+COMPLETION_BATCH_SIZE = int(os.getenv("COMPLETION_BATCH_SIZE", 100))
+COMPLETION_BLOCK_MS = int(os.getenv("COMPLETION_BLOCK_MS", 5000))
+COMPLETION_RECLAIM_IDLE_MS = int(os.getenv("COMPLETION_RECLAIM_IDLE_MS", 60000))
+COMPLETION_RECLAIM_INTERVAL = float(os.getenv("COMPLETION_RECLAIM_INTERVAL", 30))
+COMPLETION_MAX_DELIVERIES = int(os.getenv("COMPLETION_MAX_DELIVERIES", 5))
+# Jobs fail (and are retried) only when their completion event cannot be published
+TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", 3))
+
+# Data-parallel execution: these blocks are split into row-range shards run as separate jobs
+SHARDABLE_BLOCK_TYPES = [BlockType.SENTIMENT_ANALYSIS, BlockType.TOXICITY_DETECTION]
+SHARD_MIN_ROWS = int(os.getenv("SHARD_MIN_ROWS", 200))
+SHARD_TARGET_ROWS = int(os.getenv("SHARD_TARGET_ROWS", 500))
+SHARD_TARGET_SECONDS = float(os.getenv("SHARD_TARGET_SECONDS", 60))
+SHARD_MAX_SHARDS = int(os.getenv("SHARD_MAX_SHARDS", 32))
+# shards_remaining of a block run whose merge job has been enqueued (claimed from 0, like PENDING -> RUNNING)
+MERGE_QUEUED = -1
+
+# Operator fusion: sibling LLM blocks over the same inputs and model share one job that asks for every label per text
+FUSABLE_BLOCK_TYPES = [BlockType.SENTIMENT_ANALYSIS, BlockType.TOXICITY_DETECTION]
+BLOCK_FUSION = os.getenv("BLOCK_FUSION", "true").lower() == "true"
 
 class Orchestrator:
-    def __init__(self):
+    def __init__(self, redis_conn: Redis = None, session_factory: sessionmaker = SessionLocal):
         # Redis connection for RQ
-        self.redis_conn = Redis(
+        self.redis_conn = redis_conn or Redis(
             host=os.getenv('REDIS_HOST', 'localhost'),
             port=int(os.getenv('REDIS_PORT', 6379))
         )
+        # Sessions for the completion consumer thread
+        self.session_factory = session_factory
         
         # Single RQ queue for all tasks
         self.task_queue = Queue('pipeline_tasks', connection=self.redis_conn)
         
         self.kafka_client = KafkaClient()
         
-        # Start Redis Pub/Sub consumer for block completion events
+        # Compiled DAG plans, cached in-process and in Redis
+        self.plan_cache = DagPlanCache(self.redis_conn, session_factory)
+        
+        # Identity of this orchestrator instance among all API processes/replicas
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.registry = InstanceRegistry(self.redis_conn, self.instance_id)
+        self.owned_partitions: List[int] = []
+        self._ready_streams = set()
+        self._reclaim_due = True
+        self._stop_event = threading.Event()
+        self._started = False
+    
+    def start(self):
+        """Join the instance ring and start the heartbeat and completion-stream consumer threads"""
+        if self._started:
+            return
+        self._started = True
+        self._stop_event.clear()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
         self._start_redis_consumer()
+        atexit.register(self.stop)
+    
+    def stop(self):
+        """Leave the ring so the remaining instances take over this instance's partitions"""
+        if not self._started:
+            return
+        self._started = False
+        self._stop_event.set()
+        self.registry.deregister()
+    
+    def _heartbeat_loop(self):
+        """Keep this instance's heartbeat fresh and recompute owned partitions when membership changes"""
+        members = None
+        while not self._stop_event.is_set():
+            try:
+                live = self.registry.heartbeat()
+                if live != members:
+                    members = live
+                    self._refresh_ownership(live)
+            except Exception as e:
+                print(f"Error sending orchestrator heartbeat: {e}")
+            self._stop_event.wait(HEARTBEAT_INTERVAL)
+    
+    def _refresh_ownership(self, live: List[str]):
+        """Take the completion partitions the ring assigns to this instance among the live ones"""
+        ring = HashRing(live)
+        owned = [p for p in range(COMPLETION_PARTITIONS) if ring.owner(str(p)) == self.instance_id]
+        print(f"🔁 {len(live)} live orchestrator(s); {self.instance_id} owns partitions {owned}")
+        self.owned_partitions = owned
+        # Newly owned partitions may hold entries pending on a departed instance
+        self._reclaim_due = True
     
     def _start_redis_consumer(self):
-        """Start Redis Pub/Sub consumer to listen for block completion events"""
+        """Start the Redis Streams consumer-group reader for the partitions this instance owns"""
         def consume_block_events():
-            pubsub = self.redis_conn.pubsub()
-            pubsub.subscribe("block_completion_events")
+            print("Started Redis Streams consumer for block completion events")
+            next_reclaim = 0.0
             
-            print("Started Redis consumer for block completion and data flow events")
-            
-            for message in pubsub.listen():
-                if message['type'] == 'message':
-                    try:
-                        event_data = json.loads(message['data'])
-                        print(f"Received Redis event: {event_data.get('event_type')}")
-                        
-                        # Handle the event
-                        self._handle_redis_event(event_data)
+            while not self._stop_event.is_set():
+                try:
+                    streams = [completion_stream_for_partition(p) for p in self.owned_partitions]
+                    if not streams:
+                        self._stop_event.wait(1)
+                        continue
+                    for stream in streams:
+                        self._ensure_consumer_group(stream)
+                    
+                    # Periodically take over entries other consumers read but never acknowledged
+                    if self._reclaim_due or time.monotonic() >= next_reclaim:
+                        self._reclaim_due = False
+                        for stream in streams:
+                            self._process_completion_entries(stream, self._reclaim_pending_events(stream))
+                        next_reclaim = time.monotonic() + COMPLETION_RECLAIM_INTERVAL
+                    
+                    response = self.redis_conn.xreadgroup(
+                        COMPLETION_GROUP,
+                        self.instance_id,
+                        {stream: ">" for stream in streams},
+                        count=COMPLETION_BATCH_SIZE,
+                        block=COMPLETION_BLOCK_MS
+                    )
+                    for stream, entries in response or []:
+                        self._process_completion_entries(stream, entries)
                         
-                    except Exception as e:
-                        print(f"Error processing Redis event: {e}")
+                except Exception as e:
+                    print(f"Error consuming block completion stream: {e}")
+                    self._ready_streams.clear()
+                    time.sleep(1)
         
         # Start consumer in background thread
         thread = threading.Thread(target=consume_block_events, daemon=True)
         thread.start()
     
-    def _handle_redis_event(self, event_data: dict):
-        """Handle events from Redis Pub/Sub"""
-        event_type = event_data.get("event_type")
-        print(f"*********Redis Event type***********: {event_type}")
+    def _ensure_consumer_group(self, stream: str):
+        """Create the consumer group (and the stream) if they do not exist yet"""
+        if stream in self._ready_streams:
+            return
+        try:
+            self.redis_conn.xgroup_create(stream, COMPLETION_GROUP, id="0", mkstream=True)
+            print(f"Created consumer group '{COMPLETION_GROUP}' on '{stream}'")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._ready_streams.add(stream)
+    
+    def _reclaim_pending_events(self, stream) -> list:
+        """Claim entries idle for too long in other consumers' pending lists (e.g. a crashed API process)"""
+        _, entries, *_ = self.redis_conn.xautoclaim(
+            stream,
+            COMPLETION_GROUP,
+            self.instance_id,
+            min_idle_time=COMPLETION_RECLAIM_IDLE_MS,
+            start_id="0-0",
+            count=COMPLETION_BATCH_SIZE
+        )
+        
+        claimed = []
+        for entry_id, fields in entries:
+            pending = self.redis_conn.xpending_range(stream, COMPLETION_GROUP, entry_id, entry_id, 1)
+            if pending and pending[0]["times_delivered"] > COMPLETION_MAX_DELIVERIES:
+                # Poison event: park it in the dead-letter stream instead of retrying forever
+                print(f"❌ Dead-lettering completion event {entry_id} after {pending[0]['times_delivered']} deliveries")
+                self.redis_conn.xadd(f"{COMPLETION_STREAM}:dead", fields or {"event": "{}"})
+                self.redis_conn.xack(stream, COMPLETION_GROUP, entry_id)
+                continue
+            claimed.append((entry_id, fields))
         
-        if event_type in ["block_completed", "block_failed"]:
-            self._handle_block_completion_event(event_data)
-        # elif event_type == "data_ready":
-        #     self._handle_data_ready_event(event_data)
+        if claimed:
+            print(f"Reclaimed {len(claimed)} pending completion events from {stream}")
+        return claimed
     
-    def _handle_block_completion_event(self, event_data: dict):
-        """Handle block completion event from Redis"""
-        print(f"*********Redis Event data***********: {event_data}")
-        block_run_id = event_data.get("block_run_id")
-        success = event_data.get("success", False)
-        result_data = event_data.get("result_data", {})
+    def _process_completion_entries(self, stream, entries: list):
+        """Handle a batch of stream entries in one DB transaction and acknowledge them"""
+        if not entries:
+            return
+        
+        try:
+            self._apply_completion_entries(entries)
+            applied = entries
+        except Exception as e:
+            # One bad event must not hold back the rest: retry one at a time so only the events
+            # failing on their own stay pending (and are dead-lettered once they run out of deliveries)
+            print(f"Error applying {len(entries)} completion events from {stream}: {e}")
+            applied = []
+            if len(entries) > 1:
+                for entry in entries:
+                    try:
+                        self._apply_completion_entries([entry])
+                        applied.append(entry)
+                    except Exception as entry_error:
+                        print(f"❌ Error applying completion event {entry[0]}: {entry_error}")
+        
+        # Only acknowledge applied entries; failures stay pending and are reclaimed later
+        if applied:
+            self.redis_conn.xack(stream, COMPLETION_GROUP, *[entry_id for entry_id, _ in applied])
+    
+    def _apply_completion_entries(self, entries: list):
+        """Decode stream entries and apply their shard and block completions"""
+        completions = []
+        shard_completions = []
+        for entry_id, fields in entries:
+            try:
+                raw = fields.get(b"event", fields.get("event")) if fields else None
+                event_data = json.loads(raw) if raw else {}
+            except ValueError as e:
+                print(f"Error decoding completion event {entry_id}: {e}")
+                continue
+            if event_data.get("event_type") in ["block_completed", "block_failed"]:
+                completions.append((
+                    event_data.get("block_run_id"),
+                    event_data.get("result_data") or {},
+                    event_data.get("success", False)
+                ))
+            elif event_data.get("event_type") in ["shard_completed", "shard_failed"]:
+                shard_completions.append((
+                    event_data.get("block_run_id"),
+                    event_data.get("shard_index"),
+                    event_data.get("result_data") or {},
+                    event_data.get("success", False)
+                ))
+        print(f"Received {len(entries)} completion events ({len(completions)} block completions, {len(shard_completions)} shard completions)")
         
         # Update database and trigger next blocks
-        from app.database.session import SessionLocal
-        db = SessionLocal()
+        db = self.session_factory()
         
         try:
-            # Check if block is already completed to prevent duplicate processing
-            block_run = db.query(BlockRun).filter(BlockRun.id == block_run_id).first()
-            if block_run and block_run.status == BlockStatus.COMPLETED:
-                print(f"Block {block_run_id} already completed, skipping duplicate event")
-                return
-                
-            self.handle_block_completion(db, block_run_id, result_data, success)
+            if shard_completions:
+                self.handle_shard_completions(db, shard_completions)
+            self.handle_block_completions(db, completions)
         finally:
             db.close()
     
-    # def _handle_data_ready_event(self, event_data: dict):
-    #     print(f"*********Data ready event***********: {event_data}")
-    #     """Handle data ready event for next blocks"""
-    #     source_block_run_id = event_data.get("source_block_run_id")
-    #     data_type = event_data.get("data_type")
-    #     data = event_data.get("data", {})
-    #     target_blocks = event_data.get("target_blocks", [])
-        
-    #     print(f"Data ready: {data_type} from block {source_block_run_id} for blocks {target_blocks}")
-        
-    #     # Update configs for target blocks with the new data
-    #     from app.database.session import SessionLocal
-    #     db = SessionLocal()
-        
-    #     try:
-    #         self._update_block_configs_with_data(db, source_block_run_id, data_type, data, target_blocks)
-    #     finally:
-    #         db.close()
-    
-    def _update_block_configs_with_data(self, db: Session, source_block_run_id: int, data_type: str, data: dict, target_blocks: list):
-        """Update block configs with data from previous blocks"""
-        print(f"🔄 Updating block configs with {data_type} data from block {source_block_run_id}")
-        print(f"📤 Target blocks: {target_blocks}")
-        print(f"📊 Data keys: {list(data.keys())}")
-        
-        # Get the source block run to find the pipeline run
-        source_block_run = db.query(BlockRun).filter(BlockRun.id == source_block_run_id).first()
-        if not source_block_run:
-            print(f"❌ Source block run {source_block_run_id} not found")
-            return
-        
-        pipeline_run_id = source_block_run.pipeline_run_id
-        print(f"️  Pipeline run ID: {pipeline_run_id}")
-        
-        # Find target blocks in the same pipeline run
-        for target_block_type in target_blocks:
-            print(f"🎯 Looking for {target_block_type} block...")
-            
-            # Handle file writer types specifically
-            if target_block_type == "file_writer":
-                # Find file writers based on data type
-                if data_type == "sentiment_data":
-                    target_block_name = "File Writer (Sentiment)"
-                elif data_type == "toxicity_data":
-                    target_block_name = "File Writer (Toxicity)"
-                else:
-                    target_block_name = "File Writer"
-                
-                # Find by name instead of block type
-                target_block_run = db.query(BlockRun).join(Block).filter(
-                    BlockRun.pipeline_run_id == pipeline_run_id,
-                    Block.name == target_block_name
-                ).first()
-            else:
-                # For non-file-writer blocks, use block type
-                target_block_run = db.query(BlockRun).join(Block).filter(
-                    BlockRun.pipeline_run_id == pipeline_run_id,
-                    Block.block_type == BlockType(target_block_type)
-                ).first()
-            
-            print(f"*********Target block run***********: {target_block_run}, target_block_run.status: {target_block_run.status}, {target_block_run.block.name}")
-            
-            if target_block_run and target_block_run.status == BlockStatus.PENDING:
-                print(f"✅ Found {target_block_type} block run {target_block_run.id}")
-                
-                # Update the block config with the new data
-                block = db.query(Block).filter(Block.id == target_block_run.block_id).first()
-                if block:
-                    # Merge existing config with new data
-                    updated_config = block.config.copy() if block.config else {}
-                    
-                    # Add data based on data type
-                    if data_type == "csv_data":
-                        updated_config["texts"] = data.get("texts", [])
-                        updated_config["csv_data"] = data
-                        print(f"📝 Added {len(data.get('texts', []))} texts to {target_block_type} config")
-                    elif data_type == "sentiment_data":
-                        updated_config["sentiment_data"] = data
-                        updated_config["texts"] = data.get("texts", [])
-                        updated_config["input_data"] = data.get("sentiments_results", [])
-                        print(f"📝 Added sentiment data to {target_block_type} config")
-                    elif data_type == "toxicity_data":
-                        updated_config["toxicity_data"] = data
-                        updated_config["texts"] = data.get("texts", [])
-                        updated_config["input_data"] = data.get("toxicity_results", [])
-                        print(f"📝 Added toxicity data to {target_block_type} config")
-                    
-                    # Update the block config
-                    block.config = updated_config
-                    db.commit()
-                    
-                    print(f"✅ Updated config for {target_block_type} block with {data_type} data")
-                    print(f" Config keys: {list(updated_config.keys())}")
-            else:
-                print(f"⚠️  {target_block_type} block not found or not pending")
-    
-    def create_sample_pipeline(self, db: Session):
+    def create_sample_pipeline(self, db: Session, streaming: bool = False):
         # Create pipeline
         pipeline = Pipeline(
             name="Sample Pipeline",
@@ -242,11 +326,12 @@ class Orchestrator:
         db.add_all([csv_block, sentiment_block, toxicity_block, file_writer_sentiment, file_writer_toxicity])
         db.commit()
         
-        # Create dependencies
-        sentiment_dep = BlockDependency(block_id=sentiment_block.id, depends_on_id=csv_block.id)
-        toxicity_dep = BlockDependency(block_id=toxicity_block.id, depends_on_id=csv_block.id)
-        file_sentiment_dep = BlockDependency(block_id=file_writer_sentiment.id, depends_on_id=sentiment_block.id)
-        file_toxicity_dep = BlockDependency(block_id=file_writer_toxicity.id, depends_on_id=toxicity_block.id)
+        # Create dependencies (streaming edges let every block start on the first micro-batch)
+        mode = EdgeMode.STREAM if streaming else EdgeMode.BATCH
+        sentiment_dep = BlockDependency(block_id=sentiment_block.id, depends_on_id=csv_block.id, mode=mode)
+        toxicity_dep = BlockDependency(block_id=toxicity_block.id, depends_on_id=csv_block.id, mode=mode)
+        file_sentiment_dep = BlockDependency(block_id=file_writer_sentiment.id, depends_on_id=sentiment_block.id, mode=mode)
+        file_toxicity_dep = BlockDependency(block_id=file_writer_toxicity.id, depends_on_id=toxicity_block.id, mode=mode)
         
         db.add_all([sentiment_dep, toxicity_dep, file_sentiment_dep, file_toxicity_dep])
         db.commit()
@@ -281,195 +366,824 @@ class Orchestrator:
         if not pipeline:
             raise ValueError("Pipeline not found")
         
-        # Create pipeline run
-        pipeline_run = PipelineRun(
-            pipeline_id=pipeline_id,
-            status=PipelineStatus.QUEUED
-        )
-        db.add(pipeline_run)
+        pipeline_run = self._insert_pipeline_runs(db, [pipeline_id])[0]
         db.commit()
-        db.refresh(pipeline_run)
         
-        # Create block runs for all blocks
-        blocks = db.query(Block).filter(Block.pipeline_id == pipeline_id).order_by(Block.order).all()
-        block_runs = []
-        
-        for block in blocks:
-            block_run = BlockRun(
-                pipeline_run_id=pipeline_run.id,
-                block_id=block.id,
-                status=BlockStatus.PENDING
-            )
-            block_runs.append(block_run)
+        self._publish_pipeline_started([pipeline_run])
+        return pipeline_run
+    
+    def execute_pipelines_batch(self, db: Session, pipeline_ids: List[int], batch_id: str) -> List[PipelineRun]:
+        """Create one run per pipeline id in a single transaction and enqueue every root block in one round-trip"""
+        found = {row.id for row in db.query(Pipeline.id).filter(Pipeline.id.in_(set(pipeline_ids)))}
+        missing = sorted(set(pipeline_ids) - found)
+        if missing:
+            raise ValueError(f"Pipelines not found: {missing}")
         
-        db.add_all(block_runs)
+        pipeline_runs = self._insert_pipeline_runs(db, pipeline_ids, batch_id=batch_id)
+        
+        # Claim the root blocks inside the same transaction
+        run_ids = [pipeline_run.id for pipeline_run in pipeline_runs]
+        root_block_runs = db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+            BlockRun.pipeline_run_id.in_(run_ids),
+            BlockRun.remaining_dependencies == 0
+        ).order_by(BlockRun.id).all()
+        started_at = datetime.utcnow()
+        for block_run in root_block_runs:
+            block_run.status = BlockStatus.RUNNING
+            block_run.started_at = started_at
         db.commit()
         
-        # Emit pipeline started event
-        self.kafka_client.publish_event(
-            "pipeline_events",
-            {
-                "event_type": "pipeline_started",
-                "pipeline_run_id": pipeline_run.id,
-                "pipeline_id": pipeline_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        )
+        # One Redis pipeline for all root jobs
+        jobs = self.task_queue.enqueue_many([
+            Queue.prepare_data(
+                process_task,
+                args=self._build_task_args(
+                    block_run, block_run.block, self.plan_cache.get_plan(db, block_run.block.pipeline_id)
+                ),
+                result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)
+            )
+            for block_run in root_block_runs
+        ])
+        print(f"📦 Batch {batch_id}: created {len(pipeline_runs)} runs, enqueued {len(jobs)} root blocks")
         
-        return pipeline_run
+        self._publish_pipeline_started(pipeline_runs, flush=False)
+        for block_run in root_block_runs:
+            self.kafka_client.publish_event("block_events", self._block_started_event(block_run, block_run.block), flush=False)
+        self.kafka_client.flush()
+        
+        self._release_successors(db, root_block_runs, stream=True)
+        
+        return pipeline_runs
+    
+    def _insert_pipeline_runs(self, db: Session, pipeline_ids: List[int], batch_id: str = None) -> List[PipelineRun]:
+        """Bulk-insert pipeline runs and their block runs without committing"""
+        plans = {pipeline_id: self.plan_cache.get_plan(db, pipeline_id) for pipeline_id in set(pipeline_ids)}
+        
+        # Create pipeline runs
+        pipeline_runs = [
+            PipelineRun(
+                pipeline_id=pipeline_id,
+                status=PipelineStatus.QUEUED,
+                remaining_blocks=len(plans[pipeline_id].block_order),
+                batch_id=batch_id
+            )
+            for pipeline_id in pipeline_ids
+        ]
+        db.add_all(pipeline_runs)
+        db.flush()
+        
+        # Create block runs for all blocks
+        block_runs_by_run = {}
+        for pipeline_run in pipeline_runs:
+            plan = plans[pipeline_run.pipeline_id]
+            block_runs_by_run[pipeline_run.id] = [
+                BlockRun(
+                    pipeline_run_id=pipeline_run.id,
+                    block_id=block_id,
+                    status=BlockStatus.PENDING,
+                    remaining_dependencies=plan.indegree(block_id)
+                )
+                for block_id in plan.block_order
+            ]
+            db.add_all(block_runs_by_run[pipeline_run.id])
+        db.flush()
+        
+        for pipeline_run in pipeline_runs:
+            self.plan_cache.store_run_map(RunMap(
+                pipeline_run.id,
+                pipeline_run.pipeline_id,
+                {br.block_id: br.id for br in block_runs_by_run[pipeline_run.id]}
+            ))
+        
+        return pipeline_runs
+    
+    def _publish_pipeline_started(self, pipeline_runs: List[PipelineRun], flush: bool = True):
+        """Emit pipeline started events"""
+        for pipeline_run in pipeline_runs:
+            self.kafka_client.publish_event(
+                "pipeline_events",
+                {
+                    "event_type": "pipeline_started",
+                    "pipeline_run_id": pipeline_run.id,
+                    "pipeline_id": pipeline_run.pipeline_id,
+                    "batch_id": pipeline_run.batch_id,
+                    "timestamp": datetime.utcnow().isoformat()
+                },
+                flush=False
+            )
+        if flush:
+            self.kafka_client.flush()
     
     def resolve_dag_and_dispatch(self, db: Session, pipeline_run_id: int):
-        """Resolve DAG dependencies and dispatch ready tasks using RQ"""
-        pipeline_run = db.query(PipelineRun).filter(PipelineRun.id == pipeline_run_id).first()
-        if not pipeline_run:
+        """Resolve DAG dependencies from the compiled plan and dispatch ready tasks using RQ"""
+        run_map = self.plan_cache.get_run_map(db, pipeline_run_id)
+        if not run_map:
             return
         
-        # Get all blocks and their dependencies
-        blocks = db.query(Block).filter(Block.pipeline_id == pipeline_run.pipeline_id).all()
-        block_dependencies = {}
+        plan = self.plan_cache.get_plan(db, run_map.pipeline_id)
         
-        for block in blocks:
-            dependencies = db.query(BlockDependency).filter(
-                BlockDependency.block_id == block.id
-            ).all()
-            block_dependencies[block.id] = [dep.depends_on_id for dep in dependencies]
+        # One bulk status fetch for the whole run
+        statuses = self._get_block_statuses(db, pipeline_run_id)
         
         # Find ready blocks (no dependencies or all dependencies completed)
-        ready_blocks = self._find_ready_blocks(db, pipeline_run_id, block_dependencies)
-        print(f"*********Ready blocks***********: {len(ready_blocks)}")        
-        # Dispatch ready blocks to RQ queue
+        ready_block_run_ids = [
+            run_map.block_runs[block_id]
+            for block_id in self._find_ready_blocks(plan, statuses)
+            if block_id in run_map.block_runs
+        ]
+        print(f"*********Ready blocks***********: {len(ready_block_run_ids)}")
+        if not ready_block_run_ids:
+            return
+        
+        ready_blocks = db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+            BlockRun.id.in_(ready_block_run_ids)
+        ).all()
+        
+        # Dispatch ready blocks to RQ queue in plan order
+        position = {block_run_id: index for index, block_run_id in enumerate(ready_block_run_ids)}
+        ready_blocks.sort(key=lambda br: position[br.id])
         for block_run in ready_blocks:
             self._dispatch_block_to_rq_queue(db, block_run)
     
-    def _find_ready_blocks(self, db: Session, pipeline_run_id: int, block_dependencies: Dict[int, List[int]]) -> List[BlockRun]:
-        """Find blocks that are ready to run (dependencies satisfied)"""
+    def _get_block_statuses(self, db: Session, pipeline_run_id: int) -> Dict[int, BlockStatus]:
+        """Fetch block_id -> status for every block run of a pipeline run in one query"""
+        rows = db.query(BlockRun.block_id, BlockRun.status).filter(
+            BlockRun.pipeline_run_id == pipeline_run_id
+        ).all()
+        return {block_id: status for block_id, status in rows}
+    
+    def _find_ready_blocks(self, plan: DagPlan, statuses: Dict[int, BlockStatus]) -> List[int]:
+        """Find blocks that are ready to run (dependencies satisfied), walking the plan level by level"""
         ready_blocks = []
         
-        for block_id, dependencies in block_dependencies.items():
-            block_run = self._get_block_run(db, pipeline_run_id, block_id)
-            
-            # Skip if block is already running, completed, or failed
-            if block_run.status in [BlockStatus.RUNNING, BlockStatus.COMPLETED, BlockStatus.FAILED]:
-                continue
-
-            if not dependencies:  # No dependencies
-                ready_blocks.append(self._get_block_run(db, pipeline_run_id, block_id))
-            else:
-                # Check if all dependencies are completed
-                all_completed = True
-                for dep_id in dependencies:
-                    dep_run = self._get_block_run(db, pipeline_run_id, dep_id)
-                    if dep_run.status != BlockStatus.COMPLETED:
-                        all_completed = False
-                        break
+        for level in plan.levels:
+            for block_id in level:
+                # Skip if block is already running, completed, or failed
+                if statuses.get(block_id) != BlockStatus.PENDING:
+                    continue
                 
-                if all_completed:
-                    ready_blocks.append(self._get_block_run(db, pipeline_run_id, block_id))
+                # A streaming input only needs its upstream block to have started
+                if all(
+                    statuses.get(dep_id) == BlockStatus.COMPLETED
+                    or (plan.is_stream_edge(block_id, dep_id) and statuses.get(dep_id) == BlockStatus.RUNNING)
+                    for dep_id in plan.dependencies[block_id]
+                ):
+                    ready_blocks.append(block_id)
         
         return ready_blocks
     
-    def _get_block_run(self, db: Session, pipeline_run_id: int, block_id: int) -> BlockRun:
-        """Get block run for a specific block in a pipeline run"""
-        return db.query(BlockRun).filter(
-            BlockRun.pipeline_run_id == pipeline_run_id,
-            BlockRun.block_id == block_id
-        ).first()
-    
     def _dispatch_block_to_rq_queue(self, db: Session, block_run: BlockRun):
         """Dispatch a block to RQ queue with enhanced config"""
-        # Double-check block status before dispatching
-        if block_run.status != BlockStatus.PENDING:
-            print(f"Block {block_run.id} is not pending (status: {block_run.status}), skipping dispatch")
+        # Claim the block first so concurrent orchestrators (or duplicate events) never dispatch it twice
+        claimed = db.query(BlockRun).filter(
+            BlockRun.id == block_run.id,
+            BlockRun.status == BlockStatus.PENDING
+        ).update(
+            {BlockRun.status: BlockStatus.RUNNING, BlockRun.started_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            print(f"Block {block_run.id} is no longer pending, skipping dispatch")
             return
-        block = db.query(Block).filter(Block.id == block_run.block_id).first()
+        block = block_run.block
+        plan = self.plan_cache.get_plan(db, block.pipeline_id)
         
+        # Sibling blocks that can share this block's job are claimed alongside it
+        members = [block_run] + self._claim_fusion_partners(db, block_run, block, plan)
         
-        # Emit block started event
-        self.kafka_client.publish_event(
-            "block_events",
-            {
-                "event_type": "block_started",
-                "block_run_id": block_run.id,
-                "block_type": block.block_type.value,
-                "block_name": block.name,
-                "block_description": f"{block.block_type.value} for {self._get_block_purpose(block)}",
-                "block_config": block.config,
-                "block_purpose": self._get_block_purpose(block),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+        # Emit block started events (one per block run, fused or not)
+        for member in members:
+            fused_with = [other.id for other in members if other is not member]
+            self.kafka_client.publish_event("block_events", self._block_started_event(member, member.block, fused_with), flush=False)
+        self.kafka_client.flush()
+        
+        # Dispatch to single RQ queue - any worker can pick it up
+        try:
+            shards = self._plan_shards(block_run, block, plan)
+            if shards:
+                self._dispatch_shards(db, members, shards)
+                return
+            if len(members) > 1:
+                job = self.task_queue.enqueue_call(
+                    func=process_fused,
+                    args=([self._build_task_args(member, member.block, plan) for member in members],),
+                    result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)
+                )
+            else:
+                job = self.task_queue.enqueue_call(
+                    func=process_task,
+                    args=self._build_task_args(block_run, block, plan),
+                    result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)
+                )
+        except Exception:
+            # Release the claims so the blocks can be dispatched again
+            member_ids = [member.id for member in members]
+            db.rollback()
+            db.query(BlockRunShard).filter(BlockRunShard.block_run_id.in_(member_ids)).delete(synchronize_session=False)
+            db.query(BlockRun).filter(
+                BlockRun.id.in_(member_ids),
+                BlockRun.status == BlockStatus.RUNNING
+            ).update({
+                BlockRun.status: BlockStatus.PENDING,
+                BlockRun.started_at: None,
+                BlockRun.shards_total: None,
+                BlockRun.shards_remaining: None
+            }, synchronize_session=False)
+            db.commit()
+            raise
+        
+        print(f"Dispatched {'+'.join(member.block.block_type.value for member in members)} to queue, job_id: {job.get_id()}")
+        
+        # Consumers of this block's streaming out-edges start alongside it
+        self._release_successors(db, [block_run], stream=True)
+    
+    def _claim_fusion_partners(self, db: Session, block_run: BlockRun, block: Block, plan: DagPlan) -> List[BlockRun]:
+        """Claim pending sibling runs that can share block_run's job: other fusable block types over the same inputs and model"""
+        if not self._is_fusable(block) or plan.successors_by_mode(block.id, stream=True):
+            return []
+        run_map = self.plan_cache.get_run_map(db, block_run.pipeline_run_id)
+        if not run_map:
+            return []
+        sibling_run_ids = [
+            run_map.block_runs[sibling_id]
+            for sibling_id in plan.siblings(block.id)
+            if sibling_id in run_map.block_runs and not plan.successors_by_mode(sibling_id, stream=True)
+        ]
+        if not sibling_run_ids:
+            return []
+        
+        partners = []
+        block_types = {block.block_type}
+        # Blocks must also agree on where they run
+        engine = self._inference_engine(block)
+        for candidate in db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+            BlockRun.id.in_(sibling_run_ids),
+            BlockRun.status == BlockStatus.PENDING
+        ).order_by(BlockRun.id).all():
+            sibling = candidate.block
+            # One block per type: fusing two identical classifications would only ask the same question twice
+            if sibling.block_type in block_types or not self._is_fusable(sibling) or self._inference_engine(sibling) != engine:
+                continue
+            claimed = db.query(BlockRun).filter(
+                BlockRun.id == candidate.id,
+                BlockRun.status == BlockStatus.PENDING
+            ).update(
+                {BlockRun.status: BlockStatus.RUNNING, BlockRun.started_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            if claimed:
+                partners.append(candidate)
+                block_types.add(sibling.block_type)
+        db.commit()
+        return partners
+    
+    def _is_fusable(self, block: Block) -> bool:
+        return BLOCK_FUSION and block.block_type in FUSABLE_BLOCK_TYPES and (block.config or {}).get("fuse", True)
+    
+    def _inference_engine(self, block: Block) -> tuple:
+        config = block.config or {}
+        return (config.get("backend", INFERENCE_BACKEND), config.get("model", LLM_MODEL), config.get("routing"))
+    
+    def _plan_shards(self, block_run: BlockRun, block: Block, plan: DagPlan) -> List[Tuple[int, int]]:
+        """Split a shardable block's input rows into [start, end) ranges; empty when it should run as one job"""
+        if block.block_type not in SHARDABLE_BLOCK_TYPES:
+            return []
+        # Streaming edges carry one ordered sequence of micro-batches, so their endpoints run unsharded
+        if block.id in plan.stream_upstream or plan.successors_by_mode(block.id, stream=True):
+            return []
+        inputs = (block_run.input_data or {}).get("inputs", {})
+        row_count = max((ref.get("row_count") or 0 for ref in inputs.values()), default=0)
+        if row_count < SHARD_MIN_ROWS:
+            return []
+        
+        # Size shards by target duration once this block type's throughput has been observed
+        rows_per_shard = SHARD_TARGET_ROWS
+        seconds_per_row = self._shard_seconds_per_row(block.block_type.value)
+        if seconds_per_row:
+            rows_per_shard = max(1, int(SHARD_TARGET_SECONDS / seconds_per_row))
+        
+        shard_count = min(SHARD_MAX_SHARDS, math.ceil(row_count / rows_per_shard))
+        if shard_count < 2:
+            return []
+        shard_size = math.ceil(row_count / shard_count)
+        return [(start, min(start + shard_size, row_count)) for start in range(0, row_count, shard_size)]
+    
+    def _shard_seconds_per_row(self, block_type: str) -> float:
+        try:
+            value = self.redis_conn.hget(SHARD_RATE_KEY, block_type)
+            return float(value) if value is not None else None
+        except Exception as e:
+            print(f"Error reading shard rate for {block_type}: {e}")
+            return None
+    
+    def _dispatch_shards(self, db: Session, block_runs: List[BlockRun], shards: List[Tuple[int, int]]):
+        """Record the shards of claimed block runs and enqueue one job per shard (shared by fused block runs)"""
+        now = datetime.utcnow()
+        for block_run in block_runs:
+            db.add_all([
+                BlockRunShard(
+                    block_run_id=block_run.id,
+                    shard_index=index,
+                    start_row=start_row,
+                    end_row=end_row,
+                    status=BlockStatus.RUNNING,
+                    started_at=now
+                )
+                for index, (start_row, end_row) in enumerate(shards)
+            ])
+        db.query(BlockRun).filter(BlockRun.id.in_([block_run.id for block_run in block_runs])).update(
+            {BlockRun.shards_total: len(shards), BlockRun.shards_remaining: len(shards)},
+            synchronize_session=False
         )
+        db.commit()
         
+        member_args = [self._build_task_args(block_run, block_run.block) for block_run in block_runs]
+        jobs = []
+        for index, (start_row, end_row) in enumerate(shards):
+            shard = {"index": index, "start_row": start_row, "end_row": end_row}
+            shard_args = [(block_run_id, block_type, {**config, "shard": shard}) for block_run_id, block_type, config in member_args]
+            if len(shard_args) > 1:
+                jobs.append(Queue.prepare_data(process_fused, args=(shard_args,), result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)))
+            else:
+                jobs.append(Queue.prepare_data(process_shard, args=shard_args[0], result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)))
+        self.task_queue.enqueue_many(jobs)
+        print(f"Dispatched {'+'.join(block_type for _, block_type, _ in member_args)} as {len(shards)} shards of ~{shards[0][1] - shards[0][0]} rows")
+    
+    def _build_task_args(self, block_run: BlockRun, block: Block, plan: DagPlan = None) -> tuple:
+        """Build the process_task arguments for a block run"""
         # Enhanced config with block_run_id for tracking
         enhanced_config = block.config.copy() if block.config else {}
         enhanced_config["block_run_id"] = block_run.id
-        
-        # Dispatch to single RQ queue - any worker can pick it up
-        job = self.task_queue.enqueue_call(
-            func=process_task,
-            args=(block_run.id, block.block_type.value, enhanced_config),
-            result_ttl=5000
-        )
-        
-        print(f"Dispatched {block.block_type.value} to queue, job_id: {job.get_id()}")
-
-        # Update block run status
-        block_run.status = BlockStatus.RUNNING
-        block_run.started_at = datetime.utcnow()
-        db.commit()
+        # Lets the worker publish to the completion partition that owns this run
+        enhanced_config["pipeline_run_id"] = block_run.pipeline_run_id
+        # Upstream outputs as artifact references, never the data itself
+        enhanced_config["inputs"] = (block_run.input_data or {}).get("inputs", {})
+        # Per-edge Redis Streams for streaming edges
+        if plan and block.id in plan.stream_upstream:
+            enhanced_config["input_stream"] = edge_stream_key(block_run.pipeline_run_id, plan.stream_upstream[block.id], block.id)
+        if plan and plan.successors_by_mode(block.id, stream=True):
+            enhanced_config["output_streams"] = [
+                edge_stream_key(block_run.pipeline_run_id, block.id, successor_id)
+                for successor_id in plan.successors_by_mode(block.id, stream=True)
+            ]
+        return (block_run.id, block.block_type.value, enhanced_config)
+    
+    def _block_started_event(self, block_run: BlockRun, block: Block, fused_with: List[int] = None) -> dict:
+        event = {
+            "event_type": "block_started",
+            "block_run_id": block_run.id,
+            "block_type": block.block_type.value,
+            "block_name": block.name,
+            "block_description": f"{block.block_type.value} for {self._get_block_purpose(block)}",
+            "block_config": block.config,
+            "block_purpose": self._get_block_purpose(block),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if fused_with:
+            event["fused_with"] = fused_with
+        return event
 
     def handle_block_completion(self, db: Session, block_run_id: int, result_data: dict, success: bool = True):
         """Handle completion of a block run"""
-        block_run = db.query(BlockRun).filter(BlockRun.id == block_run_id).first()
-        if not block_run:
-            return
+        self.handle_block_completions(db, [(block_run_id, result_data, success)])
+    
+    def handle_block_completions(self, db: Session, completions: List[Tuple[int, dict, bool]]):
+        """Apply a batch of (block_run_id, result_data, success) completions in one transaction, then schedule"""
+        # Conditional transitions: duplicate or concurrent events match no row and become cheap no-ops
+        applied = []
+        redelivered = []
+        seen = set()
+        for block_run_id, result_data, success in completions:
+            if block_run_id is None or block_run_id in seen:
+                continue
+            seen.add(block_run_id)
+            
+            if success:
+                values = {
+                    BlockRun.status: BlockStatus.COMPLETED,
+                    BlockRun.output_data: result_data,
+                    BlockRun.completed_at: datetime.utcnow()
+                }
+                usage = result_data.get("result", {}).get("usage")
+                if usage:
+                    values.update({getattr(BlockRun, field): usage.get(field, 0) for field in USAGE_FIELDS})
+            else:
+                values = {
+                    BlockRun.status: BlockStatus.FAILED,
+                    BlockRun.error_message: result_data.get("error", "Unknown error"),
+                    BlockRun.completed_at: datetime.utcnow()
+                }
+            updated = db.query(BlockRun).filter(
+                BlockRun.id == block_run_id,
+                BlockRun.status == BlockStatus.RUNNING
+            ).update(values, synchronize_session=False)
+            
+            if updated:
+                applied.append((block_run_id, result_data, success))
+            else:
+                redelivered.append(block_run_id)
         
-        if success:
-            block_run.status = BlockStatus.COMPLETED
-            block_run.output_data = result_data
-            block_run.completed_at = datetime.utcnow()
-        else:
-            block_run.status = BlockStatus.FAILED
-            block_run.error_message = result_data.get("error", "Unknown error")
-            block_run.completed_at = datetime.utcnow()
+        finished = []
+        if applied:
+            block_runs = {
+                block_run.id: block_run
+                for block_run in db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+                    BlockRun.id.in_([block_run_id for block_run_id, _, _ in applied])
+                )
+            }
+            finished = [(block_runs[block_run_id], result_data, success) for block_run_id, result_data, success in applied]
+            
+            # Output references, usage totals and scheduler counters change in the same transaction as the status,
+            # so they are applied exactly once however often the event is delivered
+            self._record_artifacts(db, applied)
+            self._record_usage(db, applied)
+            self._count_completions(db, [(block_run, success) for block_run, _, success in finished])
+            db.commit()
+            
+            # Emit block completion events
+            for block_run, result_data, success in finished:
+                usage = result_data.get("result", {}).get("usage") if success else None
+                self.kafka_client.publish_event("block_events", self._block_finished_event(block_run, success, usage), flush=False)
+            self.kafka_client.flush()
+        
+        # Scheduling after the commit is idempotent: a completion redelivered because dispatch failed
+        # (or the instance died) finds its block already finished and simply schedules again
+        repeated = []
+        if redelivered:
+            repeated = db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+                BlockRun.id.in_(redelivered),
+                BlockRun.status.in_([BlockStatus.COMPLETED, BlockStatus.FAILED])
+            ).all()
+            print(f"{len(redelivered)} completions were already applied, re-running scheduling for {len(repeated)} finished blocks")
+        
+        scheduled = [(block_run, success) for block_run, _, success in finished]
+        scheduled += [(block_run, block_run.status == BlockStatus.COMPLETED) for block_run in repeated]
+        if scheduled:
+            self._schedule_after_completions(db, scheduled)
+    
+    def _block_finished_event(self, block_run: BlockRun, success: bool, usage: dict = None) -> dict:
+        return {
+            "event_type": "block_completed" if success else "block_failed",
+            "block_run_id": block_run.id,
+            "block_type":block_run.block.block_type.value,
+            "block_name": block_run.block.name,
+            "block_description": f"{block_run.block.block_type.value} for {self._get_block_purpose(block_run.block)}",
+            "block_config": block_run.block.config,
+            "block_purpose": self._get_block_purpose(block_run.block),
+            "success": success,
+            **({"usage": usage} if usage else {}),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def handle_shard_completions(self, db: Session, shard_completions: List[Tuple[int, int, dict, bool]]):
+        """Apply (block_run_id, shard_index, result_data, success) shard events; merge block runs whose shards are all done"""
+        applied = []
+        seen = set()
+        for block_run_id, shard_index, result_data, success in shard_completions:
+            if block_run_id is None or (block_run_id, shard_index) in seen:
+                continue
+            seen.add((block_run_id, shard_index))
+            
+            if success:
+                values = {
+                    BlockRunShard.status: BlockStatus.COMPLETED,
+                    BlockRunShard.output_data: result_data,
+                    BlockRunShard.completed_at: datetime.utcnow()
+                }
+            else:
+                values = {
+                    BlockRunShard.status: BlockStatus.FAILED,
+                    BlockRunShard.error_message: result_data.get("error", "Unknown error"),
+                    BlockRunShard.completed_at: datetime.utcnow()
+                }
+            updated = db.query(BlockRunShard).filter(
+                BlockRunShard.block_run_id == block_run_id,
+                BlockRunShard.shard_index == shard_index,
+                BlockRunShard.status == BlockStatus.RUNNING
+            ).update(values, synchronize_session=False)
+            
+            if updated:
+                applied.append((block_run_id, shard_index, result_data, success))
+            else:
+                print(f"Shard {shard_index} of block {block_run_id} is not running, skipping duplicate completion")
+        
+        completed = Counter(block_run_id for block_run_id, _, _, success in applied if success)
+        runs_by_amount = defaultdict(list)
+        for block_run_id, amount in completed.items():
+            runs_by_amount[amount].append(block_run_id)
+        for amount, block_run_ids in runs_by_amount.items():
+            db.query(BlockRun).filter(BlockRun.id.in_(block_run_ids)).update(
+                {BlockRun.shards_remaining: BlockRun.shards_remaining - amount},
+                synchronize_session=False
+            )
+        db.commit()
+        
+        # What follows only reads committed state and is idempotent, so it runs for every block run in the batch:
+        # an event redelivered because failing or merging its block run raised finds its shard finished and retries
+        block_run_ids = list({block_run_id for block_run_id, _ in seen})
+        
+        # One failed shard fails the whole block run
+        failures = {}
+        for block_run_id, shard_index, error_message in db.query(
+            BlockRunShard.block_run_id, BlockRunShard.shard_index, BlockRunShard.error_message
+        ).join(BlockRun).filter(
+            BlockRunShard.block_run_id.in_(block_run_ids),
+            BlockRunShard.status == BlockStatus.FAILED,
+            BlockRun.status == BlockStatus.RUNNING
+        ).order_by(BlockRunShard.shard_index):
+            if block_run_id not in failures:
+                failures[block_run_id] = {"error": f"Shard {shard_index} failed: {error_message or 'Unknown error'}"}
+        if failures:
+            self.handle_block_completions(db, [(block_run_id, error, False) for block_run_id, error in failures.items()])
         
+        ready_to_merge = db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+            BlockRun.id.in_(block_run_ids),
+            BlockRun.shards_remaining == 0,
+            BlockRun.status == BlockStatus.RUNNING
+        ).all()
+        # A failed enqueue does not hold back the other merges; it is raised afterwards so the batch is redelivered
+        error = None
+        for block_run in ready_to_merge:
+            try:
+                self._dispatch_merge(db, block_run)
+            except Exception as e:
+                print(f"❌ Error enqueueing merge of block {block_run.id}: {e}")
+                error = error or e
+        if error:
+            raise error
+    
+    def _dispatch_merge(self, db: Session, block_run: BlockRun):
+        """Enqueue the job that concatenates a block run's shard outputs in order"""
+        # Claim the merge first so duplicate events or concurrent orchestrators never enqueue it twice
+        claimed = db.query(BlockRun).filter(
+            BlockRun.id == block_run.id,
+            BlockRun.status == BlockStatus.RUNNING,
+            BlockRun.shards_remaining == 0
+        ).update({BlockRun.shards_remaining: MERGE_QUEUED}, synchronize_session=False)
         db.commit()
+        if not claimed:
+            print(f"Merge of block {block_run.id} is already queued, skipping")
+            return
         
-        # Emit block completion event
-        self.kafka_client.publish_event(
-            "block_events",
-            {
-                "event_type": "block_completed" if success else "block_failed",
-                "block_run_id": block_run_id,
-                "block_type":block_run.block.block_type.value,
-                "block_name": block_run.block.name,
-                "block_description": f"{block_run.block.block_type.value} for {self._get_block_purpose(block_run.block)}",
-                "block_config": block_run.block.config,
-                "block_purpose": self._get_block_purpose(block_run.block),
-                "success": success,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        )
-        # ✅ FIX: Process data flow BEFORE dispatching next blocks
-        print(f"*********Block CompletionResult data***********: {result_data}")
-        if success and "data_type" in result_data.get("result", {}):
-            result_data_result = result_data.get("result", {})
-            print(f"🔄 Processing data flow before dispatching next blocks")
+        shard_outputs = [
+            output_data.get("result", {})
+            for output_data, in db.query(BlockRunShard.output_data).filter(
+                BlockRunShard.block_run_id == block_run.id
+            ).order_by(BlockRunShard.shard_index)
+        ]
+        block_run_id, block_type, config = self._build_task_args(block_run, block_run.block)
+        config["shard_results"] = shard_outputs
+        try:
+            job = self.task_queue.enqueue_call(
+                func=merge_shards, args=(block_run_id, block_type, config), result_ttl=5000, retry=Retry(max=TASK_MAX_RETRIES)
+            )
+        except Exception:
+            # Release the claim so a redelivered shard event can enqueue the merge again
+            db.rollback()
+            db.query(BlockRun).filter(
+                BlockRun.id == block_run.id,
+                BlockRun.shards_remaining == MERGE_QUEUED
+            ).update({BlockRun.shards_remaining: 0}, synchronize_session=False)
+            db.commit()
+            raise
+        print(f"All {len(shard_outputs)} shards of block {block_run.id} done, merge job_id: {job.get_id()}")
+    
+    def _record_usage(self, db: Session, applied: List[Tuple[int, dict, bool]]):
+        """Add each completed block's LLM usage to its pipeline run's ledger totals"""
+        usages = {
+            block_run_id: result_data["result"]["usage"]
+            for block_run_id, result_data, success in applied
+            if success and result_data.get("result", {}).get("usage")
+        }
+        if not usages:
+            return
+        
+        totals = defaultdict(Counter)
+        for block_run_id, pipeline_run_id in db.query(BlockRun.id, BlockRun.pipeline_run_id).filter(BlockRun.id.in_(list(usages))):
+            totals[pipeline_run_id].update({field: usages[block_run_id].get(field, 0) for field in USAGE_FIELDS})
+        # Relative updates, so concurrent completions of one run never overwrite each other
+        for pipeline_run_id, total in totals.items():
+            db.query(PipelineRun).filter(PipelineRun.id == pipeline_run_id).update(
+                {getattr(PipelineRun, field): func.coalesce(getattr(PipelineRun, field), 0) + total[field] for field in USAGE_FIELDS},
+                synchronize_session=False
+            )
+    
+    def _record_artifacts(self, db: Session, applied: List[Tuple[int, dict, bool]]):
+        """Register each completed block's output artifact and hand its reference to the successor block runs"""
+        outputs = {
+            block_run_id: result_data.get("result", {})
+            for block_run_id, result_data, success in applied
+            if success and result_data.get("result", {}).get("artifact")
+        }
+        if not outputs:
+            return
+        
+        successor_inputs = defaultdict(dict)
+        for block_run_id, block_id, pipeline_run_id in db.query(
+            BlockRun.id, BlockRun.block_id, BlockRun.pipeline_run_id
+        ).filter(BlockRun.id.in_(list(outputs))):
+            result = outputs[block_run_id]
+            ref = result["artifact"]
+            data_type = result.get("data_type", "output")
+            db.add(Artifact(
+                block_run_id=block_run_id,
+                name=data_type,
+                file_path=ref["path"],
+                artifact_metadata={**ref, "data_type": data_type, "row_count": result.get("row_count")}
+            ))
             
-            # Update configs for next blocks
-            self._update_block_configs_with_data(
-                db, 
-                block_run_id, 
-                result_data_result.get("data_type"),
-                result_data_result,
-                result_data_result.get("next_blocks", [])
+            run_map = self.plan_cache.get_run_map(db, pipeline_run_id)
+            if not run_map:
+                continue
+            plan = self.plan_cache.get_plan(db, run_map.pipeline_id)
+            for successor_block_id in plan.successors.get(block_id, []):
+                if successor_block_id in run_map.block_runs:
+                    successor_inputs[run_map.block_runs[successor_block_id]][data_type] = {
+                        **ref, "row_count": result.get("row_count")
+                    }
+        
+        if not successor_inputs:
+            return
+        # While the ring rebalances, two instances can briefly handle completions of the same run:
+        # lock the successor rows so their read-modify-write merges serialize
+        for successor in db.query(BlockRun).filter(BlockRun.id.in_(list(successor_inputs))).with_for_update():
+            input_data = dict(successor.input_data or {})
+            input_data["inputs"] = {**input_data.get("inputs", {}), **successor_inputs[successor.id]}
+            successor.input_data = input_data
+    
+    def _legacy_run_ids(self, db: Session, finished: List[Tuple[BlockRun, bool]]) -> set:
+        """Runs created before the scheduler counters existed; they fall back to a full rescan"""
+        run_ids = {block_run.pipeline_run_id for block_run, _ in finished}
+        counterless = {
+            pipeline_run_id
+            for pipeline_run_id, in db.query(PipelineRun.id).filter(
+                PipelineRun.id.in_(run_ids),
+                PipelineRun.remaining_blocks.is_(None)
+            )
+        }
+        return counterless | {block_run.pipeline_run_id for block_run, _ in finished if block_run.remaining_dependencies is None}
+    
+    def _count_completions(self, db: Session, finished: List[Tuple[BlockRun, bool]]):
+        """Decrement the run and successor counters of newly finished block runs (the caller commits)"""
+        legacy_run_ids = self._legacy_run_ids(db, finished)
+        completed = [block_run for block_run, success in finished if success and block_run.pipeline_run_id not in legacy_run_ids]
+        if not completed:
+            return
+        
+        completed_counts = Counter(block_run.pipeline_run_id for block_run in completed)
+        for pipeline_run_id, amount in completed_counts.items():
+            db.query(PipelineRun).filter(PipelineRun.id == pipeline_run_id).update(
+                {PipelineRun.remaining_blocks: PipelineRun.remaining_blocks - amount},
+                synchronize_session=False
+            )
+        self._decrement_successors(db, self._successor_decrements(db, completed, stream=False))
+    
+    def _schedule_after_completions(self, db: Session, finished: List[Tuple[BlockRun, bool]]):
+        """Finish runs and dispatch or fail successors of finished block runs; safe to repeat for the same blocks"""
+        # Runs created before the scheduler counters existed fall back to a full rescan
+        legacy_run_ids = self._legacy_run_ids(db, finished)
+        for pipeline_run_id in legacy_run_ids:
+            self._check_pipeline_completion(db, pipeline_run_id)
+            self.resolve_dag_and_dispatch(db, pipeline_run_id)
+        
+        # Incremental scheduling: O(out-degree) per completion event
+        counted = [(block_run, success) for block_run, success in finished if block_run.pipeline_run_id not in legacy_run_ids]
+        if not counted:
+            return
+        self._finish_pipeline_runs(db, counted)
+        completed = [block_run for block_run, success in counted if success]
+        self._dispatch_ready(db, list(self._successor_decrements(db, completed, stream=False)))
+        self._fail_downstream(db, [block_run for block_run, success in counted if not success])
+    
+    def _fail_downstream(self, db: Session, failed: List[BlockRun]):
+        """Fail the pending block runs downstream of failed ones: their inputs will never arrive"""
+        downstream = {}
+        for block_run in failed:
+            run_map = self.plan_cache.get_run_map(db, block_run.pipeline_run_id)
+            if not run_map:
+                continue
+            plan = self.plan_cache.get_plan(db, run_map.pipeline_id)
+            stack, seen = list(plan.successors.get(block_run.block_id, [])), set()
+            while stack:
+                block_id = stack.pop()
+                if block_id in seen:
+                    continue
+                seen.add(block_id)
+                stack.extend(plan.successors.get(block_id, []))
+                if block_id in run_map.block_runs:
+                    downstream.setdefault(run_map.block_runs[block_id], f"Upstream block run {block_run.id} failed")
+        if not downstream:
+            return
+        
+        # Conditional like every other transition: blocks already dispatched (e.g. streaming consumers) keep running
+        cancelled = []
+        for block_run_id, error in downstream.items():
+            updated = db.query(BlockRun).filter(
+                BlockRun.id == block_run_id,
+                BlockRun.status == BlockStatus.PENDING
+            ).update(
+                {BlockRun.status: BlockStatus.FAILED, BlockRun.error_message: error, BlockRun.completed_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            if updated:
+                cancelled.append(block_run_id)
+        db.commit()
+        if not cancelled:
+            return
+        
+        print(f"⛔ Failed {len(cancelled)} block runs downstream of a failure")
+        for block_run in db.query(BlockRun).options(joinedload(BlockRun.block)).filter(BlockRun.id.in_(cancelled)):
+            self.kafka_client.publish_event("block_events", self._block_finished_event(block_run, False), flush=False)
+        self.kafka_client.flush()
+    
+    def _release_successors(self, db: Session, block_runs: List[BlockRun], stream: bool = False):
+        """Decrement the dependency counters of successors and dispatch those that reach zero.
+
+        Batch edges are released when block_runs complete, stream edges when they start.
+        """
+        decrements = self._successor_decrements(db, block_runs, stream)
+        if not decrements:
+            return
+        self._decrement_successors(db, decrements)
+        db.commit()
+        self._dispatch_ready(db, list(decrements))
+    
+    def _successor_decrements(self, db: Session, block_runs: List[BlockRun], stream: bool) -> Counter:
+        """successor block_run_id -> number of its batch (or stream) inputs among block_runs"""
+        decrements = Counter()
+        for block_run in block_runs:
+            run_map = self.plan_cache.get_run_map(db, block_run.pipeline_run_id)
+            if not run_map:
+                continue
+            plan = self.plan_cache.get_plan(db, run_map.pipeline_id)
+            for block_id in plan.successors_by_mode(block_run.block_id, stream):
+                if block_id in run_map.block_runs:
+                    decrements[run_map.block_runs[block_id]] += 1
+        return decrements
+    
+    def _decrement_successors(self, db: Session, decrements: Counter):
+        # One UPDATE per distinct decrement (almost always just "- 1")
+        successors_by_amount = defaultdict(list)
+        for successor_id, amount in decrements.items():
+            successors_by_amount[amount].append(successor_id)
+        for amount, successor_ids in successors_by_amount.items():
+            db.query(BlockRun).filter(BlockRun.id.in_(successor_ids)).update(
+                {BlockRun.remaining_dependencies: BlockRun.remaining_dependencies - amount},
+                synchronize_session=False
             )
     
-        # Check if pipeline is complete or if we can dispatch more tasks
-        self._check_pipeline_completion(db, block_run.pipeline_run_id)
-        self.resolve_dag_and_dispatch(db, block_run.pipeline_run_id)
+    def _dispatch_ready(self, db: Session, successor_ids: List[int]):
+        """Dispatch the successors whose dependency counters reached zero and that are still pending"""
+        if not successor_ids:
+            return
+        ready_blocks = db.query(BlockRun).options(joinedload(BlockRun.block)).filter(
+            BlockRun.id.in_(successor_ids),
+            BlockRun.remaining_dependencies <= 0,
+            BlockRun.status == BlockStatus.PENDING
+        ).order_by(BlockRun.id).all()
+        print(f"*********Ready blocks***********: {len(ready_blocks)}")
+        
+        for ready_block_run in ready_blocks:
+            self._dispatch_block_to_rq_queue(db, ready_block_run)
+    
+    def _finish_pipeline_runs(self, db: Session, counted: List[Tuple[BlockRun, bool]]):
+        """Fail runs that saw a failure and complete runs whose remaining-blocks counter reached zero"""
+        completed_run_ids = {block_run.pipeline_run_id for block_run, success in counted if success}
+        failed_run_ids = {block_run.pipeline_run_id for block_run, success in counted if not success}
+        finished_statuses = [PipelineStatus.COMPLETED, PipelineStatus.FAILED]
+        finished_runs = []
+        
+        # Only one instance (or delivery) wins each run's transition
+        for pipeline_run_id in failed_run_ids:
+            updated = db.query(PipelineRun).filter(
+                PipelineRun.id == pipeline_run_id,
+                PipelineRun.status.notin_(finished_statuses)
+            ).update(
+                {PipelineRun.status: PipelineStatus.FAILED, PipelineRun.completed_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            if updated:
+                finished_runs.append((pipeline_run_id, False))
+        
+        for pipeline_run_id in completed_run_ids - failed_run_ids:
+            updated = db.query(PipelineRun).filter(
+                PipelineRun.id == pipeline_run_id,
+                PipelineRun.remaining_blocks <= 0,
+                PipelineRun.status.notin_(finished_statuses)
+            ).update(
+                {PipelineRun.status: PipelineStatus.COMPLETED, PipelineRun.completed_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            if updated:
+                finished_runs.append((pipeline_run_id, True))
+        db.commit()
+        
+        for pipeline_run_id, success in finished_runs:
+            self._emit_pipeline_finished(pipeline_run_id, success)
     
     def _check_pipeline_completion(self, db: Session, pipeline_run_id: int):
-        """Check if pipeline run is complete"""
+        """Check if pipeline run is complete by scanning all block runs (runs without scheduler counters)"""
         pipeline_run = db.query(PipelineRun).filter(PipelineRun.id == pipeline_run_id).first()
         block_runs = db.query(BlockRun).filter(BlockRun.pipeline_run_id == pipeline_run_id).all()
         
@@ -488,15 +1202,18 @@ class Orchestrator:
         
         # Emit pipeline completion event
         if all_completed or any_failed:
-            self.kafka_client.publish_event(
-                "pipeline_events",
-                {
-                    "event_type": "pipeline_completed" if all_completed else "pipeline_failed",
-                    "pipeline_run_id": pipeline_run_id,
-                    "success": all_completed,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            )
+            self._emit_pipeline_finished(pipeline_run_id, all_completed)
+    
+    def _emit_pipeline_finished(self, pipeline_run_id: int, success: bool):
+        self.kafka_client.publish_event(
+            "pipeline_events",
+            {
+                "event_type": "pipeline_completed" if success else "pipeline_failed",
+                "pipeline_run_id": pipeline_run_id,
+                "success": success,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        )
 
     def _get_block_purpose(self, block: Block) -> str:
         """Get a human-readable description of what this block does"""
@@ -517,15 +1234,41 @@ class Orchestrator:
         else:
             return "data processing"
 
-    def create_pipeline_from_csv(self, db: Session, csv_file_path: str, filename: str) -> int:
+    def create_pipeline_from_csv(self, db: Session, csv_file_path: str, filename: str, streaming: bool = False,
+                                 backend: str = None, priority: str = None) -> int:
         """Create a pipeline based on uploaded CSV file"""
+        pipeline = self._build_csv_pipeline(db, csv_file_path, filename, streaming, backend, priority)
+        db.commit()
+        
+        print(f"Created pipeline {pipeline.id} for CSV file: {filename}")
+        return pipeline.id
+    
+    def create_pipelines_from_csv_files(self, db: Session, csv_file_paths: List[str], streaming: bool = False,
+                                        backend: str = None, priority: str = None) -> List[int]:
+        """Create one CSV pipeline per file in a single transaction"""
+        pipelines = [
+            self._build_csv_pipeline(db, csv_file_path, os.path.basename(csv_file_path), streaming, backend, priority)
+            for csv_file_path in csv_file_paths
+        ]
+        db.commit()
+        
+        print(f"Created {len(pipelines)} pipelines for CSV files")
+        return [pipeline.id for pipeline in pipelines]
+    
+    def _build_csv_pipeline(self, db: Session, csv_file_path: str, filename: str, streaming: bool = False,
+                            backend: str = None, priority: str = None) -> Pipeline:
+        """Add the standard CSV pipeline (blocks and dependencies) to the session without committing"""
+        # Classification blocks without a backend use the workers' INFERENCE_BACKEND; a priority routes their model
+        backend_config = {"backend": backend} if backend else {}
+        if priority:
+            backend_config["routing"] = {"priority": priority}
         # Create pipeline
         pipeline = Pipeline(
             name=f"Pipeline for {filename}",
-            description=f"CSV → Sentiment Analysis → Toxicity Detection → File Writers"
+            description="CSV → Sentiment Analysis → Toxicity Detection → File Writers"
         )
         db.add(pipeline)
-        db.commit()
+        db.flush()
         
         # Create blocks
         csv_block = Block(
@@ -540,7 +1283,7 @@ class Orchestrator:
             pipeline_id=pipeline.id,
             name="Sentiment Analysis",
             block_type=BlockType.SENTIMENT_ANALYSIS,
-            config={"purpose": "sentiment_processing"},
+            config={"purpose": "sentiment_processing", **backend_config},
             order=2
         )
         
@@ -548,7 +1291,7 @@ class Orchestrator:
             pipeline_id=pipeline.id,
             name="Toxicity Detection",
             block_type=BlockType.TOXICITY_DETECTION,
-            config={"purpose": "toxicity_processing"},
+            config={"purpose": "toxicity_processing", **backend_config},
             order=3
         )
         
@@ -577,16 +1320,16 @@ class Orchestrator:
         )
         
         db.add_all([csv_block, sentiment_block, toxicity_block, file_writer_sentiment, file_writer_toxicity])
-        db.commit()
+        db.flush()
         
-        # Create dependencies
-        sentiment_dep = BlockDependency(block_id=sentiment_block.id, depends_on_id=csv_block.id)
-        toxicity_dep = BlockDependency(block_id=toxicity_block.id, depends_on_id=csv_block.id)
-        file_sentiment_dep = BlockDependency(block_id=file_writer_sentiment.id, depends_on_id=sentiment_block.id)
-        file_toxicity_dep = BlockDependency(block_id=file_writer_toxicity.id, depends_on_id=toxicity_block.id)
+        # Create dependencies (streaming edges let every block start on the first micro-batch)
+        mode = EdgeMode.STREAM if streaming else EdgeMode.BATCH
+        sentiment_dep = BlockDependency(block_id=sentiment_block.id, depends_on_id=csv_block.id, mode=mode)
+        toxicity_dep = BlockDependency(block_id=toxicity_block.id, depends_on_id=csv_block.id, mode=mode)
+        file_sentiment_dep = BlockDependency(block_id=file_writer_sentiment.id, depends_on_id=sentiment_block.id, mode=mode)
+        file_toxicity_dep = BlockDependency(block_id=file_writer_toxicity.id, depends_on_id=toxicity_block.id, mode=mode)
         
         db.add_all([sentiment_dep, toxicity_dep, file_sentiment_dep, file_toxicity_dep])
-        db.commit()
+        db.flush()
         
-        print(f"Created pipeline {pipeline.id} for CSV file: {filename}")
-        return pipeline.id
\ No newline at end of file
+        return pipeline
\ No newline at end of file
@@ -0,0 +1,61 @@
+from typing import Dict, List, Optional
+import bisect
+import hashlib
+import os
+import time
+
+# Live orchestrator instances: sorted set of instance_id -> last heartbeat (unix time)
+INSTANCES_KEY = "orchestrator:instances"
+HEARTBEAT_INTERVAL = float(os.getenv("ORCHESTRATOR_HEARTBEAT_INTERVAL", 5))
+INSTANCE_TTL = float(os.getenv("ORCHESTRATOR_INSTANCE_TTL", 15))
+VIRTUAL_NODES = int(os.getenv("ORCHESTRATOR_VIRTUAL_NODES", 128))
+
+
+def _hash(key: str) -> int:
+    # Stable across processes, unlike the salted built-in hash()
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes; adding/removing a member only moves ~1/N of the keys"""
+
+    def __init__(self, members: List[str], virtual_nodes: int = VIRTUAL_NODES):
+        self.members = sorted(members)
+        self._ring: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for member in self.members:
+            for replica in range(virtual_nodes):
+                point = _hash(f"{member}#{replica}")
+                self._owners[point] = member
+                self._ring.append(point)
+        self._ring.sort()
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._ring, _hash(key)) % len(self._ring)
+        return self._owners[self._ring[index]]
+
+
+class InstanceRegistry:
+    """Heartbeat-based membership of orchestrator instances, kept in Redis"""
+
+    def __init__(self, redis_conn, instance_id: str):
+        self.redis_conn = redis_conn
+        self.instance_id = instance_id
+
+    def heartbeat(self) -> List[str]:
+        """Refresh this instance's heartbeat, drop expired instances and return the live ones"""
+        now = time.time()
+        pipe = self.redis_conn.pipeline()
+        pipe.zadd(INSTANCES_KEY, {self.instance_id: now})
+        pipe.zremrangebyscore(INSTANCES_KEY, "-inf", now - INSTANCE_TTL)
+        pipe.zrange(INSTANCES_KEY, 0, -1)
+        _, _, members = pipe.execute()
+        return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+    def deregister(self):
+        try:
+            self.redis_conn.zrem(INSTANCES_KEY, self.instance_id)
+        except Exception as e:
+            print(f"Error deregistering orchestrator instance: {e}")
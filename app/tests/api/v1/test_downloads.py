@@ -0,0 +1,77 @@
+from fastapi.testclient import TestClient
+
+from app.api.v1 import downloads
+from app.core import settings
+from app.models.pipeline import Block, BlockRun, BlockStatus, BlockType
+from workers.file_sink import open_file_sink
+
+DOWNLOADS = f"{settings.API_V1_STR}/downloads/pipeline"
+
+
+def _run_with_output(db, orchestrator, make_pipeline, file_info: dict) -> int:
+    """A pipeline run whose file writer block run completed with file_info"""
+    pipeline = make_pipeline(db, [BlockType.CSV_READER, BlockType.FILE_WRITER], [(1, 0)])
+    pipeline_run = orchestrator._insert_pipeline_runs(db, [pipeline.id])[0]
+    db.commit()
+    orchestrator.resolve_dag_and_dispatch(db, pipeline_run.id)
+    writer = db.query(BlockRun).join(Block).filter(
+        BlockRun.pipeline_run_id == pipeline_run.id, Block.block_type == BlockType.FILE_WRITER
+    ).one()
+    writer.status = BlockStatus.COMPLETED
+    writer.output_data = {"result": {"file_info": file_info}}
+    db.commit()
+    return pipeline_run.id
+
+
+def test_download_serves_files_inside_the_output_directory(pipelines_client: TestClient, db_session, orchestrator,
+                                                          make_pipeline, tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(downloads, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    with open_file_sink(str(tmp_path / "outputs" / "results"), "csv") as sink:
+        sink.write_rows([{"id": 1, "text": "good"}])
+    pipeline_run_id = _run_with_output(db_session, orchestrator, make_pipeline, sink.info())
+
+    files = pipelines_client.get(f"{DOWNLOADS}/{pipeline_run_id}/files").json()["files"]
+    assert [file["filename"] for file in files] == ["results.csv"]
+    response = pipelines_client.get(files[0]["download_url"])
+    assert response.status_code == 200
+    assert response.text.splitlines() == ["id,text,error", "1,good,"]
+
+    assert pipelines_client.get(f"{DOWNLOADS}/{pipeline_run_id}/file/missing.csv").status_code == 404
+    assert pipelines_client.get(f"{DOWNLOADS}/999/file/results.csv").status_code == 404
+    assert pipelines_client.get(f"{DOWNLOADS}/999/files").status_code == 404
+
+
+def test_download_rejects_paths_outside_the_output_directory(pipelines_client: TestClient, db_session, orchestrator,
+                                                            make_pipeline, tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(downloads, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    (tmp_path / "outputs").mkdir()
+    # A sibling directory sharing the output directory's name as a prefix
+    (tmp_path / "outputs-private").mkdir()
+    (tmp_path / "outputs-private" / "secret.csv").write_text("secret")
+    (tmp_path / "outputs" / "link.csv").symlink_to(tmp_path / "outputs-private" / "secret.csv")
+    pipeline_run_id = _run_with_output(db_session, orchestrator, make_pipeline, {"filename": "results.csv"})
+
+    # Dot segments are percent-encoded so the client sends them as they are
+    for filename in ["%2E%2E/outputs-private/secret.csv", "link.csv", str(tmp_path / "outputs-private" / "secret.csv"),
+                     "%2E%2E/outputs-private/absent.csv"]:
+        response = pipelines_client.get(f"{DOWNLOADS}/{pipeline_run_id}/file/{filename}")
+        assert response.status_code == 403, filename
+
+
+def test_parquet_output_lists_one_download_per_part_file(pipelines_client: TestClient, db_session, orchestrator,
+                                                         make_pipeline, tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(downloads, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    with open_file_sink(str(tmp_path / "outputs" / "results"), "parquet", partition_by="label") as sink:
+        sink.write_rows([{"id": 1, "label": "positive"}, {"id": 2, "label": "negative"}])
+    pipeline_run_id = _run_with_output(db_session, orchestrator, make_pipeline, sink.info())
+
+    files = pipelines_client.get(f"{DOWNLOADS}/{pipeline_run_id}/files").json()["files"]
+    assert [file["filename"] for file in files] == [
+        "results.parquet/label=negative/part-00000.parquet", "results.parquet/label=positive/part-00000.parquet",
+    ]
+    for file in files:
+        response = pipelines_client.get(file["download_url"])
+        assert response.status_code == 200
+        assert response.content.startswith(b"PAR1")
+    # The directory itself is not a file
+    assert pipelines_client.get(f"{DOWNLOADS}/{pipeline_run_id}/file/results.parquet").status_code == 404
@@ -0,0 +1,85 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.api.v1 import pipelines
+from app.core import settings
+from app.main import app
+from app.models.pipeline import BlockRun, BlockType
+
+
+def _pipeline(make_pipeline, db):
+    return make_pipeline(db, [BlockType.CSV_READER, BlockType.SENTIMENT_ANALYSIS], [(1, 0)])
+
+
+def test_batch_execute_endpoint(pipelines_client: TestClient, db_session, orchestrator, make_pipeline) -> None:
+    pipeline_ids = [_pipeline(make_pipeline, db_session).id for _ in range(2)]
+    response = pipelines_client.post(f"{settings.API_V1_STR}/pipelines/pipelines/batch-execute", json={"pipeline_ids": pipeline_ids})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_runs"] == 2
+    assert body["pipeline_ids"] == pipeline_ids
+    assert len(orchestrator.task_queue.enqueue_many_calls) == 1
+
+    response = pipelines_client.get(f"{settings.API_V1_STR}/pipelines/pipelines/batches/{body['batch_id']}")
+    assert response.status_code == 200
+    assert response.json()["total_runs"] == 2
+
+
+def test_batch_execute_endpoint_404s_on_unknown_pipeline(pipelines_client: TestClient) -> None:
+    response = pipelines_client.post(f"{settings.API_V1_STR}/pipelines/pipelines/batch-execute", json={"pipeline_ids": [999]})
+    assert response.status_code == 404
+
+
+def test_create_pipeline_endpoint(pipelines_client: TestClient) -> None:
+    response = pipelines_client.post(f"{settings.API_V1_STR}/pipelines/pipelines?streaming=true", json={})
+    assert response.status_code == 200
+    pipeline_id = response.json()
+
+    response = pipelines_client.get(f"{settings.API_V1_STR}/pipelines/pipelines")
+    assert [pipeline["id"] for pipeline in response.json()] == [pipeline_id]
+
+
+def test_pipeline_run_usage_endpoint(pipelines_client: TestClient, db_session, orchestrator, make_pipeline) -> None:
+    pipeline = _pipeline(make_pipeline, db_session)
+    pipeline_run = orchestrator.execute_pipelines_batch(db_session, [pipeline.id], "batch-usage")[0]
+    root = db_session.query(BlockRun).filter(BlockRun.pipeline_run_id == pipeline_run.id, BlockRun.remaining_dependencies == 0).one()
+    usage = {"llm_calls": 2, "prompt_tokens": 120, "completion_tokens": 8, "cost_usd": 0.25}
+    orchestrator.handle_block_completion(db_session, root.id, {"result": {"usage": usage}}, True)
+
+    response = pipelines_client.get(f"{settings.API_V1_STR}/pipelines/pipelines/runs/{pipeline_run.id}/usage")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["totals"]["llm_calls"] == 2
+    assert body["totals"]["prompt_tokens"] == 120
+    assert body["totals"]["cost_usd"] == 0.25
+    assert body["totals"]["llm_retries"] == 0
+    by_block_run = {block_run["block_run_id"]: block_run for block_run in body["block_runs"]}
+    assert by_block_run[root.id]["completion_tokens"] == 8
+    assert by_block_run[root.id]["status"] == "completed"
+    assert len(by_block_run) == 2
+
+    assert pipelines_client.get(f"{settings.API_V1_STR}/pipelines/pipelines/runs/999/usage").status_code == 404
+
+
+def test_orchestrator_starts_and_stops_with_the_app(monkeypatch) -> None:
+    calls = []
+
+    class RecordingOrchestrator:
+        def start(self):
+            calls.append("start")
+
+        def stop(self):
+            calls.append("stop")
+
+    monkeypatch.setattr(pipelines, "orchestrator", RecordingOrchestrator())
+    assert calls == []
+    with TestClient(app):
+        assert calls == ["start"]
+    assert calls == ["start", "stop"]
+
+
+def test_request_schemas_do_not_load_the_worker_stack() -> None:
+    script = "import sys, app.schemas.pipeline; assert 'workers.backends' not in sys.modules, 'workers.backends loaded'"
+    subprocess.run([sys.executable, "-c", script], check=True)
@@ -1,11 +1,20 @@
-from typing import Dict, Generator
+from typing import Callable, Dict, Generator
 
+import fakeredis
 import pytest
 
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+from app.api import deps
+from app.api.v1 import pipelines
+from app.database.base_class import Base
 from app.database.session import SessionLocal
 from app.main import app
+from app.models.pipeline import Block, BlockDependency, EdgeMode, Pipeline
+from app.services.orchestrator import Orchestrator
 
 
 @pytest.fixture(scope="session")
@@ -26,3 +35,117 @@ def random_product() -> Dict[str, str]:
         "name": "Test Product",
         "price": 80,
     }
+
+
+class FakeJob:
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def get_id(self) -> str:
+        return f"job-{id(self)}"
+
+
+class FakeQueue:
+    """Records the jobs an orchestrator enqueues; fail_next makes that many enqueue calls raise"""
+
+    def __init__(self):
+        self.jobs = []
+        self.enqueue_many_calls = []
+        self.fail_next = 0
+
+    def _check_failure(self):
+        if self.fail_next:
+            self.fail_next -= 1
+            raise ConnectionError("queue unavailable")
+
+    def enqueue_call(self, func, args=None, **kwargs):
+        self._check_failure()
+        job = FakeJob(func, args)
+        self.jobs.append(job)
+        return job
+
+    def enqueue_many(self, job_datas):
+        self._check_failure()
+        jobs = [FakeJob(job_data.func, job_data.args) for job_data in job_datas]
+        self.enqueue_many_calls.append(jobs)
+        self.jobs.extend(jobs)
+        return jobs
+
+
+class FakeKafka:
+    def __init__(self):
+        self.events = []
+
+    def publish_event(self, topic: str, event_data: dict, key: str = None, flush: bool = True):
+        self.events.append((topic, event_data))
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def session_factory() -> Generator:
+    """Sessions on a fresh in-memory SQLite database with every table"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(session_factory) -> Generator:
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def orchestrator(session_factory) -> Generator:
+    """Orchestrator on fakeredis and the in-memory database, with a recording queue and Kafka client"""
+    orchestrator = Orchestrator(redis_conn=fakeredis.FakeRedis(), session_factory=session_factory)
+    orchestrator.task_queue = FakeQueue()
+    orchestrator.kafka_client = FakeKafka()
+    yield orchestrator
+    orchestrator.plan_cache.close()
+
+
+@pytest.fixture
+def pipelines_client(session_factory, orchestrator, monkeypatch) -> Generator:
+    """API client whose pipeline routes use the in-memory database and the test orchestrator"""
+    def get_db() -> Generator:
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(pipelines, "orchestrator", orchestrator)
+    app.dependency_overrides[deps.get_db] = get_db
+    # Not entered as a context manager: startup would start the orchestrator's background threads
+    yield TestClient(app)
+    app.dependency_overrides.pop(deps.get_db, None)
+
+
+@pytest.fixture
+def make_pipeline() -> Callable:
+    """Build a pipeline from blocks (type or (type, config)) and (block, depends_on[, mode]) edges by index"""
+    def make(db, blocks: list, edges: list) -> Pipeline:
+        pipeline = Pipeline(name="Test Pipeline")
+        db.add(pipeline)
+        db.flush()
+        block_rows = []
+        for order, block in enumerate(blocks, start=1):
+            block_type, config = block if isinstance(block, tuple) else (block, {})
+            block_rows.append(Block(pipeline_id=pipeline.id, name=f"{block_type.value} {order}", block_type=block_type,
+                                    config=config, order=order))
+        db.add_all(block_rows)
+        db.flush()
+        db.add_all([
+            BlockDependency(block_id=block_rows[edge[0]].id, depends_on_id=block_rows[edge[1]].id,
+                            mode=edge[2] if len(edge) > 2 else EdgeMode.BATCH)
+            for edge in edges
+        ])
+        db.commit()
+        return pipeline
+    return make
@@ -0,0 +1,36 @@
+import pytest
+
+from app.models.pipeline import BlockRun, BlockStatus, BlockType, PipelineRun
+from workers.universal_worker import process_task
+
+
+def _diamond(make_pipeline, db):
+    return make_pipeline(db, [BlockType.CSV_READER, BlockType.SENTIMENT_ANALYSIS, BlockType.TOXICITY_DETECTION],
+                         [(1, 0), (2, 0)])
+
+
+def test_batch_claims_roots_and_enqueues_them_in_one_call(db_session, orchestrator, make_pipeline) -> None:
+    pipelines = [_diamond(make_pipeline, db_session) for _ in range(3)]
+    pipeline_runs = orchestrator.execute_pipelines_batch(db_session, [pipeline.id for pipeline in pipelines], "batch-1")
+
+    assert len(pipeline_runs) == 3
+    assert {pipeline_run.batch_id for pipeline_run in pipeline_runs} == {"batch-1"}
+    # Every root job went through a single enqueue_many (one Redis round-trip)
+    assert len(orchestrator.task_queue.enqueue_many_calls) == 1
+    jobs = orchestrator.task_queue.enqueue_many_calls[0]
+    assert len(jobs) == 3
+    assert all(job.func is process_task for job in jobs)
+
+    db_session.expire_all()
+    roots = db_session.query(BlockRun).filter(BlockRun.remaining_dependencies == 0).order_by(BlockRun.id).all()
+    assert [job.args[0] for job in jobs] == [block_run.id for block_run in roots]
+    assert {block_run.status for block_run in roots} == {BlockStatus.RUNNING}
+    assert db_session.query(BlockRun).filter(BlockRun.status == BlockStatus.PENDING).count() == 6
+
+
+def test_batch_rejects_unknown_pipelines(db_session, orchestrator, make_pipeline) -> None:
+    pipeline = _diamond(make_pipeline, db_session)
+    with pytest.raises(ValueError):
+        orchestrator.execute_pipelines_batch(db_session, [pipeline.id, pipeline.id + 100], "batch-2")
+    assert db_session.query(PipelineRun).count() == 0
+    assert orchestrator.task_queue.jobs == []
@@ -0,0 +1,40 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.services import csv_upload
+from app.services.csv_upload import UploadRejected, save_csv_upload
+from workers.csv_index import load_row_index
+
+
+def _upload(filename: str, data: bytes) -> UploadFile:
+    upload = UploadFile(filename)
+    upload.file = io.BytesIO(data)
+    return upload
+
+
+def test_upload_is_hashed_counted_and_indexed_while_streamed(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(csv_upload, "UPLOAD_CHUNK_BYTES", 7)
+    data = b'id,text\n1,"multi\nline"\n2,plain\n3,last\n'
+
+    upload = asyncio.run(save_csv_upload(_upload("../input.csv", data), str(tmp_path)))
+
+    assert upload["file_path"] == str(tmp_path / "input.csv")
+    assert upload["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (upload["size_bytes"], upload["row_count"], upload["columns"]) == (len(data), 3, ["id", "text"])
+    assert load_row_index(upload["file_path"])["row_count"] == 3
+    assert [path.name for path in tmp_path.iterdir() if not path.name.endswith(".rowidx.json")] == ["input.csv"]
+
+
+def test_oversized_upload_is_rejected_and_removed(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(csv_upload, "UPLOAD_CHUNK_BYTES", 4)
+    monkeypatch.setattr(csv_upload, "UPLOAD_MAX_BYTES", 10)
+
+    with pytest.raises(UploadRejected) as rejected:
+        asyncio.run(save_csv_upload(_upload("big.csv", b"text\n" + b"row\n" * 5), str(tmp_path)))
+
+    assert rejected.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,82 @@
+import fakeredis
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.pipeline import Block, BlockDependency, BlockType, EdgeMode
+from app.services.dag_plan import PLAN_VERSION_KEY, DagPlan, DagPlanCache, RunMap
+
+
+def test_plan_builds_reverse_edges_and_levels() -> None:
+    # csv -> (sentiment, toxicity) -> (writer_s, writer_t)
+    plan = DagPlan(1, [10, 11, 12, 13, 14], {11: [10], 12: [10], 13: [11], 14: [12]})
+    assert plan.roots == [10]
+    assert plan.successors[10] == [11, 12]
+    assert plan.levels == [[10], [11, 12], [13, 14]]
+    assert plan.indegree(13) == 1
+
+
+def test_plan_round_trips_through_dict() -> None:
+    plan = DagPlan(1, [10, 11, 12], {11: [10], 12: [10, 11]}, version=3)
+    restored = DagPlan.from_dict(plan.to_dict())
+    assert restored.version == 3
+    assert restored.dependencies == plan.dependencies
+    assert restored.levels == [[10], [11], [12]]
+
+
+def test_plan_rejects_cycles() -> None:
+    with pytest.raises(ValueError):
+        DagPlan(1, [1, 2], {1: [2], 2: [1]})
+
+
+def test_run_map_round_trips_through_dict() -> None:
+    run_map = RunMap(5, 1, {10: 100, 11: 101})
+    assert RunMap.from_dict(run_map.to_dict()).block_runs == {10: 100, 11: 101}
+
+
+def test_stream_edges_split_successors_by_mode() -> None:
+    plan = DagPlan(1, [10, 11, 12], {11: [10], 12: [10]}, stream_edges=[(11, 10)])
+    assert plan.successors_by_mode(10, stream=True) == [11]
+    assert plan.successors_by_mode(10, stream=False) == [12]
+    assert DagPlan.from_dict(plan.to_dict()).stream_upstream == {11: 10}
+
+
+def test_siblings_share_the_same_batch_inputs() -> None:
+    plan = DagPlan(1, [10, 11, 12, 13, 14], {11: [10], 12: [10], 13: [10, 11], 14: [10]}, stream_edges=[(14, 10)])
+    assert plan.siblings(11) == [12]
+    assert plan.siblings(13) == []
+    assert plan.siblings(14) == []
+    assert plan.siblings(10) == []
+
+
+def test_committed_structure_edits_rebuild_the_plan(session_factory, db_session, make_pipeline) -> None:
+    cache = DagPlanCache(fakeredis.FakeRedis(), session_factory)
+    pipeline = make_pipeline(db_session, [BlockType.CSV_READER, BlockType.SENTIMENT_ANALYSIS, BlockType.FILE_WRITER], [(1, 0)])
+    before = cache.get_plan(db_session, pipeline.id)
+    _, sentiment_id, writer_id = before.block_order
+    assert before.dependencies[writer_id] == []
+
+    db_session.add(BlockDependency(block_id=writer_id, depends_on_id=sentiment_id))
+    db_session.commit()
+    plan = cache.get_plan(db_session, pipeline.id)
+    assert plan.version == before.version + 1
+    assert plan.dependencies[writer_id] == [sentiment_id]
+
+    dependency = db_session.query(BlockDependency).filter(BlockDependency.block_id == writer_id).one()
+    dependency.mode = EdgeMode.STREAM
+    db_session.commit()
+    plan = cache.get_plan(db_session, pipeline.id)
+    assert plan.stream_upstream == {writer_id: sentiment_id}
+
+    # Once closed, the cache no longer listens to the session factory
+    cache.close()
+    db_session.query(Block).filter(Block.id == writer_id).one().order = 0
+    db_session.commit()
+    assert cache.get_plan(db_session, pipeline.id).version == plan.version
+
+
+def test_plan_cache_only_listens_to_its_session_factory(session_factory, db_session, make_pipeline) -> None:
+    redis_conn = fakeredis.FakeRedis()
+    cache = DagPlanCache(redis_conn, sessionmaker())
+    pipeline = make_pipeline(db_session, [BlockType.CSV_READER], [])
+    cache.close()
+    assert redis_conn.get(PLAN_VERSION_KEY.format(pipeline_id=pipeline.id)) is None
@@ -0,0 +1,268 @@
+import json
+from typing import Generator, List
+
+import pytest
+
+from app.models.pipeline import Block, BlockDependency, BlockRun, BlockStatus, BlockType, EdgeMode, PipelineRun, PipelineStatus
+from app.services import orchestrator as orchestrator_module
+from app.services.orchestrator import COMPLETION_GROUP, Orchestrator
+from app.tests.conftest import FakeKafka, FakeQueue
+from workers.universal_worker import (
+    COMPLETION_PARTITIONS,
+    WorkerRedisClient,
+    completion_partition_for,
+    completion_stream_for_partition,
+    merge_shards,
+)
+
+NO_FUSE = {"fuse": False}
+
+
+def _start_run(db, orchestrator, pipeline) -> PipelineRun:
+    pipeline_run = orchestrator._insert_pipeline_runs(db, [pipeline.id])[0]
+    db.commit()
+    orchestrator.resolve_dag_and_dispatch(db, pipeline_run.id)
+    return pipeline_run
+
+
+def _block_runs(db, pipeline_run) -> List[BlockRun]:
+    """Block runs of a run in block order, freshly loaded"""
+    db.expire_all()
+    return db.query(BlockRun).join(Block).filter(
+        BlockRun.pipeline_run_id == pipeline_run.id
+    ).order_by(Block.order).all()
+
+
+def _dispatches(orchestrator, block_run: BlockRun) -> int:
+    return sum(1 for job in orchestrator.task_queue.jobs if job.args[0] == block_run.id)
+
+
+def _complete(db, orchestrator, block_run: BlockRun, success: bool = True):
+    result = {"result": {"status": "ok"}} if success else {"error": "boom"}
+    orchestrator.handle_block_completion(db, block_run.id, result, success)
+
+
+def test_diamond_join_fires_exactly_once(db_session, orchestrator, make_pipeline) -> None:
+    # csv -> (sentiment, toxicity) -> writer
+    pipeline = make_pipeline(db_session, [
+        BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE), (BlockType.TOXICITY_DETECTION, NO_FUSE), BlockType.FILE_WRITER,
+    ], [(1, 0), (2, 0), (3, 1), (3, 2)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, sentiment, toxicity, writer = _block_runs(db_session, pipeline_run)
+    assert [br.status for br in (csv, sentiment, toxicity, writer)] == [
+        BlockStatus.RUNNING, BlockStatus.PENDING, BlockStatus.PENDING, BlockStatus.PENDING
+    ]
+
+    _complete(db_session, orchestrator, csv)
+    _complete(db_session, orchestrator, sentiment)
+    _, _, _, writer = _block_runs(db_session, pipeline_run)
+    assert writer.status == BlockStatus.PENDING
+    assert writer.remaining_dependencies == 1
+
+    _complete(db_session, orchestrator, toxicity)
+    _, _, _, writer = _block_runs(db_session, pipeline_run)
+    assert writer.status == BlockStatus.RUNNING
+    assert writer.remaining_dependencies == 0
+    assert _dispatches(orchestrator, writer) == 1
+
+    _complete(db_session, orchestrator, writer)
+    db_session.expire_all()
+    pipeline_run = db_session.get(PipelineRun, pipeline_run.id)
+    assert pipeline_run.status == PipelineStatus.COMPLETED
+    assert pipeline_run.remaining_blocks == 0
+    assert [br.id for br in _block_runs(db_session, pipeline_run)] == [job.args[0] for job in orchestrator.task_queue.jobs]
+
+
+def test_failure_cascades_to_successors(db_session, orchestrator, make_pipeline) -> None:
+    # csv -> sentiment -> writer, csv -> toxicity
+    pipeline = make_pipeline(db_session, [
+        BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE), (BlockType.TOXICITY_DETECTION, NO_FUSE), BlockType.FILE_WRITER,
+    ], [(1, 0), (2, 0), (3, 1)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, sentiment, _, _ = _block_runs(db_session, pipeline_run)
+    _complete(db_session, orchestrator, csv)
+    _complete(db_session, orchestrator, sentiment, success=False)
+
+    _, sentiment, toxicity, writer = _block_runs(db_session, pipeline_run)
+    assert sentiment.status == BlockStatus.FAILED
+    assert writer.status == BlockStatus.FAILED
+    assert f"Upstream block run {sentiment.id} failed" in writer.error_message
+    assert _dispatches(orchestrator, writer) == 0
+    # The independent branch already running is left to finish
+    assert toxicity.status == BlockStatus.RUNNING
+    assert db_session.get(PipelineRun, pipeline_run.id).status == PipelineStatus.FAILED
+    failed_events = [event["block_run_id"] for topic, event in orchestrator.kafka_client.events if event["event_type"] == "block_failed"]
+    assert failed_events == [sentiment.id, writer.id]
+
+
+def test_duplicate_completions_do_not_double_decrement(db_session, orchestrator, make_pipeline) -> None:
+    pipeline = make_pipeline(db_session, [BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE)], [(1, 0)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, _ = _block_runs(db_session, pipeline_run)
+
+    result = {"result": {"status": "ok"}}
+    orchestrator.handle_block_completions(db_session, [(csv.id, result, True), (csv.id, result, True)])
+    _complete(db_session, orchestrator, csv)
+
+    _, sentiment = _block_runs(db_session, pipeline_run)
+    assert sentiment.remaining_dependencies == 0
+    assert _dispatches(orchestrator, sentiment) == 1
+    assert db_session.get(PipelineRun, pipeline_run.id).remaining_blocks == 1
+
+
+def test_redelivered_completion_reschedules_after_dispatch_failure(db_session, orchestrator, make_pipeline) -> None:
+    pipeline = make_pipeline(db_session, [BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE)], [(1, 0)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, _ = _block_runs(db_session, pipeline_run)
+
+    orchestrator.task_queue.fail_next = 1
+    with pytest.raises(ConnectionError):
+        _complete(db_session, orchestrator, csv)
+    csv, sentiment = _block_runs(db_session, pipeline_run)
+    assert csv.status == BlockStatus.COMPLETED
+    assert sentiment.status == BlockStatus.PENDING
+    assert sentiment.remaining_dependencies == 0
+
+    # The event was not acknowledged, so it comes back
+    _complete(db_session, orchestrator, csv)
+    _, sentiment = _block_runs(db_session, pipeline_run)
+    assert sentiment.status == BlockStatus.RUNNING
+    assert sentiment.remaining_dependencies == 0
+    assert _dispatches(orchestrator, sentiment) == 1
+    assert db_session.get(PipelineRun, pipeline_run.id).remaining_blocks == 1
+
+    _complete(db_session, orchestrator, sentiment)
+    _complete(db_session, orchestrator, sentiment)
+    db_session.expire_all()
+    assert db_session.get(PipelineRun, pipeline_run.id).status == PipelineStatus.COMPLETED
+    finished = [event for topic, event in orchestrator.kafka_client.events if topic == "pipeline_events"
+                and event["event_type"] != "pipeline_started"]
+    assert len(finished) == 1
+
+
+@pytest.fixture
+def peer(orchestrator, session_factory) -> Generator:
+    """A second orchestrator instance sharing the first one's Redis and database"""
+    peer = Orchestrator(redis_conn=orchestrator.redis_conn, session_factory=session_factory)
+    peer.task_queue = FakeQueue()
+    peer.kafka_client = FakeKafka()
+    yield peer
+    peer.plan_cache.close()
+
+
+def test_live_instances_own_disjoint_partitions_covering_all(orchestrator, peer) -> None:
+    orchestrator.registry.heartbeat()
+    live = peer.registry.heartbeat()
+    assert live == sorted([orchestrator.instance_id, peer.instance_id])
+    orchestrator._refresh_ownership(live)
+    peer._refresh_ownership(live)
+
+    assert orchestrator.owned_partitions and peer.owned_partitions
+    assert not set(orchestrator.owned_partitions) & set(peer.owned_partitions)
+    assert sorted(orchestrator.owned_partitions + peer.owned_partitions) == list(range(COMPLETION_PARTITIONS))
+
+
+def test_pending_completions_move_to_the_new_owner(db_session, orchestrator, peer, make_pipeline, monkeypatch) -> None:
+    pipeline = make_pipeline(db_session, [BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE)], [(1, 0)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, _ = _block_runs(db_session, pipeline_run)
+    publisher = WorkerRedisClient()
+    publisher.redis_client = orchestrator.redis_conn
+    publisher.publish_block_completion(csv.id, {"result": {"status": "ok"}}, True, pipeline_run.id)
+
+    orchestrator.registry.heartbeat()
+    live = peer.registry.heartbeat()
+    for instance in (orchestrator, peer):
+        instance._refresh_ownership(live)
+    partition = completion_partition_for(pipeline_run.id)
+    stream = completion_stream_for_partition(partition)
+    owner, successor = (orchestrator, peer) if partition in orchestrator.owned_partitions else (peer, orchestrator)
+
+    # The owner reads the event and dies before acknowledging it
+    owner._ensure_consumer_group(stream)
+    response = owner.redis_conn.xreadgroup(COMPLETION_GROUP, owner.instance_id, {stream: ">"}, count=10)
+    assert len(response[0][1]) == 1
+    owner.registry.deregister()
+
+    successor._refresh_ownership(successor.registry.heartbeat())
+    assert partition in successor.owned_partitions
+    monkeypatch.setattr(orchestrator_module, "COMPLETION_RECLAIM_IDLE_MS", 0)
+    entries = successor._reclaim_pending_events(stream)
+    assert len(entries) == 1
+    successor._process_completion_entries(stream, entries)
+
+    assert successor.redis_conn.xpending(stream, COMPLETION_GROUP)["pending"] == 0
+    csv, sentiment = _block_runs(db_session, pipeline_run)
+    assert csv.status == BlockStatus.COMPLETED
+    assert sentiment.status == BlockStatus.RUNNING
+    assert _dispatches(successor, sentiment) == 1
+
+
+@pytest.mark.parametrize("streaming, mode", [(False, EdgeMode.BATCH), (True, EdgeMode.STREAM)])
+def test_sample_pipeline_edges_follow_streaming_flag(db_session, orchestrator, streaming, mode) -> None:
+    pipeline_id = orchestrator.create_sample_pipeline(db_session, streaming)
+    blocks = db_session.query(Block).filter(Block.pipeline_id == pipeline_id).all()
+    dependencies = db_session.query(BlockDependency).filter(BlockDependency.block_id.in_([block.id for block in blocks])).all()
+    assert len(blocks) == 5
+    assert len(dependencies) == 4
+    assert {dependency.mode for dependency in dependencies} == {mode}
+
+
+def _merges(orchestrator, block_run: BlockRun) -> int:
+    return sum(1 for job in orchestrator.task_queue.jobs if job.func is merge_shards and job.args[0] == block_run.id)
+
+
+def test_merge_is_enqueued_once_when_redelivered_after_enqueue_failure(db_session, orchestrator, make_pipeline, monkeypatch) -> None:
+    monkeypatch.setattr(orchestrator_module, "SHARD_MIN_ROWS", 2)
+    monkeypatch.setattr(orchestrator_module, "SHARD_TARGET_ROWS", 2)
+    pipeline = make_pipeline(db_session, [
+        BlockType.CSV_READER, (BlockType.SENTIMENT_ANALYSIS, NO_FUSE), (BlockType.TOXICITY_DETECTION, NO_FUSE),
+    ], [(1, 0), (2, 0)])
+    pipeline_run = _start_run(db_session, orchestrator, pipeline)
+    csv, _, _ = _block_runs(db_session, pipeline_run)
+    orchestrator.handle_block_completion(db_session, csv.id, {"result": {
+        "data_type": "csv_data", "row_count": 4, "artifact": {"path": "csv.json", "format": "json"},
+    }}, True)
+    _, sentiment, toxicity = _block_runs(db_session, pipeline_run)
+    assert sentiment.shards_total == toxicity.shards_total == 2
+
+    shard_events = [(block_run.id, index, {"result": {"status": "ok"}}, True) for block_run in (sentiment, toxicity) for index in (0, 1)]
+    # The first merge cannot be enqueued; the second one still is
+    orchestrator.task_queue.fail_next = 1
+    with pytest.raises(ConnectionError):
+        orchestrator.handle_shard_completions(db_session, shard_events)
+    _, sentiment, toxicity = _block_runs(db_session, pipeline_run)
+    assert (_merges(orchestrator, sentiment), _merges(orchestrator, toxicity)) == (0, 1)
+    assert sentiment.status == BlockStatus.RUNNING
+    assert sentiment.shards_remaining == 0
+
+    # The batch was not acknowledged, so it comes back, twice
+    orchestrator.handle_shard_completions(db_session, shard_events)
+    orchestrator.handle_shard_completions(db_session, shard_events)
+    assert (_merges(orchestrator, sentiment), _merges(orchestrator, toxicity)) == (1, 1)
+
+
+def test_poison_event_is_dead_lettered_alone(db_session, orchestrator, make_pipeline, monkeypatch) -> None:
+    pipelines = [make_pipeline(db_session, [BlockType.CSV_READER], []) for _ in range(3)]
+    roots = [_block_runs(db_session, _start_run(db_session, orchestrator, pipeline))[0] for pipeline in pipelines]
+    stream = completion_stream_for_partition(0)
+    orchestrator._ensure_consumer_group(stream)
+    events = [{"event_type": "block_completed", "block_run_id": root.id, "result_data": {"result": {}}, "success": True} for root in roots]
+    # A success whose result_data is not a mapping fails however often it is applied
+    events.insert(1, {"event_type": "block_completed", "block_run_id": roots[1].id, "result_data": "oops", "success": True})
+    for event in events:
+        orchestrator.redis_conn.xadd(stream, {"event": json.dumps(event)})
+
+    response = orchestrator.redis_conn.xreadgroup(COMPLETION_GROUP, orchestrator.instance_id, {stream: ">"}, count=10)
+    orchestrator._process_completion_entries(stream, response[0][1])
+
+    assert [block_run.status for block_run in (_block_runs(db_session, root.pipeline_run)[0] for root in roots)] == [BlockStatus.COMPLETED] * 3
+    assert orchestrator.redis_conn.xpending(stream, COMPLETION_GROUP)["pending"] == 1
+
+    monkeypatch.setattr(orchestrator_module, "COMPLETION_RECLAIM_IDLE_MS", 0)
+    monkeypatch.setattr(orchestrator_module, "COMPLETION_MAX_DELIVERIES", 1)
+    orchestrator._process_completion_entries(stream, orchestrator._reclaim_pending_events(stream))
+    assert orchestrator._reclaim_pending_events(stream) == []
+    assert orchestrator.redis_conn.xpending(stream, COMPLETION_GROUP)["pending"] == 0
+    dead = orchestrator.redis_conn.xrange(f"{orchestrator_module.COMPLETION_STREAM}:dead")
+    assert [json.loads(fields[b"event"])["result_data"] for _, fields in dead] == ["oops"]
@@ -0,0 +1,19 @@
+from app.services.partitioning import HashRing
+
+
+def test_ring_assigns_every_key_to_a_member() -> None:
+    ring = HashRing(["a", "b", "c"])
+    owners = {ring.owner(str(partition)) for partition in range(64)}
+    assert owners == {"a", "b", "c"}
+
+
+def test_ring_only_moves_keys_of_removed_member() -> None:
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b"])
+    for key in map(str, range(500)):
+        if before.owner(key) != "c":
+            assert after.owner(key) == before.owner(key)
+
+
+def test_empty_ring_has_no_owner() -> None:
+    assert HashRing([]).owner("1") is None
@@ -0,0 +1,98 @@
+import pytest
+
+from workers import artifact_store
+from workers.artifact_store import ArtifactStore
+
+
+def test_identical_payloads_share_one_artifact(tmp_path) -> None:
+    store = ArtifactStore(str(tmp_path))
+    first = store.put_json({"texts": ["a", "b"]})
+    second = store.put_json({"texts": ["a", "b"]})
+    assert first == second
+    assert first["path"].startswith(str(tmp_path))
+    assert store.get_json(first) == {"texts": ["a", "b"]}
+    assert len(list(tmp_path.rglob("*.json"))) == 1
+
+
+def test_table_batches_read_back_as_columns(tmp_path) -> None:
+    store = ArtifactStore(str(tmp_path))
+    with store.table_writer({"text_column": "text"}) as writer:
+        writer.write_batch({"texts": ["a", "b"], "ids": ["1", "2"]})
+        writer.write_batch({"texts": [], "ids": []})
+        writer.write_batch({"texts": ["c"], "ids": ["3"]})
+    assert store.get(writer.ref) == {"text_column": "text", "texts": ["a", "b", "c"], "ids": ["1", "2", "3"]}
+    assert store.get(writer.ref, ["texts"])["texts"] == ["a", "b", "c"]
+
+
+def test_json_tables_read_back_as_columns(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(artifact_store, "ARTIFACT_TABLE_FORMAT", "json")
+    store = ArtifactStore(str(tmp_path))
+    with store.table_writer({"text_column": "text"}) as writer:
+        writer.write_batch({"texts": ["a", "b"]})
+        writer.write_batch({"texts": ["c"]})
+    assert writer.ref["format"] == "json"
+    assert store.get(writer.ref) == {"text_column": "text", "texts": ["a", "b", "c"]}
+    assert list(store.iter_column(writer.ref, "texts", 2, start=1)) == [["b", "c"]]
+
+
+def test_arrow_tables_are_memory_mapped_columns(tmp_path, monkeypatch) -> None:
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(artifact_store, "ARTIFACT_TABLE_FORMAT", "arrow")
+    store = ArtifactStore(str(tmp_path))
+    ref = store.put_table({"texts": ["a", "b", "c", "d"], "ids": ["1", "2", "3", "4"]}, {"text_column": "text"})
+
+    assert ref["format"] == "arrow"
+    table = store.read_table(ref, ["texts"])
+    assert isinstance(table, pa.Table)
+    assert table.column_names == ["texts"]
+    assert [batch for batch in store.iter_column(ref, "texts", 2)] == [["a", "b"], ["c", "d"]]
+    assert [text for batch in store.iter_column(ref, "texts", 10, start=1, stop=3) for text in batch] == ["b", "c"]
+    assert list(store.iter_column(ref, "missing", 2)) == []
+
+
+def test_arrow_schema_widens_for_new_struct_fields_and_columns(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(artifact_store, "ARTIFACT_TABLE_FORMAT", "arrow")
+    store = ArtifactStore(str(tmp_path))
+    with store.table_writer() as writer:
+        writer.write_batch({"results": [{"text": "a", "sentiment": "POSITIVE"}], "note": [None]})
+        # An error result adds a struct field, the note column gets a type and a score column appears
+        writer.write_batch({"results": [{"text": "b", "sentiment": "NEUTRAL", "error": "timeout"}], "note": ["retried"],
+                            "score": [0.5]})
+        writer.write_batch({"results": [{"text": "c", "sentiment": "NEGATIVE"}], "note": [None], "score": [1]})
+
+    assert store.get(writer.ref) == {
+        "results": [
+            {"text": "a", "sentiment": "POSITIVE", "error": None},
+            {"text": "b", "sentiment": "NEUTRAL", "error": "timeout"},
+            {"text": "c", "sentiment": "NEGATIVE", "error": None},
+        ],
+        "note": [None, "retried", None],
+        "score": [None, 0.5, 1.0],
+    }
+    # The widened file replaced the first one: nothing partial is left behind
+    assert len(list(tmp_path.rglob("*.arrow"))) == 1
+    assert list(tmp_path.rglob("*.tmp")) == []
+
+
+def test_arrow_append_copies_tables_of_differing_schemas(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(artifact_store, "ARTIFACT_TABLE_FORMAT", "arrow")
+    store = ArtifactStore(str(tmp_path))
+    first = store.put_table({"results": [{"text": "a"}], "texts": ["a"]})
+    second = store.put_table({"results": [{"text": "b", "error": "boom"}], "texts": ["b"]})
+    with store.table_writer() as merged:
+        merged.append(first)
+        merged.append(second)
+    assert store.get(merged.ref) == {"results": [{"text": "a", "error": None}, {"text": "b", "error": "boom"}], "texts": ["a", "b"]}
+
+
+def test_failed_arrow_writer_leaves_nothing(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(artifact_store, "ARTIFACT_TABLE_FORMAT", "arrow")
+    store = ArtifactStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with store.table_writer() as writer:
+            writer.write_batch({"texts": ["a"]})
+            raise RuntimeError("boom")
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == []
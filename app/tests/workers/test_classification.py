@@ -0,0 +1,27 @@
+import pytest
+
+from workers.classification import SENTIMENT, MalformedBatchResponse, pack_texts
+
+
+def test_pack_texts_bounds_count_and_tokens() -> None:
+    assert pack_texts(["a", "b", "c", "d", "e"], max_items=2, token_budget=1000) == [["a", "b"], ["c", "d"], ["e"]]
+    # An oversized text still gets a group of its own
+    assert pack_texts(["x" * 4000, "a", "b"], max_items=25, token_budget=500) == [["x" * 4000], ["a", "b"]]
+
+
+def test_parse_labels_validates_count_order_and_labels() -> None:
+    assert SENTIMENT.parse_labels('{"labels": [{"id": 1, "label": "positive"}, {"id": 2, "label": "NEUTRAL"}]}', 2) == ["POSITIVE", "NEUTRAL"]
+
+    for content in (
+        "not json",
+        '{"labels": [{"id": 1, "label": "POSITIVE"}]}',
+        '{"labels": [{"id": 2, "label": "POSITIVE"}, {"id": 1, "label": "POSITIVE"}]}',
+        '{"labels": [{"id": 1, "label": "POSITIVE"}, {"id": 2, "label": "HAPPY"}]}',
+    ):
+        with pytest.raises(MalformedBatchResponse):
+            SENTIMENT.parse_labels(content, 2)
+
+
+def test_llm_results_do_not_claim_a_confidence() -> None:
+    assert SENTIMENT.result("great", "POSITIVE") == {"text": "great", "sentiment": "POSITIVE"}
+    assert "confidence" not in SENTIMENT.error_result("great", ValueError("boom"))
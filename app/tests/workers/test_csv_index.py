@@ -0,0 +1,26 @@
+import pandas as pd
+
+from workers.csv_index import build_row_index, ensure_row_index, index_path, read_row_range
+
+
+def test_row_ranges_match_a_full_parse_across_quoted_newlines(tmp_path) -> None:
+    csv_path = tmp_path / "input.csv"
+    texts = ["plain", "with, comma", 'multi\nline "quoted"', "", "last"] * 5
+    pd.DataFrame({"id": range(len(texts)), "text": texts}).to_csv(csv_path, index=False)
+
+    index = build_row_index(str(csv_path), every=3)
+
+    assert index["row_count"] == len(texts)
+    for start, end in [(0, 25), (4, 11), (9, 12), (24, 30)]:
+        rows = read_row_range(str(csv_path), index, ["id", "text"], ["text"], start, end)
+        assert rows["text"].tolist() == texts[start:end]
+
+
+def test_index_is_persisted_next_to_the_file_and_rebuilt_when_it_changes(tmp_path) -> None:
+    csv_path = tmp_path / "input.csv"
+    csv_path.write_text("text\na\nb\n")
+    assert ensure_row_index(str(csv_path))["row_count"] == 2
+    assert (tmp_path / "input.csv.rowidx.json").exists() and index_path(str(csv_path)).endswith(".rowidx.json")
+
+    csv_path.write_text("text\na\nb\nc\n")
+    assert ensure_row_index(str(csv_path))["row_count"] == 3
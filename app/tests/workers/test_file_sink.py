@@ -0,0 +1,100 @@
+import csv
+import gzip
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+import zstandard
+
+from workers import file_sink
+from workers.file_sink import open_file_sink
+
+ROWS = [
+    {"id": 1, "text": "good", "sentiment_label": "positive"},
+    {"id": 2, "text": "bad", "sentiment_label": "negative"},
+    {"id": 3, "text": "fine", "sentiment_label": "positive"},
+]
+
+
+def _read_text(path: str, output_format: str) -> str:
+    if output_format == "csv.gz":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        data = f.read()
+    if output_format == "csv.zst":
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return data.decode("utf-8")
+
+
+@pytest.mark.parametrize("output_format", ["csv", "csv.gz", "csv.zst"])
+def test_csv_formats_round_trip_across_batches(tmp_path, output_format) -> None:
+    with open_file_sink(str(tmp_path / "results"), output_format) as sink:
+        sink.write_rows(ROWS[:2])
+        sink.write_rows(ROWS[2:])
+
+    info = sink.info()
+    assert info["filename"] == f"results.{output_format}"
+    assert info["format"] == output_format
+    assert info["records_written"] == 3
+    assert info["file_size_bytes"] > 0
+    rows = list(csv.DictReader(io.StringIO(_read_text(info["output_path"], output_format))))
+    assert [row["text"] for row in rows] == ["good", "bad", "fine"]
+    assert list(rows[0]) == ["id", "text", "sentiment_label", "error"]
+    assert [path.name for path in tmp_path.iterdir()] == [info["filename"]]
+
+
+def test_jsonl_keeps_every_key(tmp_path) -> None:
+    with open_file_sink(str(tmp_path / "results"), "jsonl") as sink:
+        sink.write_rows(ROWS)
+        sink.write_rows([{"id": 4, "text": "odd", "sentiment_label": None, "error": "boom"}])
+
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [*ROWS, {"id": 4, "text": "odd", "sentiment_label": None, "error": "boom"}]
+    assert sink.info()["records_written"] == 4
+
+
+def test_parquet_writes_a_directory_of_part_files(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(file_sink, "FILE_SINK_PARQUET_PART_ROWS", 2)
+    with open_file_sink(str(tmp_path / "results"), "parquet") as sink:
+        sink.write_rows(ROWS[:2])
+        sink.write_rows(ROWS[2:])
+
+    info = sink.info()
+    assert info["files"] == 2
+    assert info["part_files"] == ["results.parquet/part-00000.parquet", "results.parquet/part-00001.parquet"]
+    table = pq.read_table(str(tmp_path / "results.parquet"))
+    assert table.column_names == ["id", "text", "sentiment_label", "error"]
+    assert table.column("text").to_pylist() == ["good", "bad", "fine"]
+    assert table.column("error").to_pylist() == [None, None, None]
+
+
+def test_parquet_partitions_by_column(tmp_path) -> None:
+    with open_file_sink(str(tmp_path / "results"), "parquet", partition_by="sentiment_label") as sink:
+        sink.write_rows(ROWS)
+
+    info = sink.info()
+    assert info["partition_by"] == "sentiment_label"
+    assert info["part_files"] == [
+        "results.parquet/sentiment_label=negative/part-00000.parquet",
+        "results.parquet/sentiment_label=positive/part-00000.parquet",
+    ]
+    positive = pq.read_table(str(tmp_path / info["part_files"][1]))
+    assert positive.column("text").to_pylist() == ["good", "fine"]
+
+
+@pytest.mark.parametrize("output_format", ["csv", "csv.gz", "csv.zst", "jsonl", "parquet"])
+def test_failed_write_leaves_no_output(tmp_path, output_format) -> None:
+    with pytest.raises(RuntimeError):
+        with open_file_sink(str(tmp_path / "results"), output_format) as sink:
+            sink.write_rows(ROWS)
+            raise RuntimeError("upstream failed")
+
+    assert list(tmp_path.iterdir()) == []
+    assert sink.records_written == 3
+
+
+def test_unknown_format_is_rejected(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        open_file_sink(str(tmp_path / "results"), "xlsx")
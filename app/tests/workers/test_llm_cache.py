@@ -0,0 +1,23 @@
+import time
+from collections import Counter
+
+from workers.llm_cache import LLMCache
+
+
+def test_local_tier_evicts_least_recently_used(tmp_path) -> None:
+    cache = LLMCache(local_path=str(tmp_path / "cache.sqlite"), local_max_entries=2)
+    stats = Counter()
+    cache.set_many({"a": "POSITIVE", "b": "NEGATIVE"}, stats)
+    time.sleep(0.01)
+    assert cache.get_many(["a"], stats) == {"a": "POSITIVE"}
+    time.sleep(0.01)
+    cache.set_many({"c": "NEUTRAL"}, stats)
+
+    assert cache.get_many(["a", "b", "c"], stats) == {"a": "POSITIVE", "c": "NEUTRAL"}
+    assert stats["evictions"] == 1
+
+
+def test_local_tier_drops_expired_entries(tmp_path) -> None:
+    cache = LLMCache(local_path=str(tmp_path / "cache.sqlite"), ttl=0)
+    cache.set_many({"a": "TOXIC"})
+    assert cache.get_many(["a"]) == {}
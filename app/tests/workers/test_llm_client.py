@@ -0,0 +1,55 @@
+import asyncio
+
+from workers.llm_client import LLMClient
+
+
+def test_map_keeps_order_and_bounds_concurrency() -> None:
+    in_flight = {"now": 0, "max": 0}
+
+    async def work(item):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01 * (item % 3))
+        in_flight["now"] -= 1
+        if item == 4:
+            raise ValueError("bad item")
+        return item * 2
+
+    results = LLMClient(api_key="test").map(work, list(range(10)), concurrency=3)
+
+    assert [r for r in results if not isinstance(r, Exception)] == [0, 2, 4, 6, 10, 12, 14, 16, 18]
+    assert isinstance(results[4], ValueError)
+    assert in_flight["max"] == 3
+
+
+class _NoLimit:
+    async def acquire(self, model, estimated):
+        pass
+
+
+def test_slow_request_is_hedged_and_first_answer_wins() -> None:
+    client = LLMClient(api_key="test")
+    client._rate_limiter = _NoLimit()
+    client.latency.min_samples = 1
+    client.latency.max_rate = 1.0
+    client.latency.record("m", 0.01)
+    delays = [0.5, 0.01]
+
+    async def request(model, request, estimated):
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    client._request = request
+    assert asyncio.run(client._hedged("m", {}, 1)) == 0.01
+    assert list(client.latency._hedged["m"]) == [True]
+
+
+def test_hedge_rate_is_capped() -> None:
+    latency = LLMClient(api_key="test").latency
+    latency.max_rate = 0.1
+    for _ in range(9):
+        latency.record_call("m", hedged=False)
+    assert latency.allow_hedge("m")
+    latency.record_call("m", hedged=True)
+    assert not latency.allow_hedge("m")
@@ -0,0 +1,58 @@
+from collections import Counter
+
+import pytest
+
+from workers.backends import BACKENDS, CascadeBackend, InferenceBackend, LocalBackend
+from workers.classification import SENTIMENT, TOXICITY, FusedClassification
+from workers.constants import BACKEND_NAMES
+
+
+def test_local_backend_scores_batches_in_order() -> None:
+    texts = ["What a great day", "This is awful", "The bus leaves at noon", "not good", "you stupid idiot"]
+    results = LocalBackend(processes=1, chunk_size=2).classify(FusedClassification([SENTIMENT, TOXICITY]), texts, {}, Counter())
+
+    assert [sentiment["sentiment"] for sentiment, _ in results] == ["POSITIVE", "NEGATIVE", "NEUTRAL", "NEUTRAL", "NEGATIVE"]
+    assert [toxicity["toxicity"] for _, toxicity in results] == ["NON_TOXIC", "NON_TOXIC", "NON_TOXIC", "NON_TOXIC", "TOXIC"]
+    assert [sentiment["text"] for sentiment, _ in results] == texts
+    assert all(0 < sentiment["confidence"] <= 1 for sentiment, _ in results)
+
+
+class RecordingBackend(InferenceBackend):
+    def __init__(self):
+        self.seen = []
+
+    def classify(self, task, texts, config, stats):
+        self.seen.extend(texts)
+        return [task.result(text, "NEGATIVE") for text in texts]
+
+
+def test_cascade_sends_only_uncertain_rows_to_the_llm() -> None:
+    llm = RecordingBackend()
+    stats = Counter()
+    texts = ["What a great day", "The bus leaves at noon"]
+    results = CascadeBackend(LocalBackend(processes=1), llm).classify(SENTIMENT, texts, {"cascade_threshold": 0.8}, stats)
+
+    assert llm.seen == ["The bus leaves at noon"]
+    assert [result["sentiment"] for result in results] == ["POSITIVE", "NEGATIVE"]
+    assert stats == {"local_resolved": 1, "escalated": 1}
+
+
+def test_local_backend_pool_is_shut_down_with_the_job() -> None:
+    backend = LocalBackend(processes=2, chunk_size=2)
+    texts = ["What a great day", "This is awful", "The bus leaves at noon", "not good", "you stupid idiot"]
+    labels, _ = backend.predict("sentiment", texts)
+    assert len(labels) == len(texts)
+    pool = backend._pool
+    assert pool is not None
+
+    backend.close()
+    assert backend._pool is None
+    with pytest.raises(RuntimeError):
+        pool.submit(len, texts)
+    # The next job starts a fresh pool
+    assert backend.predict("sentiment", texts)[0] == labels
+    backend.close()
+
+
+def test_every_backend_name_is_implemented() -> None:
+    assert list(BACKENDS) == BACKEND_NAMES
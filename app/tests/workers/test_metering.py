@@ -0,0 +1,14 @@
+from workers.metering import UsageMeter, merge_usage, split_usage
+
+
+def test_fused_shares_add_up_to_the_job_usage() -> None:
+    meter = UsageMeter()
+    meter.record_call("gpt-4o-mini", prompt_tokens=1001, completion_tokens=35, seconds=1.5)
+    meter.record("gpt-4o-mini", "retries")
+    usage = meter.totals()
+
+    shares = split_usage(usage, 2)
+
+    assert shares[0]["prompt_tokens"] + shares[1]["prompt_tokens"] == 1001
+    assert merge_usage(shares) == usage
+    assert usage["cost_usd"] == round((1001 * 0.15 + 35 * 0.60) / 1e6, 6)
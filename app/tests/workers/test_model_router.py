@@ -0,0 +1,45 @@
+import time
+
+from workers.llm_client import LatencyTracker
+from workers.constants import ROUTING_PRIORITY_NAMES
+from workers.model_router import ROUTING_PRIORITIES, ModelRouter
+
+MODELS = ["gpt-4.1-nano", "gpt-4o-mini"]
+
+
+def _router(nano_seconds: float, mini_seconds: float) -> ModelRouter:
+    latency = LatencyTracker()
+    for _ in range(20):
+        latency.record("gpt-4.1-nano", nano_seconds)
+        latency.record("gpt-4o-mini", mini_seconds)
+    return ModelRouter(latency)
+
+
+def test_priority_trades_cost_for_latency() -> None:
+    # The cheaper model is observed to be much slower
+    router = _router(nano_seconds=3.0, mini_seconds=0.5)
+
+    assert router.route(["great product"], {"models": MODELS, "priority": "bulk"}, concurrency=4) == ["gpt-4.1-nano"]
+    assert router.route(["great product"], {"models": MODELS, "priority": "urgent"}, concurrency=4) == ["gpt-4o-mini"]
+
+
+def test_deadline_takes_cheapest_model_that_fits() -> None:
+    router = _router(nano_seconds=3.0, mini_seconds=0.5)
+    texts = [f"text {i}" for i in range(100)]
+
+    roomy = {"models": MODELS, "deadline_at": time.time() + 60}
+    tight = {"models": MODELS, "deadline_at": time.time() + 2}
+    assert set(router.route(texts, roomy, concurrency=4)) == {"gpt-4.1-nano"}
+    assert set(router.route(texts, tight, concurrency=4)) == {"gpt-4o-mini"}
+
+
+def test_failing_model_is_skipped() -> None:
+    router = _router(nano_seconds=0.5, mini_seconds=0.5)
+    for _ in range(20):
+        router.latency.record_failure("gpt-4.1-nano")
+
+    assert router.route(["ok"], {"models": MODELS, "priority": "bulk"}, concurrency=4) == ["gpt-4o-mini"]
+
+
+def test_every_priority_name_has_a_weight() -> None:
+    assert list(ROUTING_PRIORITIES) == ROUTING_PRIORITY_NAMES
@@ -0,0 +1,43 @@
+from collections import Counter
+
+from workers import backends
+from workers.classification import SENTIMENT
+from workers.near_duplicates import NearDuplicateIndex, canonical_tokens, hamming, simhash
+
+
+def test_canonical_tokens_drop_urls_mentions_case_and_emoji() -> None:
+    assert canonical_tokens("@bob LOVED it!! 😍 https://t.co/x") == ["loved", "it"]
+    assert simhash("🙂 https://t.co/x") is None
+
+
+def test_simhash_matches_variants_but_not_different_messages() -> None:
+    text = "Just had the best coffee ever at the new place downtown, totally recommend it"
+    variant = "@bob just had the BEST coffee ever at the new place downtown, totally recommend it 😍 http://x.y/z"
+    different = "Just had the worst coffee ever at the new place downtown, never going back"
+
+    assert hamming(simhash(text), simhash(variant)) == 0
+    assert hamming(simhash(text), simhash(different)) > 3
+
+
+def test_bands_guarantee_a_shared_bucket_within_the_max_distance() -> None:
+    index = NearDuplicateIndex(redis_conn=None, bands=4)
+    signature = simhash("the quick brown fox jumps over the lazy dog")
+    near = signature ^ (1 << 3) ^ (1 << 20) ^ (1 << 40)
+    assert set(index._band_keys("ns", signature)) & set(index._band_keys("ns", near))
+
+
+def test_llm_backend_reuses_near_duplicates_only_when_enabled(monkeypatch) -> None:
+    lookups = []
+    monkeypatch.setattr(backends, "near_duplicate_lookup", lambda index, task, model, texts, distance, stats: lookups.append(texts) or {})
+    monkeypatch.setattr(backends, "near_duplicate_store", lambda index, task, model, fresh: None)
+
+    class FakeClient:
+        def map(self, fn, requests, concurrency):
+            return [[SENTIMENT.result(text, "NEUTRAL") for text in group] for _, group in requests]
+
+    monkeypatch.setattr(backends, "llm_client", FakeClient())
+    backend = backends.OpenAIBackend()
+    backend.classify(SENTIMENT, ["so good"], {"cache": False}, Counter())
+    assert lookups == []
+    backend.classify(SENTIMENT, ["so good"], {"cache": False, "near_duplicates": True}, Counter())
+    assert lookups == [["so good"]]
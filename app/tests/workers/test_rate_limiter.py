@@ -0,0 +1,123 @@
+import asyncio
+
+import fakeredis.aioredis
+import pytest
+
+from workers import rate_limiter
+from workers.rate_limiter import RateLimiter
+
+MODEL = "gpt-test"
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> RateLimiter:
+    # 60 requests and 6000 tokens per minute with 10 s buckets: capacity 10 requests, 1000 tokens
+    monkeypatch.setattr(rate_limiter, "LLM_RPM_LIMIT", 60)
+    monkeypatch.setattr(rate_limiter, "LLM_TPM_LIMIT", 6000)
+    monkeypatch.setattr(rate_limiter, "LLM_BUCKET_SECONDS", 10)
+    return RateLimiter("sk-test", redis_conn=fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def _try_acquire(limiter: RateLimiter, tokens: int) -> int:
+    """One attempt of the acquire script: 0 when taken, otherwise milliseconds to wait"""
+    keys = limiter._keys(MODEL)
+    return asyncio.run(limiter._acquire(
+        keys=[keys["requests"], keys["tokens"], keys["pause"], keys["limits"]],
+        args=[rate_limiter.LLM_RPM_LIMIT, rate_limiter.LLM_TPM_LIMIT, tokens, rate_limiter.LLM_BUCKET_SECONDS]
+    ))
+
+
+def _level(limiter: RateLimiter, bucket: str) -> float:
+    return float(asyncio.run(limiter.redis_conn.hget(limiter._keys(MODEL)[bucket], "level")))
+
+
+def _set_level(limiter: RateLimiter, bucket: str, level: float, age_ms: int = 0):
+    async def set_level():
+        seconds, micros = await limiter.redis_conn.time()
+        now = seconds * 1000 + micros // 1000
+        await limiter.redis_conn.hset(limiter._keys(MODEL)[bucket], mapping={"level": level, "ts": now - age_ms})
+    asyncio.run(set_level())
+
+
+def test_acquire_takes_one_request_and_the_token_cost(limiter) -> None:
+    asyncio.run(limiter.acquire(MODEL, 100))
+    assert _level(limiter, "requests") == pytest.approx(9, abs=0.01)
+    assert _level(limiter, "tokens") == pytest.approx(900, abs=1)
+
+
+def test_empty_bucket_denies_without_taking_anything(limiter) -> None:
+    _set_level(limiter, "requests", 0)
+    wait_ms = _try_acquire(limiter, 100)
+    # One request refills in 1 s at 60 requests per minute
+    assert 900 < wait_ms <= 1000
+    # Both buckets change together or not at all
+    assert _level(limiter, "requests") == 0
+    assert asyncio.run(limiter.redis_conn.exists(limiter._keys(MODEL)["tokens"])) == 0
+
+
+def test_token_shortage_denies_and_keeps_the_request(limiter) -> None:
+    _set_level(limiter, "tokens", 50)
+    wait_ms = _try_acquire(limiter, 150)
+    # 100 missing tokens at 100 tokens per second
+    assert 900 < wait_ms <= 1000
+    assert asyncio.run(limiter.redis_conn.exists(limiter._keys(MODEL)["requests"])) == 0
+
+
+def test_buckets_refill_with_elapsed_time(limiter) -> None:
+    _set_level(limiter, "requests", 0, age_ms=5000)
+    assert _try_acquire(limiter, 10) == 0
+    assert _level(limiter, "requests") == pytest.approx(4, abs=0.1)
+
+    # Refill never exceeds the bucket capacity
+    _set_level(limiter, "requests", 0, age_ms=600000)
+    assert _try_acquire(limiter, 10) == 0
+    assert _level(limiter, "requests") == pytest.approx(9, abs=0.01)
+
+
+def test_observe_adopts_header_limits_and_remaining_quota(limiter) -> None:
+    asyncio.run(limiter.acquire(MODEL, 500))
+    asyncio.run(limiter.observe(MODEL, {
+        "x-ratelimit-limit-requests": "120",
+        "x-ratelimit-limit-tokens": "12000",
+        "x-ratelimit-remaining-requests": "3",
+    }, estimated_tokens=500, used_tokens=200))
+
+    limits = asyncio.run(limiter.redis_conn.hgetall(limiter._keys(MODEL)["limits"]))
+    assert float(limits["rpm"]) == 120 and float(limits["tpm"]) == 12000
+    # Lowered to what the provider says is left, never raised
+    assert _level(limiter, "requests") == 3
+    # The 300 tokens estimated but not used are refunded
+    assert _level(limiter, "tokens") == pytest.approx(800, abs=1)
+
+    asyncio.run(limiter.observe(MODEL, {"x-ratelimit-remaining-tokens": "100"}))
+    assert _level(limiter, "tokens") == 100
+
+
+def test_observed_limits_resize_the_buckets(limiter) -> None:
+    asyncio.run(limiter.observe(MODEL, {"x-ratelimit-limit-requests": "6"}))
+    # 6 requests per minute: one request every 10 s, a single-request bucket
+    assert _try_acquire(limiter, 1) == 0
+    assert 9000 < _try_acquire(limiter, 1) <= 10000
+
+
+def test_pause_holds_every_acquire(limiter) -> None:
+    asyncio.run(limiter.pause(MODEL, {"retry-after": "2"}))
+    assert 1000 < _try_acquire(limiter, 1) <= 2000
+    assert asyncio.run(limiter.redis_conn.exists(limiter._keys(MODEL)["requests"])) == 0
+
+
+def test_concurrent_acquires_never_overdraw(limiter) -> None:
+    keys = limiter._keys(MODEL)
+
+    async def attempts():
+        return await asyncio.gather(*[
+            limiter._acquire(
+                keys=[keys["requests"], keys["tokens"], keys["pause"], keys["limits"]],
+                args=[rate_limiter.LLM_RPM_LIMIT, rate_limiter.LLM_TPM_LIMIT, 50, rate_limiter.LLM_BUCKET_SECONDS]
+            )
+            for _ in range(25)
+        ])
+
+    # The 10-request bucket runs out before the 1000-token one (10 x 50 tokens); tokens refill at 100/s meanwhile
+    assert sum(1 for wait_ms in asyncio.run(attempts()) if wait_ms == 0) == 10
+    assert 500 <= _level(limiter, "tokens") < 550
@@ -0,0 +1,111 @@
+import gzip
+
+import pytest
+
+from workers import artifact_store as artifact_store_module
+from workers import universal_worker
+from workers.artifact_store import ArtifactStore
+
+
+def test_shard_reads_only_its_rows() -> None:
+    config = {"texts": ["a", "b", "c", "d", "e"], "shard": {"index": 1, "start_row": 2, "end_row": 4}}
+    assert universal_worker._get_input_texts(config) == ["c", "d"]
+
+
+def test_merge_concatenates_shards_in_order(tmp_path, monkeypatch) -> None:
+    store = ArtifactStore(str(tmp_path))
+    monkeypatch.setattr(universal_worker, "artifact_store", store)
+    monkeypatch.setattr(universal_worker.redis_client, "publish_block_completion", lambda *args, **kwargs: None)
+    shard_results = [
+        {"data_type": "sentiment_data", "next_blocks": ["file_writer"], "result_count": 1,
+         "artifact": store.put_json({"texts": [text], "sentiments_results": [{"text": text}]})}
+        for text in ["first", "second", "third"]
+    ]
+
+    merged = universal_worker.merge_shards(7, "sentiment_analysis", {"shard_results": shard_results})
+
+    assert merged["success"]
+    assert merged["result"]["result_count"] == 3
+    assert store.get(merged["result"]["artifact"])["texts"] == ["first", "second", "third"]
+
+
+def test_csv_reader_streams_only_text_and_id_columns(tmp_path, monkeypatch) -> None:
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    monkeypatch.setattr(universal_worker, "artifact_store", store)
+    monkeypatch.setattr(universal_worker, "CSV_READER_CHUNK_ROWS", 2)
+    csv_path = tmp_path / "input.csv"
+    csv_path.write_text('user,text,id\nann,"hi, there",1\nbob,,2\ncy,bye,3\n')
+
+    result = universal_worker._process_csv_reader(1, {"file_path": str(csv_path)})
+
+    assert result["result"]["row_count"] == 3
+    assert store.get(result["result"]["artifact"]) == {
+        "columns": ["user", "text", "id"], "text_column": "text", "id_column": "id",
+        "texts": ["hi, there", "", "bye"], "ids": ["1", "2", "3"],
+    }
+
+
+def test_file_writer_streams_results_and_returns_only_file_info(tmp_path, monkeypatch) -> None:
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    monkeypatch.setattr(universal_worker, "artifact_store", store)
+    monkeypatch.setattr(universal_worker, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    monkeypatch.setattr(universal_worker, "EDGE_STREAM_BATCH_ROWS", 2)
+    results = [{"text": text, "sentiment": "positive"} for text in ["a", "b", "c"]]
+    config = {"purpose": "sentiment_output", "output_format": "csv.gz", "pipeline_run_id": 9,
+              "inputs": {"sentiment_data": store.put_table({"sentiments_results": results, "texts": ["a", "b", "c"]})}}
+
+    result = universal_worker._process_file_writer(3, config)["result"]
+
+    assert set(result) == {"file_info", "data_type", "next_blocks", "result_count"}
+    assert result["result_count"] == 3
+    with gzip.open(result["file_info"]["output_path"], "rt") as f:
+        assert f.read().splitlines() == ["id,text,sentiment_label,error", "1,a,positive,", "2,b,positive,", "3,c,positive,"]
+    assert [path.name for path in (tmp_path / "outputs").iterdir()] == [result["file_info"]["filename"]]
+    assert result["file_info"]["download_url"] == f"/api/v1/downloads/pipeline/9/file/{result['file_info']['filename']}"
+
+
+def test_parquet_file_writer_links_each_part_file(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(universal_worker, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    results = [{"text": text, "sentiment": sentiment} for text, sentiment in [("a", "positive"), ("b", "negative")]]
+    config = {"output_format": "parquet", "partition_by": "sentiment_label", "pipeline_run_id": 9, "input_data": results}
+
+    file_info = universal_worker._process_file_writer(3, config)["result"]["file_info"]
+
+    assert "download_url" not in file_info
+    assert file_info["download_urls"] == [
+        f"/api/v1/downloads/pipeline/9/file/{file_info['filename']}/sentiment_label={label}/part-00000.parquet"
+        for label in ["negative", "positive"]
+    ]
+
+
+def test_unpublishable_completion_fails_the_job(monkeypatch) -> None:
+    class DownRedis:
+        def __init__(self):
+            self.attempts = 0
+
+        def xadd(self, *args, **kwargs):
+            self.attempts += 1
+            raise ConnectionError("redis unavailable")
+
+    down = DownRedis()
+    monkeypatch.setattr(universal_worker.redis_client, "redis_client", down)
+    monkeypatch.setattr(universal_worker, "_run_block", lambda block_run_id, block_type, config: {"success": True, "result": {}})
+
+    # RQ marks the job failed and retries it, instead of a completion silently going missing
+    with pytest.raises(ConnectionError):
+        universal_worker.process_task(7, "csv_reader", {"pipeline_run_id": 1})
+    # The block is not reported as failed on top of that
+    assert down.attempts == 1
+
+
+def test_shard_slices_arrow_input_a_batch_at_a_time(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(artifact_store_module, "ARTIFACT_TABLE_FORMAT", "arrow")
+    store = ArtifactStore(str(tmp_path))
+    monkeypatch.setattr(universal_worker, "artifact_store", store)
+    ref = store.put_table({"texts": [f"text {i}" for i in range(10)]}, {"text_column": "text"})
+    config = {"inputs": {"csv_data": ref}, "shard": {"index": 1, "start_row": 3, "end_row": 8}}
+
+    batches = list(universal_worker._iter_input_batches(config, 2))
+    assert all(len(batch) <= 2 for batch in batches)
+    assert [text for batch in batches for text in batch] == [f"text {i}" for i in range(3, 8)]
@@ -0,0 +1,104 @@
+"""Benchmark the CSV reader block: whole-file parse vs chunked, column-pruned streaming into the artifact.
+
+Generates synthetic CSVs (id, text and a few unused columns) of each size, then
+reads every file in a fresh subprocess per mode so peak RSS is measured per
+run, and reports rows/sec and peak RSS against file size.
+
+    PYTHONPATH=. python benchmarks/bench_csv_reader.py --sizes-mb 10 100 1000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = ["great", "coffee", "terrible", "service", "today", "love", "this", "never", "again", "amazing", "slow", "ok"]
+MODES = ["whole", "streaming"]
+
+
+def generate(path: str, size_mb: int):
+    """Write rows until the file reaches size_mb"""
+    target = size_mb * 1024 * 1024
+    rng = random.Random(size_mb)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "text", "user", "created_at", "lang", "likes"])
+        row_id = 0
+        while f.tell() < target:
+            for _ in range(10000):
+                row_id += 1
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+                writer.writerow([row_id, text, f"user{rng.randint(1, 10 ** 6)}", "2024-01-01T00:00:00Z", "en", rng.randint(0, 500)])
+
+
+def read_whole(file_path: str, artifact_root: str) -> int:
+    """The previous reader: one read_csv, every row as a dict, a separate texts list, one JSON payload"""
+    import pandas as pd
+    from workers.artifact_store import ArtifactStore
+
+    df = pd.read_csv(file_path)
+    columns = df.columns.tolist()
+    text_column = "text" if "text" in columns else columns[0]
+    rows = df.to_dict("records")
+    texts = df[text_column].astype(str).tolist()
+    ArtifactStore(artifact_root).put_json({"rows": rows, "columns": columns, "texts": texts, "text_column": text_column})
+    return len(rows)
+
+
+def read_streaming(file_path: str, artifact_root: str) -> int:
+    from workers import universal_worker
+    from workers.artifact_store import ArtifactStore
+    from workers.csv_reader import CSV_READER_CHUNK_ROWS, pick_columns, read_header
+
+    universal_worker.artifact_store = ArtifactStore(artifact_root)
+    columns = read_header(file_path)
+    text_column, id_column = pick_columns(columns)
+    _, row_count = universal_worker._write_csv_artifact({}, file_path, columns, text_column, id_column, CSV_READER_CHUNK_ROWS)
+    return row_count
+
+
+def child(mode: str, file_path: str):
+    """Run one read in this process and print its measurements as JSON"""
+    with tempfile.TemporaryDirectory() as artifact_root:
+        start = time.perf_counter()
+        rows = (read_whole if mode == "whole" else read_streaming)(file_path, artifact_root)
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"rows": rows, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[10, 100, 500], help="File sizes to generate")
+    parser.add_argument("--dir", default=None, help="Where to write the generated files (default: a temp dir)")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    work_dir = args.dir or tempfile.mkdtemp(prefix="bench_csv_")
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"\n{'size (MB)':>10}{'mode':>11}{'rows':>12}{'seconds':>10}{'rows/sec':>12}{'peak RSS (MB)':>15}")
+    for size_mb in args.sizes_mb:
+        file_path = os.path.join(work_dir, f"bench_{size_mb}mb.csv")
+        if not os.path.exists(file_path):
+            generate(file_path, size_mb)
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", mode, file_path], capture_output=True, text=True, check=True
+            ).stdout
+            measured = json.loads(output.strip().splitlines()[-1])
+            rate = measured["rows"] / measured["seconds"]
+            print(f"{size_mb:>10}{mode:>11}{measured['rows']:>12}{measured['seconds']:>10.2f}{rate:>12.0f}{measured['peak_rss_mb']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Benchmark the orchestrator's hot queries with and without the orchestration indexes.
+
+Seeds synthetic pipelines/runs into a copy of app.db (or app.db itself with
+--in-place), times each query with the indexes from revision 7cfdf24c2def
+dropped, recreates them and times again.
+
+    PYTHONPATH=. python benchmarks/bench_orchestration_queries.py --runs 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+BLOCKS_PER_PIPELINE = 5
+# (block_index, depends_on_index) edges of the standard CSV pipeline
+EDGES = [(1, 0), (2, 0), (3, 1), (4, 2)]
+STATUSES = ["COMPLETED", "COMPLETED", "COMPLETED", "PENDING", "RUNNING", "FAILED"]
+
+INDEXES = {
+    "ix_block_runs_pipeline_run_id_status": "CREATE INDEX ix_block_runs_pipeline_run_id_status ON block_runs (pipeline_run_id, status)",
+    "uq_block_runs_pipeline_run_id_block_id": "CREATE UNIQUE INDEX uq_block_runs_pipeline_run_id_block_id ON block_runs (pipeline_run_id, block_id)",
+    "ix_block_dependencies_block_id": "CREATE INDEX ix_block_dependencies_block_id ON block_dependencies (block_id)",
+    "ix_blocks_pipeline_id_order": 'CREATE INDEX ix_blocks_pipeline_id_order ON blocks (pipeline_id, "order")',
+    "ix_pipeline_runs_pipeline_id": "CREATE INDEX ix_pipeline_runs_pipeline_id ON pipeline_runs (pipeline_id)",
+}
+
+QUERIES = {
+    "block_run by (run, block)": (
+        "SELECT id, status FROM block_runs WHERE pipeline_run_id = :run_id AND block_id = :block_id"
+    ),
+    "ready block_runs by (run, status)": (
+        "SELECT id FROM block_runs WHERE pipeline_run_id = :run_id AND status = 'PENDING'"
+    ),
+    "dependencies by block": (
+        "SELECT depends_on_id FROM block_dependencies WHERE block_id = :block_id"
+    ),
+    "blocks by pipeline ordered": (
+        'SELECT id FROM blocks WHERE pipeline_id = :pipeline_id ORDER BY "order"'
+    ),
+    "runs by pipeline": (
+        "SELECT id, status FROM pipeline_runs WHERE pipeline_id = :pipeline_id"
+    ),
+}
+
+
+def seed(conn: sqlite3.Connection, runs: int, pipelines: int) -> dict:
+    """Insert synthetic pipelines, blocks, dependencies, runs and block runs"""
+    cur = conn.cursor()
+    first_pipeline = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM pipelines").fetchone()[0]) + 1
+    first_block = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM blocks").fetchone()[0]) + 1
+    first_run = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM pipeline_runs").fetchone()[0]) + 1
+
+    pipeline_ids = list(range(first_pipeline, first_pipeline + pipelines))
+    cur.executemany(
+        "INSERT INTO pipelines (id, name, description) VALUES (?, ?, ?)",
+        [(pid, f"bench-{pid}", "benchmark pipeline") for pid in pipeline_ids]
+    )
+
+    blocks_of = {}
+    block_rows, dep_rows = [], []
+    block_id = first_block
+    for pid in pipeline_ids:
+        ids = list(range(block_id, block_id + BLOCKS_PER_PIPELINE))
+        blocks_of[pid] = ids
+        block_rows.extend((bid, pid, f"block-{i}", "CSV_READER", "{}", i + 1) for i, bid in enumerate(ids))
+        dep_rows.extend((ids[child], ids[parent]) for child, parent in EDGES)
+        block_id += BLOCKS_PER_PIPELINE
+    cur.executemany(
+        'INSERT INTO blocks (id, pipeline_id, name, block_type, config, "order") VALUES (?, ?, ?, ?, ?, ?)',
+        block_rows
+    )
+    cur.executemany("INSERT INTO block_dependencies (block_id, depends_on_id) VALUES (?, ?)", dep_rows)
+
+    run_ids = list(range(first_run, first_run + runs))
+    run_pipeline = {run_id: random.choice(pipeline_ids) for run_id in run_ids}
+    cur.executemany(
+        "INSERT INTO pipeline_runs (id, pipeline_id, status) VALUES (?, ?, 'COMPLETED')",
+        list(run_pipeline.items())
+    )
+    cur.executemany(
+        "INSERT INTO block_runs (pipeline_run_id, block_id, status) VALUES (?, ?, ?)",
+        (
+            (run_id, bid, random.choice(STATUSES))
+            for run_id, pid in run_pipeline.items()
+            for bid in blocks_of[pid]
+        )
+    )
+    conn.commit()
+    return {"pipeline_ids": pipeline_ids, "blocks_of": blocks_of, "run_pipeline": run_pipeline}
+
+
+def time_queries(conn: sqlite3.Connection, seeded: dict, samples: int) -> dict:
+    """Return p50/p95 latency (ms) for each hot query over random seeded ids"""
+    runs = list(seeded["run_pipeline"].items())
+    results = {}
+    for name, sql in QUERIES.items():
+        timings = []
+        for _ in range(samples):
+            run_id, pipeline_id = random.choice(runs)
+            params = {
+                "run_id": run_id,
+                "pipeline_id": pipeline_id,
+                "block_id": random.choice(seeded["blocks_of"][pipeline_id]),
+            }
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[name] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="app.db", help="SQLite database at the latest migration")
+    parser.add_argument("--runs", type=int, default=100_000, help="Pipeline runs to seed")
+    parser.add_argument("--pipelines", type=int, default=1_000, help="Pipelines to spread runs over")
+    parser.add_argument("--samples", type=int, default=200, help="Timed executions per query")
+    parser.add_argument("--in-place", action="store_true", help="Seed the database itself instead of a copy")
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not args.in_place:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_orchestration_")
+        db_path = os.path.join(tmp_dir, "app.db")
+        shutil.copyfile(args.db, db_path)
+
+    random.seed(42)
+    conn = sqlite3.connect(db_path)
+    try:
+        print(f"🌱 Seeding {args.runs} runs ({args.runs * BLOCKS_PER_PIPELINE} block runs) into {db_path}")
+        start = time.perf_counter()
+        seeded = seed(conn, args.runs, args.pipelines)
+        print(f"   done in {time.perf_counter() - start:.1f}s")
+
+        for name in INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute("ANALYZE")
+        before = time_queries(conn, seeded, args.samples)
+
+        for ddl in INDEXES.values():
+            conn.execute(ddl)
+        conn.execute("ANALYZE")
+        conn.commit()
+        after = time_queries(conn, seeded, args.samples)
+    finally:
+        # Never leave the database without its indexes
+        for name, ddl in INDEXES.items():
+            conn.execute(ddl.replace("INDEX", "INDEX IF NOT EXISTS", 1))
+        conn.commit()
+        conn.close()
+
+    print(f"\n{'query':<36}{'before p50/p95 (ms)':>22}{'after p50/p95 (ms)':>22}{'speedup':>10}")
+    for name in QUERIES:
+        (b50, b95), (a50, a95) = before[name], after[name]
+        speedup = b50 / a50 if a50 else float("inf")
+        print(f"{name:<36}{f'{b50:.3f} / {b95:.3f}':>22}{f'{a50:.3f} / {a95:.3f}':>22}{f'{speedup:.0f}x':>10}")
+
+    if not args.in_place:
+        shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # optional: tables fall back to column-oriented JSON
+    pa = pa_ipc = None
+
+# Shared volume (api + workers) holding block outputs, addressed by content hash
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "/app/artifacts")
+# Encoding of tabular block outputs: Arrow IPC files that readers memory-map (needs pyarrow), or JSON
+ARTIFACT_TABLE_FORMAT = os.getenv("ARTIFACT_TABLE_FORMAT", "arrow" if pa is not None else "json")
+# Schema metadata key holding a table's small non-columnar fields
+TABLE_METADATA_KEY = b"artifact_metadata"
+
+
+class ArtifactStore:
+    """Local content-addressed store: a payload is written once under its SHA-256 and passed around by reference"""
+
+    def __init__(self, root: str = ARTIFACT_DIR):
+        self.root = root
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def put_bytes(self, data: bytes, extension: str = "bin", media_type: str = "application/octet-stream") -> Dict[str, Any]:
+        """Store bytes (skipping the write if identical content already exists) and return a reference"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, extension)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial artifact
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return _reference(digest, path, len(data), extension, media_type)
+
+    def writer(self, extension: str = "bin", media_type: str = "application/octet-stream") -> "ArtifactWriter":
+        """Write an artifact incrementally (for payloads too large to build in memory)"""
+        return ArtifactWriter(self, extension, media_type)
+
+    def put_json(self, payload: Any) -> Dict[str, Any]:
+        data = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+        return self.put_bytes(data, extension="json", media_type="application/json")
+
+    def put_table(self, columns: Dict[str, list], metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Store equal-length columns (plus small metadata fields) in the table format"""
+        with self.table_writer(metadata) as writer:
+            writer.write_batch(columns)
+        return writer.ref
+
+    def table_writer(self, metadata: Dict[str, Any] = None):
+        """Writer appending column batches to one table artifact (see ArrowTableWriter / JsonTableWriter)"""
+        if ARTIFACT_TABLE_FORMAT == "arrow" and pa is not None:
+            return ArrowTableWriter(self, metadata)
+        return JsonTableWriter(self, metadata)
+
+    def get(self, ref: Dict[str, Any], columns: List[str] = None) -> Dict[str, Any]:
+        """Payload of a JSON or table artifact as {metadata fields..., column: values}; `columns` limits the
+        columns decoded from an Arrow table. Decodes whole columns into Python lists: readers of large tables
+        use read_table() or iter_column() instead"""
+        if ref.get("format") != "arrow":
+            return self.get_json(ref)
+        table = self.read_table(ref, columns)
+        metadata = (table.schema.metadata or {}).get(TABLE_METADATA_KEY)
+        return {**(json.loads(metadata) if metadata else {}), **table.to_pydict()}
+
+    def read_table(self, ref: Dict[str, Any], columns: List[str] = None):
+        """Arrow table of an arrow artifact, memory-mapped: columns are read zero-copy from the page cache"""
+        table = pa_ipc.open_file(pa.memory_map(ref["path"], "r")).read_all()
+        if columns is not None:
+            table = table.select([column for column in columns if column in table.column_names])
+        return table
+
+    def iter_column(self, ref: Dict[str, Any], column: str, batch_rows: int, start: int = 0, stop: int = None) -> Iterator[list]:
+        """One column's values of rows [start, stop) in batches of at most batch_rows (an Arrow table is
+        sliced zero-copy and decoded a batch at a time)"""
+        if ref.get("format") != "arrow":
+            values = self.get_json(ref).get(column, [])[start:stop]
+            for i in range(0, len(values), batch_rows):
+                yield values[i:i + batch_rows]
+            return
+        table = self.read_table(ref, [column])
+        if column not in table.column_names:
+            return
+        table = table.slice(start, None if stop is None else max(0, stop - start))
+        for batch in table.to_batches(max_chunksize=batch_rows):
+            yield batch.column(0).to_pylist()
+
+    def get_bytes(self, ref: Dict[str, Any]) -> bytes:
+        with open(ref["path"], "rb") as f:
+            return f.read()
+
+    def get_json(self, ref: Dict[str, Any]) -> Any:
+        return json.loads(self.get_bytes(ref))
+
+
+class ArtifactWriter:
+    """Streams one artifact to a temp file, hashing as it goes; close() moves it to its content address.
+
+    Used as a context manager: the artifact is stored on a clean exit and
+    discarded on an exception. `ref` is set once it is stored.
+    """
+
+    def __init__(self, store: ArtifactStore, extension: str, media_type: str):
+        self.store = store
+        self.extension = extension
+        self.media_type = media_type
+        self.size = 0
+        self.ref = None
+        self._hash = hashlib.sha256()
+        os.makedirs(store.root, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+
+    def __enter__(self) -> "ArtifactWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, data: bytes):
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    # File-object protocol, so pyarrow can stream straight into the writer (pa.PythonFile)
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self) -> Dict[str, Any]:
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = self.store.path_for(digest, self.extension)
+        if os.path.exists(path):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+        self.ref = _reference(digest, path, self.size, self.extension, self.media_type)
+        return self.ref
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class ArrowTableWriter:
+    """Record batches streamed into an Arrow IPC file artifact.
+
+    The first batch sets the schema. A later batch that adds a column or a
+    struct field, or types a column that was all null, widens it: the rows
+    written so far are rewritten once under the unified schema.
+    """
+
+    def __init__(self, store: ArtifactStore, metadata: Dict[str, Any] = None):
+        self.store = store
+        self.metadata = {TABLE_METADATA_KEY: json.dumps(metadata or {}, default=str)}
+        self.ref = None
+        self._artifact = None
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self) -> "ArrowTableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._artifact is not None:
+            self._artifact.discard()
+
+    def write_batch(self, columns: Dict[str, list]):
+        if not any(columns.values()):
+            return  # an empty batch would fix null column types
+        self._write(pa.RecordBatch.from_pydict(columns))
+
+    def append(self, ref: Dict[str, Any]):
+        """Copy a table artifact's rows in; Arrow record batches go across without being decoded"""
+        if ref.get("format") != "arrow":
+            self.write_batch(self.store.get_json(ref))
+            return
+        for batch in self.store.read_table(ref).to_batches():
+            self._write(batch.replace_schema_metadata())
+
+    def close(self) -> Dict[str, Any]:
+        if self._writer is None:
+            self._open(pa.schema([]))
+        self._writer.close()
+        self.ref = self._artifact.close()
+        return self.ref
+
+    def _write(self, batch):
+        if self._schema is None:
+            self._open(batch.schema)
+        elif not batch.schema.equals(self._schema):
+            schema = pa.unify_schemas([self._schema, batch.schema], promote_options="permissive")
+            if not schema.equals(self._schema):
+                self._widen(schema)
+        self._writer.write_batch(_conform(batch, self._schema))
+
+    def _open(self, schema):
+        self._schema = schema
+        self._artifact = ArtifactWriter(self.store, "arrow", "application/vnd.apache.arrow.file")
+        self._writer = pa_ipc.new_file(pa.PythonFile(self._artifact, mode="w"), schema.with_metadata(self.metadata))
+
+    def _widen(self, schema):
+        self._writer.close()
+        self._artifact.flush()
+        previous = self._artifact
+        try:
+            written = pa_ipc.open_file(pa.memory_map(previous._tmp_path, "r"))
+            self._open(schema)
+            for index in range(written.num_record_batches):
+                self._writer.write_batch(_conform(written.get_batch(index).replace_schema_metadata(), schema))
+        finally:
+            previous.discard()
+
+
+def _conform(batch, schema):
+    """batch with exactly schema's columns: missing ones are all null, the rest cast (struct fields match by name)"""
+    if batch.schema.equals(schema):
+        return batch
+    columns = [
+        batch.column(field.name).cast(field.type) if field.name in batch.schema.names else pa.nulls(batch.num_rows, field.type)
+        for field in schema
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class JsonTableWriter:
+    """Table artifact as one JSON object {metadata fields..., column: [values]}, written without holding the
+    columns in memory: each column is spooled to a temp file until the last batch"""
+
+    def __init__(self, store: ArtifactStore, metadata: Dict[str, Any] = None):
+        self.store = store
+        self.metadata = metadata or {}
+        self.ref = None
+        self._spools = {}
+        self._filled = set()
+
+    def __enter__(self) -> "JsonTableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_spools()
+
+    def append(self, ref: Dict[str, Any]):
+        """Copy a table artifact's rows in"""
+        self.write_batch(self.store.get(ref))
+
+    def write_batch(self, columns: Dict[str, list]):
+        for name, values in columns.items():
+            if name not in self._spools:
+                self._spools[name] = tempfile.TemporaryFile()
+            if not values:
+                continue
+            self._spools[name].write((b"," if name in self._filled else b"") + json.dumps(values, default=str)[1:-1].encode("utf-8"))
+            self._filled.add(name)
+
+    def close(self) -> Dict[str, Any]:
+        try:
+            with self.store.writer("json", "application/json") as out:
+                out.write(json.dumps(self.metadata, default=str)[:-1].encode("utf-8"))
+                for position, (name, spool) in enumerate(self._spools.items()):
+                    out.write(("," if self.metadata or position else "").encode("utf-8") + json.dumps(name).encode("utf-8") + b":[")
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, out)
+                    out.write(b"]")
+                out.write(b"}")
+        finally:
+            self._close_spools()
+        self.ref = out.ref
+        return self.ref
+
+    def _close_spools(self):
+        for spool in self._spools.values():
+            spool.close()
+
+
+def _reference(digest: str, path: str, size: int, extension: str, media_type: str) -> Dict[str, Any]:
+    return {
+        "digest": digest,
+        "path": path,
+        "size": size,
+        "format": extension,
+        "media_type": media_type,
+    }
+
+
+artifact_store = ArtifactStore()
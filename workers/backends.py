@@ -0,0 +1,219 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Union
+
+import redis
+
+from workers.classification import (
+    ClassificationTask, FusedClassification, LLM_PROMPT_BATCHING, pack_texts, cache_lookup, cache_store,
+    near_duplicate_lookup, near_duplicate_store,
+)
+from workers.llm_cache import LLMCache, LLM_CACHE_ENABLED
+from workers.near_duplicates import NearDuplicateIndex, NEAR_DUP_ENABLED, NEAR_DUP_MAX_DISTANCE
+from workers.llm_client import llm_client, LLM_CONCURRENCY, LLM_MODEL
+from workers.model_router import ModelRouter
+from workers.local_classifier import predict_chunk
+from workers.constants import INFERENCE_BACKEND
+
+# Local backend: texts per pool task, and pool size (batches of one chunk or less are scored in-process)
+LOCAL_BACKEND_CHUNK = int(os.getenv("LOCAL_BACKEND_CHUNK", 2000))
+LOCAL_BACKEND_PROCESSES = int(os.getenv("LOCAL_BACKEND_PROCESSES", os.cpu_count() or 1))
+# Cascade: rows the local model scores below this confidence (config "cascade_threshold") go to the LLM
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", 0.8))
+
+_redis_conn = redis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=0,
+    decode_responses=True
+)
+# Exact cache and near-duplicate index of LLM answers, shared through Redis by every worker
+llm_cache = LLMCache(_redis_conn)
+near_duplicate_index = NearDuplicateIndex(_redis_conn)
+# Routes on the latencies and errors the pooled client observes
+model_router = ModelRouter(llm_client.latency)
+
+
+class InferenceBackend:
+    """Classifies a batch of distinct texts for a task, returning one result per text in input order.
+
+    Backends add their counters (cache hits, rows resolved locally, ...) to `stats`.
+    """
+
+    name = ""
+
+    def classify(self, task: Union[ClassificationTask, FusedClassification], texts: List[str], config: Dict[str, Any],
+                 stats: Counter) -> List[Any]:
+        raise NotImplementedError
+
+    def close(self):
+        """Release what the backend started for the current job (called when the job's classification ends)"""
+
+
+class OpenAIBackend(InferenceBackend):
+    """Packed multi-text chat completions on the shared pooled client, behind the answer cache and near-duplicate index.
+
+    With a "routing" config each text is sent to the model the router picks, otherwise to config "model".
+    """
+
+    name = "openai"
+
+    def classify(self, task, texts, config, stats):
+        concurrency = int(config.get("llm_concurrency", LLM_CONCURRENCY))
+        batching = config.get("prompt_batching", LLM_PROMPT_BATCHING)
+        if config.get("routing"):
+            models = model_router.route(texts, config["routing"], concurrency, batching)
+        else:
+            models = [config.get("model", LLM_MODEL)] * len(texts)
+        texts_by_model = {}
+        for text, model in zip(texts, models):
+            texts_by_model.setdefault(model, []).append(text)
+
+        caching = config.get("cache", LLM_CACHE_ENABLED)
+        near_duplicates = config.get("near_duplicates", NEAR_DUP_ENABLED)
+        max_distance = int(config.get("near_duplicate_distance", NEAR_DUP_MAX_DISTANCE))
+        resolved, requests = {}, []
+        for model, model_texts in texts_by_model.items():
+            stats[f"routed:{model}"] += len(model_texts)
+            found = cache_lookup(llm_cache, task, model, model_texts, stats) if caching else {}
+            misses = [text for text in model_texts if text not in found]
+            # Texts within a few bits of an already-labeled text reuse its label
+            if near_duplicates and misses:
+                found.update(near_duplicate_lookup(near_duplicate_index, task, model, misses, max_distance, stats))
+                misses = [text for text in misses if text not in found]
+            resolved.update(found)
+            # Pack many texts into each request unless the block opts out
+            requests.extend((model, group) for group in (pack_texts(misses) if batching else [[text] for text in misses]))
+        if not requests:
+            return [resolved[text] for text in texts]
+
+        misses = sum(len(group) for _, group in requests)
+        print(f" Sending {misses} texts in {len(requests)} requests ({concurrency} concurrent, "
+              f"{', '.join(texts_by_model)}), {len(resolved)} reused")
+
+        # Results come back in input order; a failed request gets fallback results for its texts
+        fresh_by_model = {}
+        responses = llm_client.map(lambda request: task.classify_many(request[1], model=request[0]), requests, concurrency)
+        for (model, group), group_results in zip(requests, responses):
+            if isinstance(group_results, BaseException):
+                print(f"⚠️  Error processing {len(group)} texts with {model}: {str(group_results)}")
+                group_results = [task.error_result(text, group_results) for text in group]
+            fresh_by_model.setdefault(model, {}).update(zip(group, group_results))
+        for model, fresh in fresh_by_model.items():
+            if caching:
+                cache_store(llm_cache, task, model, fresh, stats)
+            if near_duplicates:
+                near_duplicate_store(near_duplicate_index, task, model, fresh)
+            resolved.update(fresh)
+        return [resolved[text] for text in texts]
+
+
+class LocalBackend(InferenceBackend):
+    """Offline hashed n-gram linear classifier, scoring whole chunks with NumPy across a process pool"""
+
+    name = "local"
+
+    def __init__(self, processes: int = LOCAL_BACKEND_PROCESSES, chunk_size: int = LOCAL_BACKEND_CHUNK):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # A pool belongs to the process that started it
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.processes)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        # Each RQ work-horse is a fork that exits with os._exit, skipping the executor's own cleanup,
+        # so the pool is shut down with the job that started it
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+            self._pid = None
+
+    def predict(self, result_key: str, texts: List[str]):
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        if len(chunks) <= 1 or self.processes <= 1:
+            outputs = [predict_chunk(result_key, chunk) for chunk in chunks]
+        else:
+            outputs = list(self._executor().map(predict_chunk, [result_key] * len(chunks), chunks))
+        labels = [label for chunk_labels, _ in outputs for label in chunk_labels]
+        confidences = [confidence for _, chunk_confidences in outputs for confidence in chunk_confidences]
+        return labels, confidences
+
+    def classify(self, task, texts, config, stats):
+        tasks = task.tasks if isinstance(task, FusedClassification) else [task]
+        per_task = []
+        for member in tasks:
+            labels, confidences = self.predict(member.result_key, texts)
+            per_task.append([
+                {**member.result(text, label if label in member.labels else member.default_label), "confidence": round(confidence, 3)}
+                for text, label, confidence in zip(texts, labels, confidences)
+            ])
+        print(f" Scored {len(texts)} texts locally ({', '.join(member.result_key for member in tasks)})")
+        return list(zip(*per_task)) if isinstance(task, FusedClassification) else per_task[0]
+
+
+class CascadeBackend(InferenceBackend):
+    """The local model labels every row; only rows it is unsure of go to the LLM.
+
+    A row of a fused task is escalated when any of its labels is uncertain, and
+    keeps its local labels if the LLM request fails.
+    """
+
+    name = "cascade"
+
+    def __init__(self, local: InferenceBackend, llm: InferenceBackend):
+        self.local = local
+        self.llm = llm
+
+    def classify(self, task, texts, config, stats):
+        threshold = float(config.get("cascade_threshold", CASCADE_CONFIDENCE_THRESHOLD))
+        results = self.local.classify(task, texts, config, stats)
+        uncertain = [
+            index for index, result in enumerate(results)
+            if min(member["confidence"] for member in _members(result)) < threshold
+        ]
+        stats["local_resolved"] += len(texts) - len(uncertain)
+        stats["escalated"] += len(uncertain)
+        print(f" Cascade: {len(texts) - len(uncertain)} of {len(texts)} texts resolved locally (threshold {threshold})")
+        if not uncertain:
+            return results
+
+        for index, result in zip(uncertain, self.llm.classify(task, [texts[index] for index in uncertain], config, stats)):
+            if not any(member.get("error") for member in _members(result)):
+                results[index] = result
+        return results
+
+    def close(self):
+        self.local.close()
+        self.llm.close()
+
+
+def _members(result) -> tuple:
+    """The per-task results of one text (a fused task's result is already a tuple)"""
+    return result if isinstance(result, tuple) else (result,)
+
+
+_local_backend = LocalBackend()
+_openai_backend = OpenAIBackend()
+BACKENDS = {
+    backend.name: backend
+    for backend in (_openai_backend, _local_backend, CascadeBackend(_local_backend, _openai_backend))
+}
+
+
+def get_backend(name: str = None) -> InferenceBackend:
+    name = name or INFERENCE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (available: {', '.join(BACKENDS)})")
+    return BACKENDS[name]
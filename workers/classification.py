@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Tuple, Union
+
+from workers.llm_cache import LLMCache
+from workers.near_duplicates import NearDuplicateIndex
+from workers.llm_client import llm_client, LLM_MODEL
+
+# Multi-text prompts: texts packed into one request, bounded by count and by estimated input tokens
+LLM_PROMPT_BATCHING = os.getenv("LLM_PROMPT_BATCHING", "true").lower() == "true"
+LLM_PROMPT_BATCH_SIZE = int(os.getenv("LLM_PROMPT_BATCH_SIZE", 25))
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 2000))
+# Completion tokens per packed text ({"id": 12, "label": "NEGATIVE"},) plus the JSON wrapper
+LABEL_TOKENS_PER_TEXT = 14
+LABEL_TOKENS_OVERHEAD = 20
+
+
+class MalformedBatchResponse(ValueError):
+    pass
+
+
+def normalize_text(text: str) -> str:
+    """Cache and deduplication form of a text: NFC, trimmed, inner whitespace collapsed (case is kept)"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", str(text))).strip()
+
+
+def text_tokens(text: str) -> int:
+    """Rough prompt tokens of one packed text (~4 characters per token plus its JSON envelope)"""
+    return len(text) // 4 + 8
+
+
+def pack_texts(texts: List[str], max_items: int = LLM_PROMPT_BATCH_SIZE, token_budget: int = LLM_PROMPT_TOKEN_BUDGET) -> List[List[str]]:
+    """Split texts, in order, into groups of at most max_items and about token_budget prompt tokens"""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = text_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > token_budget):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+class ClassificationTask:
+    """An LLM label classification (sentiment, toxicity) with single-text and packed multi-text prompts"""
+
+    def __init__(self, result_key: str, labels: List[str], default_label: str, instruction: str, single_prompt: str,
+                 extra: Dict[str, Any] = None, error_extra: Dict[str, Any] = None):
+        self.result_key = result_key
+        self.labels = labels
+        self.default_label = default_label
+        self.instruction = instruction
+        self.single_prompt = single_prompt
+        self.extra = extra or {}
+        self.error_extra = error_extra or {}
+        self.batch_prompt = (
+            f"{instruction}\n"
+            "You receive a JSON array of messages, each with an id. Respond with a JSON object "
+            '{"labels": [{"id": <id>, "label": <label>}, ...]} holding exactly one entry per message, '
+            f"in the same order. Each label must be one of: {', '.join(labels)}."
+        )
+        # Changes whenever a prompt or the label set changes, so cached answers to old prompts are not reused
+        self.prompt_version = hashlib.sha256(
+            json.dumps([single_prompt, self.batch_prompt, labels]).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def namespace(self, model: str) -> str:
+        """Identifies answers of this task, model and prompt version (labels are only reused within one)"""
+        return hashlib.sha256(f"{self.result_key}\0{model}\0{self.prompt_version}".encode("utf-8")).hexdigest()[:16]
+
+    def cache_key(self, model: str, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace(model)}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def result(self, text: str, label: str) -> dict:
+        return {"text": text, self.result_key: label, **self.extra}
+
+    def error_result(self, text: str, error: Exception) -> dict:
+        return {"text": text, self.result_key: self.default_label, **self.error_extra, "error": str(error)}
+
+    async def classify_one(self, text: str, model: str = LLM_MODEL) -> dict:
+        """Classify a single text with its own request"""
+        try:
+            user_prompt = f"Input Message: {text}\n{self.result_key.capitalize()}:"
+            label = (await llm_client.complete(self.single_prompt, user_prompt, model=model)).upper()
+
+            # Validate the response
+            if label not in self.labels:
+                print(f"⚠️  Unexpected {self.result_key} response: {label}, defaulting to {self.default_label}")
+                label = self.default_label
+
+            return self.result(text, label)
+
+        except Exception as e:
+            print(f"⚠️  Error classifying {self.result_key} for text: {str(e)}")
+            return self.error_result(text, e)
+
+    async def classify_many(self, texts: List[str], model: str = LLM_MODEL) -> List[dict]:
+        """Classify texts with one packed request; only a malformed response falls back to per-text requests"""
+        if len(texts) == 1:
+            return [await self.classify_one(texts[0], model)]
+        try:
+            content = await llm_client.complete(
+                self.batch_prompt,
+                json.dumps([{"id": index, "text": text} for index, text in enumerate(texts, start=1)], ensure_ascii=False),
+                max_tokens=LABEL_TOKENS_PER_TEXT * len(texts) + LABEL_TOKENS_OVERHEAD,
+                model=model,
+                response_format={"type": "json_object"},
+            )
+            labels = self.parse_labels(content, len(texts))
+        except MalformedBatchResponse as e:
+            print(f"⚠️  Malformed {self.result_key} batch of {len(texts)} ({e}), retrying per text")
+            return list(await asyncio.gather(*(self.classify_one(text, model) for text in texts)))
+        except Exception as e:
+            print(f"⚠️  Error classifying {self.result_key} batch of {len(texts)}: {str(e)}")
+            return [self.error_result(text, e) for text in texts]
+
+        return [self.result(text, label) for text, label in zip(texts, labels)]
+
+    def parse_labels(self, content: str, expected: int) -> List[str]:
+        """Validate a packed response: one known label per text, ids 1..n in order"""
+        return [self.check_label(entry.get("label")) for entry in parse_entries(content, expected)]
+
+    def check_label(self, label: Any) -> str:
+        label = str(label or "").strip().upper()
+        if label not in self.labels:
+            raise MalformedBatchResponse(f"unknown {self.result_key} label {label!r}")
+        return label
+
+
+class FusedClassification:
+    """Several classifications of the same texts (e.g. sentiment and toxicity) answered by one request per text group.
+
+    Each text's result is a tuple holding one result per task, in task order.
+    """
+
+    def __init__(self, tasks: List[ClassificationTask]):
+        self.tasks = list(tasks)
+        self.result_key = "+".join(task.result_key for task in self.tasks)
+        fields = ", ".join(f'"{task.result_key}": <{task.result_key} label>' for task in self.tasks)
+        self.batch_prompt = (
+            "You are an AI assistant that labels short text messages in several ways at once.\n"
+            + "".join(f"- {task.result_key}: {task.instruction} Labels: {', '.join(task.labels)}.\n" for task in self.tasks)
+            + "You receive a JSON array of messages, each with an id. Respond with a JSON object "
+            f'{{"labels": [{{"id": <id>, {fields}}}, ...]}} holding exactly one entry per message, in the same order.'
+        )
+
+    def error_result(self, text: str, error: Exception) -> Tuple[dict, ...]:
+        return tuple(task.error_result(text, error) for task in self.tasks)
+
+    async def classify_many(self, texts: List[str], model: str = LLM_MODEL) -> List[Tuple[dict, ...]]:
+        """Classify texts for every task with one packed request; a malformed response falls back to one request per task"""
+        try:
+            content = await llm_client.complete(
+                self.batch_prompt,
+                json.dumps([{"id": index, "text": text} for index, text in enumerate(texts, start=1)], ensure_ascii=False),
+                max_tokens=LABEL_TOKENS_PER_TEXT * len(self.tasks) * len(texts) + LABEL_TOKENS_OVERHEAD,
+                model=model,
+                response_format={"type": "json_object"},
+            )
+            labels = self.parse_labels(content, len(texts))
+        except MalformedBatchResponse as e:
+            print(f"⚠️  Malformed {self.result_key} batch of {len(texts)} ({e}), retrying per task")
+            per_task = await asyncio.gather(*(task.classify_many(texts, model) for task in self.tasks))
+            return list(zip(*per_task))
+        except Exception as e:
+            print(f"⚠️  Error classifying {self.result_key} batch of {len(texts)}: {str(e)}")
+            return [self.error_result(text, e) for text in texts]
+
+        return [
+            tuple(task.result(text, label) for task, label in zip(self.tasks, text_labels))
+            for text, text_labels in zip(texts, labels)
+        ]
+
+    def parse_labels(self, content: str, expected: int) -> List[Tuple[str, ...]]:
+        """Validate a packed response: one known label per task and text, ids 1..n in order"""
+        return [
+            tuple(task.check_label(entry.get(task.result_key)) for task in self.tasks)
+            for entry in parse_entries(content, expected)
+        ]
+
+
+def parse_entries(content: str, expected: int) -> List[dict]:
+    """The entries of a packed JSON response, checked to be one object per text with ids 1..n in order"""
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        raise MalformedBatchResponse(f"invalid JSON: {e}")
+    entries = data.get("labels") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or len(entries) != expected:
+        raise MalformedBatchResponse(f"expected {expected} labels")
+
+    for index, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict) or entry.get("id") != index:
+            raise MalformedBatchResponse(f"entry {index} is missing or out of order")
+    return entries
+
+
+def cache_lookup(cache: LLMCache, task: Union[ClassificationTask, FusedClassification], model: str, texts: List[str],
+                 stats: Counter) -> Dict[str, Any]:
+    """Results of the texts whose labels are all cached (for a fused task, every task's label), keyed by text"""
+    labels_by_member = []
+    for member in _members(task):
+        keys = {text: member.cache_key(model, text) for text in texts}
+        found = cache.get_many(list(dict.fromkeys(keys.values())), stats)
+        labels_by_member.append({text: found[key] for text, key in keys.items() if key in found})
+
+    results = _results_from_labels(task, texts, labels_by_member)
+    stats["hits"] += len(results)
+    stats["misses"] += len(texts) - len(results)
+    return results
+
+
+def cache_store(cache: LLMCache, task: Union[ClassificationTask, FusedClassification], model: str, results: Dict[str, Any],
+                stats: Counter):
+    """Cache the labels of fresh results (text -> result); error fallbacks are never cached"""
+    cache.set_many({
+        member.cache_key(model, text): label
+        for member, labels in zip(_members(task), _labels_from_results(task, results))
+        for text, label in labels.items()
+    }, stats)
+
+
+def near_duplicate_lookup(index: NearDuplicateIndex, task: Union[ClassificationTask, FusedClassification], model: str,
+                          texts: List[str], max_distance: int, stats: Counter) -> Dict[str, Any]:
+    """Results of the texts that are near duplicates of already-labeled texts, keyed by text"""
+    labels_by_member = [index.find(member.namespace(model), texts, max_distance) for member in _members(task)]
+    results = _results_from_labels(task, texts, labels_by_member)
+    stats["near_duplicates"] += len(results)
+    return results
+
+
+def near_duplicate_store(index: NearDuplicateIndex, task: Union[ClassificationTask, FusedClassification], model: str,
+                         results: Dict[str, Any]):
+    """Index the labels of fresh results so near duplicates of these texts can reuse them"""
+    for member, labels in zip(_members(task), _labels_from_results(task, results)):
+        index.add(member.namespace(model), labels)
+
+
+def _members(task: Union[ClassificationTask, FusedClassification]) -> List[ClassificationTask]:
+    return task.tasks if isinstance(task, FusedClassification) else [task]
+
+
+def _results_from_labels(task, texts: List[str], labels_by_member: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Rebuild results for the texts that have a valid label from every member task"""
+    results = {}
+    for text in texts:
+        labels = [labels.get(text) for labels in labels_by_member]
+        if all(label in member.labels for member, label in zip(_members(task), labels)):
+            text_results = tuple(member.result(text, label) for member, label in zip(_members(task), labels))
+            results[text] = text_results if isinstance(task, FusedClassification) else text_results[0]
+    return results
+
+
+def _labels_from_results(task, results: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Per member task, text -> label of the results that are real answers (not error fallbacks)"""
+    labels_by_member = [{} for _ in _members(task)]
+    for text, text_results in results.items():
+        for labels, member, result in zip(
+            labels_by_member, _members(task), text_results if isinstance(task, FusedClassification) else (text_results,)
+        ):
+            if not result.get("error"):
+                labels[text] = result[member.result_key]
+    return labels_by_member
+
+
+SENTIMENT = ClassificationTask(
+    result_key="sentiment",
+    labels=["POSITIVE", "NEGATIVE", "NEUTRAL"],
+    default_label="NEUTRAL",
+    instruction="You are an AI assistant that classifies the sentiment of short text messages.",
+    single_prompt="""You are an AI assistant that classifies the sentiment of short text messages.
+            For each input message, respond with exactly one of: POSITIVE, NEGATIVE, or NEUTRAL.
+            Respond only with the label, no explanations.
+            """,
+    # LLM labels carry no confidence (only the local backend reports one)
+    error_extra={"score": 0.5},
+)
+
+TOXICITY = ClassificationTask(
+    result_key="toxicity",
+    labels=["TOXIC", "NON_TOXIC"],
+    default_label="NON_TOXIC",
+    instruction="You are an AI assistant that detects toxic content in text messages.",
+    single_prompt="""You are an AI assistant that detects toxic content in text messages.
+For each input message, respond with exactly one of: TOXIC or NON_TOXIC.
+Respond only with the label, no explanations.""",
+    error_extra={"score": 0.1},
+)
@@ -0,0 +1,11 @@
+import os
+
+# Names shared by the API and the workers. Dependency-free, so the API can validate requests
+# without loading the worker stack (NumPy, the local classifier's process pool, the OpenAI client).
+
+# Backend used by classification blocks unless their config sets "backend"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "openai")
+# Inference backends a classification block can name (implemented in workers.backends)
+BACKEND_NAMES = ["openai", "local", "cascade"]
+# Model routing priorities, from the fastest model to the cheapest (weighted in workers.model_router)
+ROUTING_PRIORITY_NAMES = ["urgent", "normal", "bulk"]
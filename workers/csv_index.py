@@ -0,0 +1,140 @@
+import io
+import json
+import mmap
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Byte offset of every Nth data row; a row range is read by seeking to the nearest offset before it
+CSV_INDEX_EVERY_ROWS = int(os.getenv("CSV_INDEX_EVERY_ROWS", 10000))
+# The CSV reader block indexes files at least this large instead of parsing them (config "indexed" overrides)
+CSV_INDEX_MIN_BYTES = int(os.getenv("CSV_INDEX_MIN_BYTES", 64 * 1024 * 1024))
+CSV_INDEX_SUFFIX = ".rowidx.json"
+SCAN_BLOCK_BYTES = 8 * 1024 * 1024
+NEWLINE, QUOTE = ord("\n"), ord('"')
+
+
+def index_path(file_path: str) -> str:
+    """The index is kept next to the file it describes"""
+    return file_path + CSV_INDEX_SUFFIX
+
+
+class RowIndexBuilder:
+    """Incremental row boundary scan (newlines outside quoted fields): feed() the file's bytes in order, then index().
+
+    Lets a writer index a file while it streams it (e.g. an upload) instead of rescanning it afterwards.
+    """
+
+    def __init__(self, every: int = CSV_INDEX_EVERY_ROWS):
+        self.every = every
+        self.size = 0
+        self.offsets: List[int] = []
+        self.header_end = None
+        self.next_row = -1  # the row that starts after the next row-ending newline (-1 while in the header)
+        self.last_end = -1
+        self.quoted = 0
+
+    def feed(self, block: np.ndarray):
+        """Scan the next uint8 block of the file"""
+        start = self.size
+        self.size += len(block)
+        if not len(block):
+            return
+        # Quote parity at every byte ("" escapes flip it twice); uint8 cumsum wraps but keeps the parity
+        parity = (np.cumsum(block == QUOTE, dtype=np.uint8) + self.quoted) & 1
+        ends = np.flatnonzero((block == NEWLINE) & (parity == 0)) + start
+        self.quoted = int(parity[-1])
+        del parity
+        if not len(ends):
+            return
+        if self.header_end is None:
+            self.header_end = int(ends[0]) + 1
+        # Row next_row + k starts right after ends[k]
+        rows = np.arange(self.next_row + 1, self.next_row + 1 + len(ends))
+        self.offsets.extend(int(end) + 1 for end in ends[(rows >= 0) & (rows % self.every == 0)])
+        self.next_row += len(ends)
+        self.last_end = int(ends[-1])
+
+    def index(self, file_path: str) -> Dict[str, Any]:
+        """The index of the fed bytes, stamped with the file's current size and mtime"""
+        size = self.size
+        # A trailing newline opens no further row
+        row_count = max(0, self.next_row + (0 if self.last_end == size - 1 else 1)) if self.header_end is not None else 0
+        return {
+            "file_size": os.path.getsize(file_path),
+            "mtime": os.path.getmtime(file_path),
+            "every": self.every,
+            "row_count": row_count,
+            "header_end": self.header_end if self.header_end is not None else size,
+            "offsets": [offset for offset in self.offsets if offset < size],
+        }
+
+
+def build_row_index(file_path: str, every: int = CSV_INDEX_EVERY_ROWS) -> Dict[str, Any]:
+    """Scan a memory-mapped CSV for row boundaries without parsing it.
+
+    offsets[i] is the byte where data row i * every starts; the header is not a data row.
+    """
+    size = os.path.getsize(file_path)
+    builder = RowIndexBuilder(every)
+    if size:
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(0, size, SCAN_BLOCK_BYTES):
+                block = np.frombuffer(mm, dtype=np.uint8, count=min(SCAN_BLOCK_BYTES, size - start), offset=start)
+                builder.feed(block)
+                del block
+    return builder.index(file_path)
+
+
+def save_row_index(file_path: str, index: Dict[str, Any]):
+    path = index_path(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def load_row_index(file_path: str) -> Optional[Dict[str, Any]]:
+    """The persisted index, unless the file has changed since it was built"""
+    try:
+        with open(index_path(file_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("file_size") != os.path.getsize(file_path) or index.get("mtime") != os.path.getmtime(file_path):
+        return None
+    return index
+
+
+def ensure_row_index(file_path: str, every: int = CSV_INDEX_EVERY_ROWS) -> Dict[str, Any]:
+    index = load_row_index(file_path)
+    if index is None:
+        index = build_row_index(file_path, every)
+        save_row_index(file_path, index)
+    return index
+
+
+def read_row_range(file_path: str, index: Dict[str, Any], columns: List[str], usecols: List[str],
+                   start: int, end: int) -> pd.DataFrame:
+    """Data rows [start, end) as strings, parsing only the byte range that holds them"""
+    end = min(end, index["row_count"])
+    if end <= start:
+        return pd.DataFrame({column: pd.Series(dtype=str) for column in usecols})
+    every, offsets, size = index["every"], index["offsets"], index["file_size"]
+    first, last = start // every, -(-end // every)
+    begin = offsets[first] if first < len(offsets) else size
+    stop = offsets[last] if last < len(offsets) else size
+    with open(file_path, "rb") as f:
+        f.seek(begin)
+        data = f.read(stop - begin)
+
+    # Blank lines are rows to the index, so they are kept to stay aligned with it
+    df = pd.read_csv(
+        io.BytesIO(data), header=None, names=columns, usecols=usecols, dtype={column: str for column in usecols},
+        na_filter=False, skip_blank_lines=False,
+    )
+    skip = start - first * every
+    return df.iloc[skip:skip + end - start]
@@ -0,0 +1,51 @@
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: pandas' C parser is used without it
+    pa = pa_csv = None
+
+# Rows per parsed chunk (pandas parser); bounds the reader's peak memory independently of the file size
+CSV_READER_CHUNK_ROWS = int(os.getenv("CSV_READER_CHUNK_ROWS", 100000))
+# Bytes per record batch when pyarrow parses the file
+CSV_READER_BLOCK_BYTES = int(os.getenv("CSV_READER_BLOCK_BYTES", 16 * 1024 * 1024))
+CSV_READER_ENGINE = os.getenv("CSV_READER_ENGINE", "pyarrow" if pa_csv is not None else "c")
+# Columns recognised as the row id, first match wins
+ID_COLUMNS = ["id", "ID", "Id", "row_id"]
+
+
+def read_header(file_path: str) -> List[str]:
+    """Column names, without parsing any rows"""
+    return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+
+def pick_columns(columns: List[str]) -> Tuple[str, Optional[str]]:
+    """The text column ("text", else the first column) and the id column, if there is one"""
+    text_column = "text" if "text" in columns else columns[0]
+    id_column = next((column for column in ID_COLUMNS if column in columns and column != text_column), None)
+    return text_column, id_column
+
+
+def iter_csv_chunks(file_path: str, usecols: List[str], chunk_rows: int = CSV_READER_CHUNK_ROWS,
+                    engine: str = CSV_READER_ENGINE) -> Iterator[pd.DataFrame]:
+    """Parse only `usecols`, as strings (empty fields stay ""), one bounded DataFrame at a time"""
+    if engine == "pyarrow" and pa_csv is not None:
+        convert_options = pa_csv.ConvertOptions(
+            include_columns=usecols,
+            column_types={column: pa.string() for column in usecols},
+        )
+        with pa_csv.open_csv(file_path, read_options=pa_csv.ReadOptions(block_size=CSV_READER_BLOCK_BYTES),
+                             convert_options=convert_options) as reader:
+            for batch in reader:
+                yield batch.to_pandas()
+        return
+
+    # pandas' pyarrow engine cannot read in chunks, so the C parser is the streaming fallback
+    yield from pd.read_csv(
+        file_path, usecols=usecols, dtype={column: str for column in usecols}, na_filter=False, chunksize=chunk_rows,
+        engine="c",
+    )
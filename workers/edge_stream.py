@@ -0,0 +1,156 @@
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+# Streaming edges: an upstream block appends micro-batches to one Redis Stream per downstream edge
+EDGE_STREAM_BATCH_ROWS = int(os.getenv("EDGE_STREAM_BATCH_ROWS", 500))
+# Unconsumed batches allowed per edge before the producer waits for its (live) consumer
+EDGE_STREAM_MAX_PENDING = int(os.getenv("EDGE_STREAM_MAX_PENDING", 20))
+EDGE_STREAM_BLOCK_MS = int(os.getenv("EDGE_STREAM_BLOCK_MS", 5000))
+# A consumer gives up when its producer has been silent this long (e.g. the upstream worker died)
+EDGE_STREAM_IDLE_TIMEOUT = float(os.getenv("EDGE_STREAM_IDLE_TIMEOUT", 600))
+EDGE_STREAM_TTL = int(os.getenv("EDGE_STREAM_TTL", 86400))
+READER_HEARTBEAT_TTL = 30
+
+
+def edge_stream_key(pipeline_run_id: int, from_block_id: int, to_block_id: int) -> str:
+    return f"edge_stream:{pipeline_run_id}:{from_block_id}:{to_block_id}"
+
+
+def _reader_key(stream: str) -> str:
+    return f"{stream}:reader"
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class EdgeStreamWriter:
+    """Buffers output items and appends them as micro-batches to every downstream edge stream.
+
+    Used as a context manager: a clean exit appends an end-of-stream marker, an
+    exception appends an error marker so consumers fail instead of waiting.
+    With no streams every call is a no-op.
+    """
+
+    def __init__(self, redis_conn, streams: List[str], batch_rows: int = EDGE_STREAM_BATCH_ROWS, max_pending: int = EDGE_STREAM_MAX_PENDING):
+        self.redis_conn = redis_conn
+        self.streams = list(streams or [])
+        self.batch_rows = batch_rows
+        self.max_pending = max_pending
+        self.batches_sent = 0
+        self.closed = False
+        self._buffer: List[Any] = []
+
+    def __enter__(self) -> "EdgeStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.closed:
+            return False
+        if exc is None:
+            self.close()
+        else:
+            self.abort(str(exc))
+        return False
+
+    def write(self, items: List[Any]):
+        if not self.streams:
+            return
+        self._buffer.extend(items)
+        while len(self._buffer) >= self.batch_rows:
+            batch, self._buffer = self._buffer[:self.batch_rows], self._buffer[self.batch_rows:]
+            self._send(batch)
+
+    def flush(self):
+        if self.streams and self._buffer:
+            batch, self._buffer = self._buffer, []
+            self._send(batch)
+
+    def close(self):
+        """Send what is buffered, then the end-of-stream marker"""
+        self.flush()
+        self._append({"type": "eos"})
+        self.closed = True
+
+    def abort(self, error: str):
+        self._buffer = []
+        self._append({"type": "error", "error": error})
+        self.closed = True
+
+    def _send(self, items: List[Any]):
+        self._wait_for_capacity()
+        self._append({"type": "batch", "items": json.dumps(items, default=str)})
+        self.batches_sent += 1
+
+    def _wait_for_capacity(self):
+        """Backpressure: wait while a running consumer is max_pending batches behind.
+
+        A consumer that has not started yet (e.g. still queued behind this job)
+        never blocks the producer, so a busy worker pool cannot deadlock.
+        """
+        while True:
+            pipe = self.redis_conn.pipeline()
+            for stream in self.streams:
+                pipe.xlen(stream)
+                pipe.exists(_reader_key(stream))
+            replies = pipe.execute()
+            if not any(
+                pending >= self.max_pending and reader_alive
+                for pending, reader_alive in zip(replies[0::2], replies[1::2])
+            ):
+                return
+            time.sleep(0.1)
+
+    def _append(self, fields: Dict[str, str]):
+        if not self.streams:
+            return
+        pipe = self.redis_conn.pipeline()
+        for stream in self.streams:
+            pipe.xadd(stream, fields)
+            pipe.expire(stream, EDGE_STREAM_TTL)
+        pipe.execute()
+
+
+class EdgeStreamReader:
+    """Iterates an upstream edge stream's micro-batches until end-of-stream, deleting each once it is consumed"""
+
+    def __init__(self, redis_conn, stream: str, block_ms: int = EDGE_STREAM_BLOCK_MS, idle_timeout: float = EDGE_STREAM_IDLE_TIMEOUT):
+        self.redis_conn = redis_conn
+        self.stream = stream
+        self.block_ms = block_ms
+        self.idle_timeout = idle_timeout
+
+    def heartbeat(self):
+        """Tell the producer a consumer is draining this edge (call while working through a long batch)"""
+        self.redis_conn.set(_reader_key(self.stream), 1, ex=READER_HEARTBEAT_TTL)
+
+    def __iter__(self) -> Iterator[List[Any]]:
+        last_id = "0"
+        last_seen = time.time()
+        try:
+            while True:
+                self.heartbeat()
+                response = self.redis_conn.xread({self.stream: last_id}, count=1, block=self.block_ms)
+                if not response:
+                    if time.time() - last_seen > self.idle_timeout:
+                        raise TimeoutError(f"No data on {self.stream} for {self.idle_timeout:.0f}s")
+                    continue
+
+                for entry_id, fields in response[0][1]:
+                    last_id = entry_id
+                    last_seen = time.time()
+                    fields = {_decode(key): _decode(value) for key, value in fields.items()}
+
+                    if fields.get("type") == "eos":
+                        self.redis_conn.delete(self.stream)
+                        return
+                    if fields.get("type") == "error":
+                        raise RuntimeError(f"Upstream block failed: {fields.get('error')}")
+
+                    yield json.loads(fields["items"])
+                    # Deleting consumed batches frees the producer's backpressure budget
+                    self.redis_conn.xdel(self.stream, entry_id)
+        finally:
+            self.redis_conn.delete(_reader_key(self.stream))
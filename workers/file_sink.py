@@ -0,0 +1,216 @@
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for csv.zst output
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for parquet output
+    pa = pq = None
+
+# Output file formats of the file writer block and their file extensions
+FILE_SINK_EXTENSIONS = {"csv": ".csv", "csv.gz": ".csv.gz", "csv.zst": ".csv.zst", "jsonl": ".jsonl", "parquet": ".parquet"}
+# Rows per Parquet part file; a partition rolls over to a new part once it is full
+FILE_SINK_PARQUET_PART_ROWS = int(os.getenv("FILE_SINK_PARQUET_PART_ROWS", 1000000))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+
+def open_file_sink(base_path: str, output_format: str, partition_by: str = None) -> "FileSink":
+    """Sink writing rows to base_path + the format's extension (a directory of part files for parquet)"""
+    if output_format not in FILE_SINK_EXTENSIONS:
+        raise ValueError(f"Unknown output format: {output_format} (expected one of {', '.join(FILE_SINK_EXTENSIONS)})")
+    path = base_path + FILE_SINK_EXTENSIONS[output_format]
+    if output_format == "parquet":
+        if pq is None:
+            raise ValueError("parquet output needs pyarrow installed")
+        return ParquetFileSink(path, output_format, partition_by)
+    if output_format == "csv.zst" and zstandard is None:
+        raise ValueError("csv.zst output needs zstandard installed")
+    if output_format == "jsonl":
+        return JsonlFileSink(path, output_format)
+    return CsvFileSink(path, output_format)
+
+
+class FileSink:
+    """Rows appended batch by batch to a temp path in the output directory, renamed into place by close().
+
+    Used as a context manager: the output appears on a clean exit and is
+    removed on an exception (or discard()), so readers never see a partial file.
+    The columns are fixed by the first batch, plus an "error" column.
+    """
+
+    def __init__(self, path: str, output_format: str):
+        self.path = path
+        self.output_format = output_format
+        self.filename = os.path.basename(path)
+        self.records_written = 0
+        self.columns = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def __enter__(self) -> "FileSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._tmp_path is None:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if self.columns is None:
+            self.columns = list(dict.fromkeys([*rows[0].keys(), "error"]))
+        self._write(rows)
+        self.records_written += len(rows)
+
+    def close(self) -> Dict[str, Any]:
+        self._finish()
+        os.rename(self._tmp_path, self.path)
+        self._tmp_path = None
+        return self.info()
+
+    def discard(self):
+        self._finish()
+        if os.path.isdir(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+        elif os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._tmp_path = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "output_path": self.path,
+            "filename": self.filename,
+            "format": self.output_format,
+            "records_written": self.records_written,
+            "file_size_bytes": os.path.getsize(self.path),
+        }
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class CsvFileSink(FileSink):
+    """CSV text, optionally gzip- or zstd-compressed as it is written"""
+
+    def __init__(self, path: str, output_format: str):
+        super().__init__(path, output_format)
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+        self._raw = os.fdopen(fd, "wb")
+        if output_format == "csv.gz":
+            compressed = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif output_format == "csv.zst":
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._raw, closefd=False)
+        else:
+            compressed = self._raw
+        self._text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        self._writer = None
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._text, fieldnames=self.columns, extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerows(rows)
+
+    def _finish(self):
+        # Closing the text layer flushes the compressor's trailer; the raw file is closed last
+        if not self._text.closed:
+            self._text.close()
+        if not self._raw.closed:
+            self._raw.close()
+
+
+class JsonlFileSink(CsvFileSink):
+    """One JSON object per line (rows keep all their keys)"""
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        self._text.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+
+
+class ParquetFileSink(FileSink):
+    """A directory of Parquet part files, one record batch (row group) per write.
+
+    With partition_by, rows are split into hive-style <column>=<value>/
+    subdirectories; each partition rolls over to a new part file every
+    FILE_SINK_PARQUET_PART_ROWS rows.
+    """
+
+    def __init__(self, path: str, output_format: str, partition_by: str = None):
+        super().__init__(path, output_format)
+        self.partition_by = partition_by
+        self._tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+        self._schema = None
+        self._parts = {}  # partition directory -> [writer, part number, rows in part]
+        self.files = 0
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        if self._schema is None:
+            # Columns still all-null in the first batch (e.g. error) are typed as strings
+            inferred = pa.Table.from_pylist(rows).schema
+            self._schema = pa.schema([
+                pa.field(column, _string_or(inferred.field(column).type) if column in inferred.names else pa.string())
+                for column in self.columns
+            ])
+        groups = {}
+        for row in rows:
+            value = row.get(self.partition_by) if self.partition_by else None
+            key = f"{self.partition_by}={str(value).replace('/', '_')}" if self.partition_by else ""
+            groups.setdefault(key, []).append(row)
+        for key, group in groups.items():
+            self._part_writer(key, len(group)).write_table(pa.Table.from_pylist(group, schema=self._schema))
+
+    def _part_writer(self, key: str, rows: int):
+        part = self._parts.get(key)
+        if part is not None and part[2] >= FILE_SINK_PARQUET_PART_ROWS:
+            part[0].close()
+            part = [None, part[1] + 1, 0]
+        if part is None or part[0] is None:
+            number = part[1] if part else 0
+            directory = os.path.join(self._tmp_path, key)
+            os.makedirs(directory, exist_ok=True)
+            part = [pq.ParquetWriter(os.path.join(directory, f"part-{number:05d}.parquet"), self._schema), number, 0]
+            self._parts[key] = part
+            self.files += 1
+        part[2] += rows
+        return part[0]
+
+    def _finish(self):
+        for part in self._parts.values():
+            if part[0] is not None:
+                part[0].close()
+                part[0] = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            **super().info(),
+            "file_size_bytes": sum(
+                os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(self.path) for name in names
+            ),
+            "files": self.files,
+            # Part file paths relative to the output directory, e.g. results.parquet/label=positive/part-00000.parquet
+            "part_files": sorted(
+                os.path.relpath(os.path.join(directory, name), os.path.dirname(self.path))
+                for directory, _, names in os.walk(self.path) for name in names
+            ),
+            "partition_by": self.partition_by,
+        }
+
+
+def _string_or(arrow_type):
+    return pa.string() if pa.types.is_null(arrow_type) else arrow_type
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+# Two-tier cache of LLM answers: a local SQLite file per worker host in front of a Redis tier shared by all workers
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 86400))
+LLM_CACHE_REDIS_MAX_ENTRIES = int(os.getenv("LLM_CACHE_REDIS_MAX_ENTRIES", 1000000))
+LLM_CACHE_LOCAL_PATH = os.getenv("LLM_CACHE_LOCAL_PATH", "/app/cache/llm_cache.sqlite")
+LLM_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("LLM_CACHE_LOCAL_MAX_ENTRIES", 200000))
+LLM_CACHE_KEY = "llm_cache:{key}"
+# Sorted set of cache keys by last access, used to evict the least recently used entries
+LLM_CACHE_LRU_KEY = "llm_cache:lru"
+# Keys per SQLite IN (...) query, well under the bound-parameter limit
+SQLITE_CHUNK = 500
+
+
+class LLMCache:
+    """Key -> answer cache with a TTL and an LRU entry bound on each tier.
+
+    Lookups try the local tier, then Redis (backfilling local hits); writes go
+    to both. Every operation fails open: a broken tier only costs cache hits.
+    Counts are added to the caller's `stats` (hits per tier, evictions).
+    """
+
+    def __init__(self, redis_conn=None, local_path: str = LLM_CACHE_LOCAL_PATH, ttl: int = LLM_CACHE_TTL,
+                 redis_max_entries: int = LLM_CACHE_REDIS_MAX_ENTRIES, local_max_entries: int = LLM_CACHE_LOCAL_MAX_ENTRIES):
+        self.redis_conn = redis_conn
+        self.local_path = local_path
+        self.ttl = ttl
+        self.redis_max_entries = redis_max_entries
+        self.local_max_entries = local_max_entries
+        self._lock = threading.Lock()
+        self._pid = None
+        self._db = None
+
+    def _local(self) -> sqlite3.Connection:
+        # One connection per process (a forked work-horse must not reuse its parent's)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = None
+            try:
+                os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+                db = sqlite3.connect(self.local_path, timeout=10, check_same_thread=False, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+                self._db = db
+            except Exception as e:
+                print(f"⚠️  Local LLM cache unavailable ({self.local_path}): {e}")
+        return self._db
+
+    def get_many(self, keys: List[str], stats: Counter = None) -> Dict[str, str]:
+        """Cached values of the keys that are present and not expired"""
+        stats = stats if stats is not None else Counter()
+        found = self._local_get(keys)
+        stats["local_hits"] += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_redis = self._redis_get(missing)
+            stats["redis_hits"] += len(from_redis)
+            if from_redis:
+                self._local_set(from_redis, stats)
+            found.update(from_redis)
+        return found
+
+    def set_many(self, items: Dict[str, str], stats: Counter = None):
+        if not items:
+            return
+        stats = stats if stats is not None else Counter()
+        self._local_set(items, stats)
+        self._redis_set(items, stats)
+
+    def _local_get(self, keys: List[str]) -> Dict[str, str]:
+        db = self._local()
+        if db is None or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        try:
+            with self._lock:
+                for i in range(0, len(keys), SQLITE_CHUNK):
+                    chunk = keys[i:i + SQLITE_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = db.execute(
+                        f"SELECT key, value FROM llm_cache WHERE key IN ({placeholders}) AND expires_at > ?", (*chunk, now)
+                    ).fetchall()
+                    found.update(rows)
+                    if rows:
+                        hit_keys = [key for key, _ in rows]
+                        db.execute(
+                            f"UPDATE llm_cache SET accessed_at = ? WHERE key IN ({','.join('?' * len(hit_keys))})", (now, *hit_keys)
+                        )
+        except Exception as e:
+            print(f"⚠️  Error reading local LLM cache: {e}")
+        return found
+
+    def _local_set(self, items: Dict[str, str], stats: Counter):
+        db = self._local()
+        if db is None:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                db.execute("BEGIN IMMEDIATE")
+                db.executemany(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(key, value, now + self.ttl, now) for key, value in items.items()]
+                )
+                db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                excess = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.local_max_entries
+                if excess > 0:
+                    db.execute(
+                        "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)", (excess,)
+                    )
+                    stats["evictions"] += excess
+                db.execute("COMMIT")
+        except Exception as e:
+            print(f"⚠️  Error writing local LLM cache: {e}")
+            try:
+                db.execute("ROLLBACK")
+            except Exception:
+                pass
+
+    def _redis_get(self, keys: List[str]) -> Dict[str, str]:
+        if self.redis_conn is None:
+            return {}
+        try:
+            values = self.redis_conn.mget([LLM_CACHE_KEY.format(key=key) for key in keys])
+            found = {key: value for key, value in zip(keys, values) if value is not None}
+            if found:
+                self.redis_conn.zadd(LLM_CACHE_LRU_KEY, {key: time.time() for key in found})
+            return found
+        except Exception as e:
+            print(f"⚠️  Error reading LLM cache from Redis: {e}")
+            return {}
+
+    def _redis_set(self, items: Dict[str, str], stats: Counter):
+        if self.redis_conn is None:
+            return
+        now = time.time()
+        try:
+            pipe = self.redis_conn.pipeline()
+            for key, value in items.items():
+                pipe.set(LLM_CACHE_KEY.format(key=key), value, ex=self.ttl)
+            pipe.zadd(LLM_CACHE_LRU_KEY, {key: now for key in items})
+            # Entries past their TTL are already gone from Redis
+            pipe.zremrangebyscore(LLM_CACHE_LRU_KEY, "-inf", now - self.ttl)
+            pipe.zcard(LLM_CACHE_LRU_KEY)
+            size = pipe.execute()[-1]
+
+            excess = size - self.redis_max_entries
+            if excess > 0:
+                evicted = [key for key, _ in self.redis_conn.zpopmin(LLM_CACHE_LRU_KEY, excess)]
+                if evicted:
+                    self.redis_conn.delete(*[LLM_CACHE_KEY.format(key=key) for key in evicted])
+                    stats["evictions"] += len(evicted)
+        except Exception as e:
+            print(f"⚠️  Error writing LLM cache to Redis: {e}")
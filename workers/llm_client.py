@@ -0,0 +1,269 @@
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from workers.rate_limiter import RateLimiter, estimate_tokens
+
+# Model used by LLM blocks unless their config names one
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Concurrent requests per LLM block (override per block with config["llm_concurrency"])
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 16))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+# Retries of rate-limited or transient failures (429s wait for the shared limiter, not a local sleep)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+# Hard deadline of one request, from send to parsed response (limiter waits are not counted)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 20))
+# Hedging: a request still running after this percentile of its model's recent latency gets a duplicate
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", 0.05))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+
+# Usage meter of the job calling map() (see workers.metering); map() carries it onto the event loop
+current_meter: ContextVar = ContextVar("current_meter", default=None)
+
+
+class LatencyTracker:
+    """Recent request latencies, outcomes and hedge decisions per model, over a sliding window of calls.
+
+    Requests record into it on the client's event loop while routing reads it
+    from the task thread, hence the lock.
+    """
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW, min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 percentile: float = LLM_HEDGE_PERCENTILE, max_rate: float = LLM_HEDGE_MAX_RATE):
+        self.min_samples = min_samples
+        self.percentile_rank = percentile
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._failures = defaultdict(lambda: deque(maxlen=window))
+        self._hedged = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, model: str, seconds: float, failed: bool = False):
+        with self._lock:
+            self._latencies[model].append(seconds)
+            self._failures[model].append(failed)
+
+    def record_failure(self, model: str):
+        """A request that failed without a meaningful latency"""
+        with self._lock:
+            self._failures[model].append(True)
+
+    def samples(self, model: str) -> int:
+        with self._lock:
+            return len(self._latencies[model])
+
+    def percentile(self, model: str, rank: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies[model])
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * rank / 100))]
+
+    def error_rate(self, model: str) -> float:
+        with self._lock:
+            outcomes = list(self._failures[model])
+        return sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """How long to wait before hedging (None until enough latencies have been seen)"""
+        if self.samples(model) < self.min_samples:
+            return None
+        return self.percentile(model, self.percentile_rank)
+
+    def allow_hedge(self, model: str) -> bool:
+        """Whether one more hedge keeps the model's hedge rate under the cap"""
+        with self._lock:
+            decisions = list(self._hedged[model])
+        return sum(decisions) + 1 <= self.max_rate * (len(decisions) + 1)
+
+    def record_call(self, model: str, hedged: bool):
+        with self._lock:
+            self._hedged[model].append(hedged)
+
+
+class LLMClient:
+    """One pooled keep-alive AsyncOpenAI client per worker process.
+
+    The client lives on a background event loop so the synchronous RQ task
+    code can submit a whole batch and wait for it; connections are reused
+    across batches and jobs handled by the same process.
+    """
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._client = None
+        self._rate_limiter = None
+        self.latency = LatencyTracker()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # A forked work-horse inherits the parent's objects but not its loop thread
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._loop = asyncio.new_event_loop()
+                    self._client = None
+                    self._rate_limiter = None
+                    threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True).start()
+                    self._pid = os.getpid()
+        return self._loop
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """The shared AsyncOpenAI client (created on first use, inside the background loop)"""
+        if self._client is None:
+            # Read lazily so a .env loaded after import is honoured
+            api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY environment variable not set")
+            self._client = AsyncOpenAI(
+                api_key=api_key,
+                timeout=LLM_TIMEOUT,
+                # Retries happen in complete() so every 429 reaches the shared limiter
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    timeout=LLM_TIMEOUT,
+                ),
+            )
+        return self._client
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        if self._rate_limiter is None:
+            self._rate_limiter = RateLimiter(self.client.api_key)
+        return self._rate_limiter
+
+    async def complete(self, system_prompt: str, user_prompt: str, model: str = LLM_MODEL, max_tokens: int = 10,
+                       temperature: float = 0.1, response_format: dict = None) -> str:
+        """Single chat completion, paced by the shared rate limiter and hedged; returns the stripped message content"""
+        estimated = estimate_tokens(system_prompt + user_prompt, max_tokens)
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **({"response_format": response_format} if response_format else {}),
+        }
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            if attempt:
+                _meter(model, "retries")
+            try:
+                response = await self._hedged(model, request, estimated)
+            except RateLimitError as e:
+                await self.rate_limiter.pause(model, e.response.headers)
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                continue
+            except (APIConnectionError, APITimeoutError, InternalServerError, asyncio.TimeoutError):
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+
+            return response.choices[0].message.content.strip()
+
+    async def _hedged(self, model: str, request: dict, estimated: int):
+        """Send the request; if it has not answered by the model's p95 latency, race a duplicate and keep the first answer"""
+        await self.rate_limiter.acquire(model, estimated)
+        tasks = [asyncio.ensure_future(self._request(model, request, estimated))]
+        try:
+            delay = self.latency.hedge_delay(model)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.latency.allow_hedge(model):
+                    # The duplicate is paced like any other request
+                    await self.rate_limiter.acquire(model, estimated)
+                    if not tasks[0].done():
+                        print(f"⏱️  {model} request exceeded p{LLM_HEDGE_PERCENTILE:g} ({delay:.2f}s), sending a hedge")
+                        tasks.append(asyncio.ensure_future(self._request(model, request, estimated)))
+                        _meter(model, "hedges")
+            self.latency.record_call(model, hedged=len(tasks) > 1)
+            return await _first_success(tasks)
+        finally:
+            # The slower copy (or both, on cancellation) is abandoned
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _request(self, model: str, request: dict, estimated: int):
+        """One chat completion under the hard deadline; feeds the latency tracker and the rate limiter"""
+        started = time.monotonic()
+        try:
+            raw = await asyncio.wait_for(self.client.chat.completions.with_raw_response.create(**request), timeout=LLM_DEADLINE)
+        except asyncio.TimeoutError:
+            # Timed-out requests count at the deadline, so the percentile is not biased towards fast calls
+            self.latency.record(model, LLM_DEADLINE, failed=True)
+            _meter(model, "failures")
+            print(f"⏱️  {model} request hit the {LLM_DEADLINE:g}s deadline")
+            raise
+        except Exception:
+            self.latency.record_failure(model)
+            _meter(model, "failures")
+            raise
+        seconds = time.monotonic() - started
+        self.latency.record(model, seconds)
+
+        response = raw.parse()
+        used = response.usage.total_tokens if response.usage else None
+        meter = current_meter.get()
+        if meter is not None:
+            usage = response.usage
+            meter.record_call(model, usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0, seconds)
+        await self.rate_limiter.observe(model, raw.headers, estimated, used)
+        return response
+
+    def map(self, func: Callable[[Any], Awaitable[Any]], items: List[Any], concurrency: int = LLM_CONCURRENCY) -> List[Any]:
+        """Run func over items with at most `concurrency` in flight; results (or exceptions) keep input order"""
+        if not items:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._gather(func, items, concurrency, current_meter.get()), self._ensure_loop())
+        return future.result()
+
+    async def _gather(self, func, items: List[Any], concurrency: int, meter=None) -> List[Any]:
+        # Every request task created below inherits the caller's meter
+        current_meter.set(meter)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(item):
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+
+def _meter(model: str, counter: str):
+    meter = current_meter.get()
+    if meter is not None:
+        meter.record(model, counter)
+
+
+async def _first_success(tasks: List[asyncio.Future]):
+    """Result of the first task to succeed; if every task fails, the first failure is raised"""
+    pending = set(tasks)
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                return task.result()
+            error = error or task.exception()
+    raise error
+
+
+llm_client = LLMClient()
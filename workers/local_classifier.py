@@ -0,0 +1,115 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Hashed unigram + bigram features; a trained model ({result_key}.npz with weights, bias, labels) overrides the lexicon
+LOCAL_MODEL_DIR = os.getenv("LOCAL_MODEL_DIR", "/app/models")
+HASH_BUCKETS = 2 ** 18
+# Score of one lexicon word. Against the fallback label's bias this puts a text with no signal, mixed signals or a
+# single toxic word under the default cascade threshold (0.8), and one clear sentiment word or a clean text above it
+LEXICON_WEIGHT = 3.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+NEGATIONS = ["not", "no", "never", "don't", "dont", "isn't", "wasn't", "can't", "cannot", "won't"]
+
+POSITIVE_WORDS = [
+    "good", "great", "best", "love", "loved", "loving", "awesome", "amazing", "excellent", "happy", "glad", "nice",
+    "fantastic", "wonderful", "perfect", "beautiful", "enjoy", "enjoyed", "fun", "proud", "thanks", "thank",
+    "excited", "brilliant", "delicious", "recommend", "helpful", "impressed", "cool", "like", "liked", "win", "yay",
+]
+NEGATIVE_WORDS = [
+    "bad", "worst", "hate", "hated", "awful", "terrible", "horrible", "sad", "angry", "annoying", "annoyed", "rude",
+    "disappointed", "disappointing", "broken", "poor", "slow", "boring", "ugly", "fail", "failed", "sucks", "wrong",
+    "problem", "issue", "stupid", "waste", "upset", "frustrated", "frustrating", "sick", "tired", "late", "cancelled",
+]
+TOXIC_WORDS = [
+    "idiot", "idiots", "stupid", "moron", "morons", "dumb", "loser", "losers", "shut", "hate", "kill", "die", "trash",
+    "garbage", "pathetic", "disgusting", "ugly", "fool", "fools", "worthless", "useless", "jerk", "freak", "scum",
+    "damn", "crap", "suck", "sucks", "shit", "fuck", "fucking", "bitch", "bastard", "ass", "asshole",
+]
+
+
+def feature_index(feature: str) -> int:
+    # crc32 is stable across processes (unlike hash()), so every pool worker shares one feature space
+    return zlib.crc32(feature.encode("utf-8")) % HASH_BUCKETS
+
+
+def features(text: str) -> List[int]:
+    tokens = TOKEN_PATTERN.findall(str(text).lower())
+    return [feature_index(token) for token in tokens] + [
+        feature_index(f"{first} {second}") for first, second in zip(tokens, tokens[1:])
+    ]
+
+
+class HashedLinearClassifier:
+    """Linear model over hashed n-gram counts: label = argmax(counts @ weights + bias), confidence = its softmax"""
+
+    def __init__(self, labels: List[str], weights: np.ndarray, bias: np.ndarray):
+        self.labels = list(labels)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+
+    @classmethod
+    def from_lexicon(cls, labels: List[str], lexicon: Dict[str, List[str]], bias: Dict[str, float]) -> "HashedLinearClassifier":
+        """Weights from word lists; a negated word ("not good") cancels the word's vote"""
+        weights = np.zeros((HASH_BUCKETS, len(labels)), dtype=np.float32)
+        for label, words in lexicon.items():
+            column = labels.index(label)
+            for word in words:
+                weights[feature_index(word), column] += LEXICON_WEIGHT
+                for negation in NEGATIONS:
+                    weights[feature_index(f"{negation} {word}"), column] -= LEXICON_WEIGHT
+        return cls(labels, weights, np.array([bias.get(label, 0.0) for label in labels]))
+
+    @classmethod
+    def load(cls, path: str) -> "HashedLinearClassifier":
+        data = np.load(path, allow_pickle=False)
+        return cls([str(label) for label in data["labels"]], data["weights"], data["bias"])
+
+    def predict(self, texts: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Labels and confidences of a whole batch, scored with one gather and one bincount per label"""
+        indices = [features(text) for text in texts]
+        rows = np.repeat(np.arange(len(texts)), [len(row) for row in indices])
+        flat = np.fromiter((index for row in indices for index in row), dtype=np.int64, count=len(rows))
+
+        contributions = self.weights[flat]
+        scores = np.stack([
+            np.bincount(rows, weights=contributions[:, column], minlength=len(texts))
+            for column in range(len(self.labels))
+        ], axis=1) + self.bias
+
+        best = scores.argmax(axis=1)
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        confidence = exp[np.arange(len(texts)), best] / exp.sum(axis=1)
+        return [self.labels[index] for index in best], confidence
+
+
+# Lexicon defaults per task (result_key); a text with no signal falls to the label with the highest bias.
+# A clean text is confidently non-toxic, but no sentiment word says little about sentiment.
+LEXICON_MODELS = {
+    "sentiment": (["POSITIVE", "NEGATIVE", "NEUTRAL"], {"POSITIVE": POSITIVE_WORDS, "NEGATIVE": NEGATIVE_WORDS}, {"NEUTRAL": 1.0}),
+    "toxicity": (["TOXIC", "NON_TOXIC"], {"TOXIC": TOXIC_WORDS}, {"NON_TOXIC": 2.0}),
+}
+
+_models: Dict[str, HashedLinearClassifier] = {}
+
+
+def get_model(result_key: str) -> HashedLinearClassifier:
+    """The task's classifier, built once per process"""
+    if result_key not in _models:
+        path = os.path.join(LOCAL_MODEL_DIR, f"{result_key}.npz")
+        if os.path.exists(path):
+            _models[result_key] = HashedLinearClassifier.load(path)
+        else:
+            labels, lexicon, bias = LEXICON_MODELS[result_key]
+            _models[result_key] = HashedLinearClassifier.from_lexicon(labels, lexicon, bias)
+    return _models[result_key]
+
+
+def predict_chunk(result_key: str, texts: List[str]) -> Tuple[List[str], List[float]]:
+    """Process-pool entry point: score one chunk of texts for one task"""
+    labels, confidence = get_model(result_key).predict(texts)
+    return labels, confidence.tolist()
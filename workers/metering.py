@@ -0,0 +1,92 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from workers.llm_client import current_meter
+from workers.model_router import MODEL_PROFILES
+
+# Ledger totals persisted on BlockRun and PipelineRun (columns of the same name)
+USAGE_FIELDS = ["llm_calls", "prompt_tokens", "completion_tokens", "llm_seconds", "llm_retries", "cache_hits", "cost_usd"]
+
+
+class UsageMeter:
+    """LLM usage of one job per model: requests, tokens, request seconds, retries, hedges and failures.
+
+    The pooled client records into the meter of the job that called map(),
+    see metered().
+    """
+
+    def __init__(self):
+        self.models = defaultdict(Counter)
+
+    def record_call(self, model: str, prompt_tokens: int, completion_tokens: int, seconds: float):
+        usage = self.models[model]
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+        usage["seconds"] += seconds
+
+    def record(self, model: str, counter: str, amount: int = 1):
+        self.models[model][counter] += amount
+
+    def totals(self) -> Dict[str, Any]:
+        total = sum(self.models.values(), Counter())
+        return {
+            "llm_calls": total["calls"],
+            "prompt_tokens": total["prompt_tokens"],
+            "completion_tokens": total["completion_tokens"],
+            "llm_seconds": round(total["seconds"], 3),
+            "llm_retries": total["retries"],
+            "hedges": total["hedges"],
+            "failures": total["failures"],
+            "cost_usd": round(sum(cost_usd(model, usage) for model, usage in self.models.items()), 6),
+            "models": {model: {**usage, "seconds": round(usage["seconds"], 3)} for model, usage in self.models.items()},
+        }
+
+
+def cost_usd(model: str, usage: Dict[str, Any]) -> float:
+    """Price of the model's tokens (0 for a model without a known price)"""
+    profile = MODEL_PROFILES.get(model)
+    if profile is None:
+        return 0.0
+    return (usage["prompt_tokens"] * profile["input_price"] + usage["completion_tokens"] * profile["output_price"]) / 1e6
+
+
+@contextmanager
+def metered():
+    """Meter the LLM calls made from this thread inside the block"""
+    meter = UsageMeter()
+    token = current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        current_meter.reset(token)
+
+
+def merge_usage(usages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum usage reports (e.g. of a block's shards), nested per-model counts included"""
+    merged = {}
+    for usage in usages:
+        for key, value in usage.items():
+            if isinstance(value, dict):
+                merged[key] = merge_usage([merged.get(key, {}), value])
+            else:
+                merged[key] = round(merged.get(key, 0) + value, 6)
+    return merged
+
+
+def split_usage(usage: Dict[str, Any], parts: int) -> List[Dict[str, Any]]:
+    """Share one usage report between the blocks of a fused job, so run totals count it once"""
+    shares = [{} for _ in range(parts)]
+    for key, value in usage.items():
+        if isinstance(value, dict):
+            for share, part in zip(shares, split_usage(value, parts)):
+                share[key] = part
+        elif isinstance(value, int):
+            base, extra = divmod(value, parts)
+            for index, share in enumerate(shares):
+                share[key] = base + (1 if index < extra else 0)
+        else:
+            for share in shares:
+                share[key] = value / parts
+    return shares
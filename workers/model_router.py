@@ -0,0 +1,94 @@
+import math
+import os
+import time
+from typing import Any, Dict, List
+
+from workers.classification import LABEL_TOKENS_PER_TEXT, pack_texts, text_tokens
+from workers.llm_client import LatencyTracker, LLM_MODEL
+
+# USD per 1M prompt / completion tokens, context window, and a prior request latency in seconds that is used
+# until the model's own latencies have been observed
+MODEL_PROFILES = {
+    "gpt-4.1-nano": {"input_price": 0.10, "output_price": 0.40, "context": 1047576, "latency": 0.7},
+    "gpt-4o-mini": {"input_price": 0.15, "output_price": 0.60, "context": 128000, "latency": 0.8},
+    "gpt-4.1-mini": {"input_price": 0.40, "output_price": 1.60, "context": 1047576, "latency": 1.0},
+    "gpt-4o": {"input_price": 2.50, "output_price": 10.00, "context": 128000, "latency": 1.2},
+}
+# Candidate models of routed blocks whose routing config does not list "models"
+ROUTING_MODELS = [model.strip() for model in os.getenv("ROUTING_MODELS", "gpt-4o-mini,gpt-4.1-nano").split(",") if model.strip()]
+# A model failing more than this share of its recent requests is skipped while a healthier candidate exists
+ROUTING_MAX_ERROR_RATE = float(os.getenv("ROUTING_MAX_ERROR_RATE", 0.2))
+# Observed latencies replace a model's prior once there are this many
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", 10))
+# Weight of cost against latency: urgent runs take the fastest model, bulk backfills the cheapest
+ROUTING_PRIORITIES = {"urgent": 0.0, "normal": 0.5, "bulk": 1.0}
+ROUTING_DEFAULT_PRIORITY = "normal"
+# System prompt and JSON envelope of a request, on top of its texts
+PROMPT_OVERHEAD_TOKENS = 300
+
+
+class ModelRouter:
+    """Picks the model of each text from a block's routing config and each model's observed latency and errors.
+
+    routing = {"models": [...], "priority": "urgent" | "normal" | "bulk", "deadline_at": epoch seconds}
+
+    Without a deadline, each text takes the model with the best cost/latency mix
+    for the priority among those whose context fits it. With one, the whole
+    batch goes to the cheapest model projected to finish it in time (the
+    fastest if none is).
+    """
+
+    def __init__(self, latency: LatencyTracker):
+        self.latency = latency
+
+    def candidates(self, routing: Dict[str, Any]) -> List[str]:
+        models = [model for model in routing.get("models") or ROUTING_MODELS if model in MODEL_PROFILES] or [LLM_MODEL]
+        healthy = [model for model in models if self.latency.error_rate(model) <= ROUTING_MAX_ERROR_RATE]
+        return healthy or models
+
+    def expected_latency(self, model: str, rank: float = 50) -> float:
+        """Seconds per request (observed percentile, else the prior), inflated by the retries its failures cost"""
+        seconds = None
+        if self.latency.samples(model) >= ROUTING_MIN_SAMPLES:
+            seconds = self.latency.percentile(model, rank)
+        if seconds is None:
+            seconds = MODEL_PROFILES[model]["latency"]
+        return seconds / max(0.05, 1 - self.latency.error_rate(model))
+
+    def cost(self, model: str, prompt_tokens: int, texts: int = 1) -> float:
+        """Expected USD to label `texts` texts of `prompt_tokens` tokens in total, retries included"""
+        profile = MODEL_PROFILES[model]
+        usd = (prompt_tokens * profile["input_price"] + texts * LABEL_TOKENS_PER_TEXT * profile["output_price"]) / 1e6
+        return usd / max(0.05, 1 - self.latency.error_rate(model))
+
+    def route(self, texts: List[str], routing: Dict[str, Any], concurrency: int, batching: bool = True) -> List[str]:
+        """One model per text, in input order"""
+        models = self.candidates(routing)
+        if len(models) == 1 or not texts:
+            return [models[0]] * len(texts)
+
+        if routing.get("deadline_at") is not None:
+            model = self._meet_deadline(models, texts, float(routing["deadline_at"]) - time.time(), concurrency, batching)
+            return [model] * len(texts)
+
+        weight = ROUTING_PRIORITIES.get(routing.get("priority"), ROUTING_PRIORITIES[ROUTING_DEFAULT_PRIORITY])
+        latencies = {model: self.expected_latency(model) for model in models}
+        fastest = min(latencies.values())
+        chosen = []
+        for text in texts:
+            tokens = text_tokens(text)
+            fitting = [model for model in models if tokens + PROMPT_OVERHEAD_TOKENS <= MODEL_PROFILES[model]["context"]] or models
+            costs = {model: self.cost(model, tokens) for model in fitting}
+            cheapest = min(costs.values())
+            chosen.append(min(fitting, key=lambda model: weight * costs[model] / cheapest + (1 - weight) * latencies[model] / fastest))
+        return chosen
+
+    def _meet_deadline(self, models: List[str], texts: List[str], remaining: float, concurrency: int, batching: bool) -> str:
+        # The batch runs in waves of `concurrency` requests, each about as slow as the model's p95
+        requests = len(pack_texts(texts)) if batching else len(texts)
+        waves = math.ceil(requests / max(1, concurrency))
+        tokens = sum(text_tokens(text) for text in texts)
+        for model in sorted(models, key=lambda model: self.cost(model, tokens, len(texts))):
+            if waves * self.expected_latency(model, 95) <= remaining:
+                return model
+        return min(models, key=lambda model: self.expected_latency(model, 95))
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Near-duplicate label reuse: 64-bit SimHash signatures in a banded LSH index kept in Redis.
+# Opt-in (or block config "near_duplicates"): a few bits apart can still be a different label, e.g. a negation
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "false").lower() == "true"
+# Largest Hamming distance (of 64 bits) at which a labeled text's label is reused
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", 3))
+# Any two signatures within bands - 1 bits of each other share at least one band (pigeonhole)
+NEAR_DUP_BANDS = int(os.getenv("NEAR_DUP_BANDS", 4))
+NEAR_DUP_TTL = int(os.getenv("NEAR_DUP_TTL", 7 * 86400))
+# Signatures kept per band bucket; a full bucket (a very common band value) takes no more entries
+NEAR_DUP_BUCKET_MAX = int(os.getenv("NEAR_DUP_BUCKET_MAX", 64))
+NEAR_DUP_KEY = "near_dup:{namespace}:{band}:{value}"
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+MENTION_PATTERN = re.compile(r"@\w+")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def canonical_tokens(text: str) -> List[str]:
+    """Words of a text with URLs, mentions, casing, punctuation and emoji removed"""
+    text = MENTION_PATTERN.sub(" ", URL_PATTERN.sub(" ", str(text).lower()))
+    return WORD_PATTERN.findall(text)
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over word unigrams and bigrams (None for a text without words)"""
+    tokens = canonical_tokens(text)
+    if not tokens:
+        return None
+    shingles = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") for shingle in shingles],
+        dtype=">u8"
+    )
+    # One row of 64 bits per shingle; each bit of the signature is the majority vote of that bit
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(len(shingles), 8), axis=1)
+    votes = (2 * bits.astype(np.int64) - 1).sum(axis=0)
+    return int("".join("1" if vote > 0 else "0" for vote in votes), 2)
+
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class NearDuplicateIndex:
+    """Banded LSH index of SimHash signatures -> label, one namespace per task/model/prompt.
+
+    A signature is stored under each of its bands; a lookup collects the
+    signatures sharing any band and keeps the closest within max_distance.
+    Every operation fails open.
+    """
+
+    def __init__(self, redis_conn, bands: int = NEAR_DUP_BANDS, ttl: int = NEAR_DUP_TTL, bucket_max: int = NEAR_DUP_BUCKET_MAX):
+        self.redis_conn = redis_conn
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self.ttl = ttl
+        self.bucket_max = bucket_max
+
+    def _band_keys(self, namespace: str, signature: int) -> List[str]:
+        mask = (1 << self.band_bits) - 1
+        return [
+            NEAR_DUP_KEY.format(namespace=namespace, band=band, value=(signature >> (band * self.band_bits)) & mask)
+            for band in range(self.bands)
+        ]
+
+    def find(self, namespace: str, texts: List[str], max_distance: int = NEAR_DUP_MAX_DISTANCE) -> Dict[str, str]:
+        """Label of the nearest indexed text within max_distance, for each text that has one"""
+        # Beyond bands - 1 bits a near neighbour may share no band, so the index cannot promise to find it
+        max_distance = min(max_distance, self.bands - 1)
+        signatures = {text: simhash(text) for text in texts}
+        signatures = {text: signature for text, signature in signatures.items() if signature is not None}
+        if not signatures:
+            return {}
+        try:
+            pipe = self.redis_conn.pipeline()
+            for signature in signatures.values():
+                for key in self._band_keys(namespace, signature):
+                    pipe.hgetall(key)
+            buckets = pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Error reading near-duplicate index: {e}")
+            return {}
+
+        found = {}
+        for position, (text, signature) in enumerate(signatures.items()):
+            best = None
+            for bucket in buckets[position * self.bands:(position + 1) * self.bands]:
+                for candidate, label in bucket.items():
+                    distance = hamming(signature, int(candidate, 16))
+                    if distance <= max_distance and (best is None or distance < best[0]):
+                        best = (distance, label)
+            if best:
+                found[text] = best[1]
+        return found
+
+    def add(self, namespace: str, labels: Dict[str, str]):
+        """Index text -> label (texts without words are skipped)"""
+        entries = [(simhash(text), label) for text, label in labels.items()]
+        entries = [(signature, label) for signature, label in entries if signature is not None]
+        if not entries:
+            return
+        try:
+            pipe = self.redis_conn.pipeline()
+            keys = [key for signature, _ in entries for key in self._band_keys(namespace, signature)]
+            for key in keys:
+                pipe.hlen(key)
+            sizes = dict(zip(keys, pipe.execute()))
+
+            pipe = self.redis_conn.pipeline()
+            for signature, label in entries:
+                for key in self._band_keys(namespace, signature):
+                    if sizes[key] < self.bucket_max:
+                        pipe.hset(key, f"{signature:016x}", label)
+                        pipe.expire(key, self.ttl)
+                        sizes[key] += 1
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Error updating near-duplicate index: {e}")
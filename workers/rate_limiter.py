@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import os
+import random
+from typing import Mapping, Optional
+
+import redis.asyncio as aioredis
+
+# Fallback provider quotas (per API key and model) until response headers report the real ones
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", 500))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", 200000))
+# Bucket capacity in seconds of quota: bounds how much can be spent in one burst
+LLM_BUCKET_SECONDS = float(os.getenv("LLM_BUCKET_SECONDS", 10))
+LLM_RATE_LIMIT_KEY = "llm_ratelimit:{key_id}:{model}"
+LIMITS_TTL_MS = 24 * 3600 * 1000
+
+# Atomically take one request and `cost` tokens from the two buckets, or report how long to wait.
+# KEYS: requests bucket, tokens bucket, pause key, learned limits hash
+# ARGV: default rpm, default tpm, token cost, bucket seconds
+ACQUIRE_SCRIPT = """
+local pause = redis.call('PTTL', KEYS[3])
+if pause > 0 then return pause end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local limits = redis.call('HMGET', KEYS[4], 'rpm', 'tpm')
+local rpm = tonumber(limits[1]) or tonumber(ARGV[1])
+local tpm = tonumber(limits[2]) or tonumber(ARGV[2])
+local seconds = tonumber(ARGV[4])
+
+local function level(key, per_minute)
+  local capacity = math.max(1, per_minute * seconds / 60)
+  local state = redis.call('HMGET', key, 'level', 'ts')
+  local current = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  return math.min(capacity, current + math.max(0, now - ts) * per_minute / 60000), capacity
+end
+
+local requests = level(KEYS[1], rpm)
+local tokens, token_capacity = level(KEYS[2], tpm)
+-- A request larger than the whole bucket still runs once the bucket is full
+local cost = math.min(tonumber(ARGV[3]), token_capacity)
+
+local wait = 0
+if requests < 1 then wait = math.max(wait, (1 - requests) * 60000 / rpm) end
+if tokens < cost then wait = math.max(wait, (cost - tokens) * 60000 / tpm) end
+if wait > 0 then return math.ceil(wait) end
+
+redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tokens - cost, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+redis.call('PEXPIRE', KEYS[2], 120000)
+return 0
+"""
+
+# Lower a bucket to what the provider says is left (never raise it) and adjust for actual usage.
+# KEYS: bucket; ARGV: remaining (or -1), delta
+SYNC_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+if not state[1] then return 0 end
+local level = tonumber(state[1]) + tonumber(ARGV[2])
+local remaining = tonumber(ARGV[1])
+if remaining >= 0 then level = math.min(level, remaining) end
+redis.call('HSET', KEYS[1], 'level', level)
+return 1
+"""
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Rough prompt size (~4 characters per token) plus the completion budget"""
+    return len(prompt) // 4 + max_tokens
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets shared by every worker through Redis, per API key and model.
+
+    Limits follow the provider's x-ratelimit-* headers, and a 429's Retry-After
+    pauses every worker using the same key and model.
+    """
+
+    def __init__(self, api_key: str, redis_conn=None):
+        # Bucket keys identify the API key without storing it
+        self.key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        self.redis_conn = redis_conn or aioredis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=0,
+            decode_responses=True
+        )
+        self._acquire = self.redis_conn.register_script(ACQUIRE_SCRIPT)
+        self._sync = self.redis_conn.register_script(SYNC_SCRIPT)
+
+    def _keys(self, model: str) -> dict:
+        base = LLM_RATE_LIMIT_KEY.format(key_id=self.key_id, model=model)
+        return {
+            "requests": f"{base}:requests",
+            "tokens": f"{base}:tokens",
+            "pause": f"{base}:pause",
+            "limits": f"{base}:limits",
+        }
+
+    async def acquire(self, model: str, tokens: int):
+        """Wait until one request and `tokens` tokens are available, then take them"""
+        keys = self._keys(model)
+        while True:
+            try:
+                wait_ms = await self._acquire(
+                    keys=[keys["requests"], keys["tokens"], keys["pause"], keys["limits"]],
+                    args=[LLM_RPM_LIMIT, LLM_TPM_LIMIT, tokens, LLM_BUCKET_SECONDS]
+                )
+            except Exception as e:
+                # Fail open: without Redis every worker falls back to the SDK's own handling
+                print(f"⚠️  Rate limiter unavailable, proceeding without it: {e}")
+                return
+            if not wait_ms:
+                return
+            # Jitter keeps waiting workers from retrying in lockstep
+            await asyncio.sleep(wait_ms / 1000 * random.uniform(1.0, 1.2))
+
+    async def observe(self, model: str, headers: Mapping[str, str], estimated_tokens: int = 0, used_tokens: int = None):
+        """Adopt the provider's limits and remaining quota from a response's rate-limit headers"""
+        keys = self._keys(model)
+        limit_requests = _header(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header(headers, "x-ratelimit-remaining-tokens")
+        try:
+            pipe = self.redis_conn.pipeline()
+            if limit_requests:
+                pipe.hset(keys["limits"], "rpm", limit_requests)
+            if limit_tokens:
+                pipe.hset(keys["limits"], "tpm", limit_tokens)
+            pipe.pexpire(keys["limits"], LIMITS_TTL_MS)
+            await pipe.execute()
+
+            await self._sync(keys=[keys["requests"]], args=[-1 if remaining_requests is None else remaining_requests, 0])
+            # Charge (or refund) the difference between the estimate and what the call actually used
+            token_delta = estimated_tokens - used_tokens if used_tokens is not None else 0
+            await self._sync(keys=[keys["tokens"]], args=[-1 if remaining_tokens is None else remaining_tokens, token_delta])
+        except Exception as e:
+            print(f"⚠️  Error updating rate limiter from headers: {e}")
+
+    async def pause(self, model: str, headers: Mapping[str, str]):
+        """After a 429, hold every worker on this key and model for the provider's Retry-After"""
+        retry_after_ms = _header(headers, "retry-after-ms")
+        if retry_after_ms is None:
+            retry_after = _header(headers, "retry-after")
+            retry_after_ms = retry_after * 1000 if retry_after is not None else 1000
+        try:
+            await self.redis_conn.set(self._keys(model)["pause"], 1, px=max(1, int(retry_after_ms)))
+            print(f"⏸️  Rate limited on {model}, pausing all workers for {retry_after_ms / 1000:.1f}s")
+        except Exception as e:
+            print(f"⚠️  Error pausing rate limiter: {e}")
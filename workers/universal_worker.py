@@ -1,17 +1,50 @@
 import pandas as pd
 import os
-from typing import Dict, Any
-from pathlib import Path
+from typing import Dict, Any, List, Tuple
 import redis
 import json
 from datetime import datetime
 import time
-from openai import OpenAI
+import zlib
 import enum
 from dotenv import load_dotenv
+from workers.artifact_store import artifact_store
+from workers.csv_reader import CSV_READER_CHUNK_ROWS, iter_csv_chunks, pick_columns, read_header
+from workers.csv_index import CSV_INDEX_MIN_BYTES, ensure_row_index, index_path, read_row_range
+from workers.file_sink import open_file_sink
+from workers.edge_stream import EdgeStreamReader, EdgeStreamWriter, EDGE_STREAM_BATCH_ROWS
+from workers.classification import ClassificationTask, FusedClassification, SENTIMENT, TOXICITY, normalize_text
+from workers.backends import get_backend
+from workers.metering import metered, merge_usage, split_usage
+from collections import Counter
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Texts submitted to the LLM client at once (results are streamed downstream per batch)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", 500))
+
+# Output format of file writer blocks without an "output_format" (csv, csv.gz, csv.zst, jsonl or parquet)
+FILE_WRITER_FORMAT = os.getenv("FILE_WRITER_FORMAT", "csv")
+# Where file writer blocks put their output files (the downloads API serves them from the same volume)
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/app/outputs")
+
+# Redis Streams the orchestrators consume block completions from (consumer group, acked).
+# Runs are spread over COMPLETION_PARTITIONS streams; each partition is owned by one orchestrator.
+COMPLETION_STREAM = os.getenv("COMPLETION_STREAM", "block_completion_events")
+COMPLETION_STREAM_MAXLEN = int(os.getenv("COMPLETION_STREAM_MAXLEN", 100000))
+COMPLETION_PARTITIONS = int(os.getenv("COMPLETION_PARTITIONS", 64))
+
+# Observed seconds per input row of each shardable block type (EWMA), used to size shards by duration
+SHARD_RATE_KEY = "shard_seconds_per_row"
+SHARD_RATE_SMOOTHING = 0.2
+
+def completion_partition_for(pipeline_run_id) -> int:
+    """Stable partition of a pipeline run (the same on every worker and orchestrator)"""
+    if pipeline_run_id is None:
+        return 0
+    return zlib.crc32(str(pipeline_run_id).encode()) % COMPLETION_PARTITIONS
+
+def completion_stream_for_partition(partition: int) -> str:
+    return f"{COMPLETION_STREAM}:{partition}"
 
 class BlockType(str, enum.Enum):
     CSV_READER = "csv_reader"
@@ -19,102 +52,11 @@ class BlockType(str, enum.Enum):
     TOXICITY_DETECTION = "toxicity_detection"
     FILE_WRITER = "file_writer"
 
-def analyze_sentiment_with_openai(text: str) -> dict:
-    """Analyze sentiment of a single text using OpenAI"""
-    try:
-        api_key = OPENAI_API_KEY
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-        
-        client = OpenAI(api_key=api_key)
-        
-        system_prompt = """You are an AI assistant that classifies the sentiment of short text messages.
-            For each input message, respond with exactly one of: POSITIVE, NEGATIVE, or NEUTRAL.
-            Respond only with the label, no explanations.
-            """
-                    
-        user_prompt = f"Input Message: {text}\nSentiment:"
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=10,
-            temperature=0.1,
-        )
-        
-        sentiment = response.choices[0].message.content.strip().upper()
-        
-        # Validate sentiment response
-        if sentiment not in ["POSITIVE", "NEGATIVE", "NEUTRAL"]:
-            print(f"⚠️  Unexpected sentiment response: {sentiment}, defaulting to NEUTRAL")
-            sentiment = "NEUTRAL"
-    
-        
-        return {
-            "text": text,
-            "sentiment": sentiment,
-            "confidence": 0.9
-        }
-        
-    except Exception as e:
-        print(f"⚠️  Error analyzing sentiment for text: {str(e)}")
-        return {
-            "text": text,
-            "sentiment": "NEUTRAL",
-            "score": 0.5,
-            "confidence": 0.0,
-            "error": str(e)
-        }
-
-def detect_toxicity_with_openai(text: str) -> dict:
-    """Detect toxicity in a single text using OpenAI"""
-    try:
-        api_key = OPENAI_API_KEY
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-        
-        client = OpenAI(api_key=api_key)
-        
-        system_prompt = """You are an AI assistant that detects toxic content in text messages.
-For each input message, respond with exactly one of: TOXIC or NON_TOXIC.
-Respond only with the label, no explanations."""
-        
-        user_prompt = f"Input Message: {text}\nToxicity:"
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=10,
-            temperature=0.1,
-        )
-        
-        toxicity = response.choices[0].message.content.strip().upper()
-        
-        # Validate toxicity response
-        if toxicity not in ["TOXIC", "NON_TOXIC"]:
-            print(f"⚠️  Unexpected toxicity response: {toxicity}, defaulting to NON_TOXIC")
-            toxicity = "NON_TOXIC"
-        
-        return {
-            "text": text,
-            "toxicity": toxicity,
-        }
-        
-    except Exception as e:
-        print(f"⚠️  Error detecting toxicity for text: {str(e)}")
-        return {
-            "text": text,
-            "toxicity": "NON_TOXIC",
-            "score": 0.1,
-            "error": str(e)
-        }
-
+# LLM classification blocks: task, results key in the output artifact, output data type
+CLASSIFICATION_BLOCKS = {
+    BlockType.SENTIMENT_ANALYSIS: (SENTIMENT, "sentiments_results", "sentiment_data"),
+    BlockType.TOXICITY_DETECTION: (TOXICITY, "toxicity_results", "toxicity_data"),
+}
 
 class WorkerRedisClient:
     def __init__(self):
@@ -127,27 +69,59 @@ class WorkerRedisClient:
             decode_responses=True
         )
     
-    def publish_block_completion(self, block_run_id: int, result_data: dict, success: bool):
-        """Publish block completion event to Redis channel"""
+    def publish_block_completion(self, block_run_id: int, result_data: dict, success: bool, pipeline_run_id: int = None):
+        """Append block completion event to the completion stream partition of its pipeline run"""
         event = {
             "event_type": "block_completed" if success else "block_failed",
             "block_run_id": block_run_id,
+            "pipeline_run_id": pipeline_run_id,
             "success": success,
             "result_data": result_data,
             "timestamp": datetime.utcnow().isoformat()
         }
-        
+        self._append_completion_event(event, pipeline_run_id)
+    
+    def publish_shard_completion(self, block_run_id: int, shard_index: int, result_data: dict, success: bool, pipeline_run_id: int = None):
+        """Append shard completion event to the same partition as its block run's completion"""
+        event = {
+            "event_type": "shard_completed" if success else "shard_failed",
+            "block_run_id": block_run_id,
+            "shard_index": shard_index,
+            "pipeline_run_id": pipeline_run_id,
+            "success": success,
+            "result_data": result_data,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        self._append_completion_event(event, pipeline_run_id)
+    
+    def _append_completion_event(self, event: dict, pipeline_run_id: int = None):
         try:
-            # Publish to Redis channel
-            self.redis_client.publish("block_completion_events", json.dumps(event))
-            print(f"Published block completion event for block_run_id: {block_run_id}")
-            
-            # Also store in Redis for persistence (optional)
-            event_key = f"block_event:{block_run_id}:{datetime.utcnow().timestamp()}"
-            self.redis_client.setex(event_key, 3600, json.dumps(event))  # Expire in 1 hour
+            # The stream persists the event until a consumer acknowledges it
+            entry_id = self.redis_client.xadd(
+                completion_stream_for_partition(completion_partition_for(pipeline_run_id)),
+                {"event": json.dumps(event)},
+                maxlen=COMPLETION_STREAM_MAXLEN,
+                approximate=True
+            )
+            print(f"Published {event['event_type']} event for block_run_id: {event['block_run_id']} ({entry_id})")
             
         except Exception as e:
+            # Fail the job instead: a lost completion would leave its block running forever, and RQ retries the job
             print(f"Error publishing to Redis: {e}")
+            raise
+    
+    def record_shard_rate(self, block_type: str, seconds: float, rows: int):
+        """Fold one shard's observed seconds-per-row into the block type's moving average"""
+        if rows <= 0:
+            return
+        try:
+            observed = seconds / rows
+            previous = self.redis_client.hget(SHARD_RATE_KEY, block_type)
+            if previous is not None:
+                observed = (1 - SHARD_RATE_SMOOTHING) * float(previous) + SHARD_RATE_SMOOTHING * observed
+            self.redis_client.hset(SHARD_RATE_KEY, block_type, observed)
+        except Exception as e:
+            print(f"Error recording shard rate: {e}")
     
     def publish_data_ready(self, block_run_id: int, data_type: str, data: dict, target_blocks: list):
         """Publish data ready event for next blocks"""
@@ -172,19 +146,7 @@ def process_task(block_run_id: int, block_type: str, config: Dict[str, Any]) ->
     try:
         print(f"Processing {block_type} for block_run_id: {block_run_id}")
         
-        if block_type == BlockType.CSV_READER:
-            result = _process_csv_reader(block_run_id, config)
-        elif block_type == BlockType.SENTIMENT_ANALYSIS:
-            result = _process_sentiment_analysis(block_run_id, config)
-        elif block_type == BlockType.TOXICITY_DETECTION:
-            result = _process_toxicity_detection(block_run_id, config)
-        elif block_type == BlockType.FILE_WRITER:
-            result = _process_file_writer(block_run_id, config)
-        else:
-            raise ValueError(f"Unknown block type: {block_type}")
-        
-        success = result.get("success", False)
-        redis_client.publish_block_completion(block_run_id, result, success=success)
+        result = _run_block(block_run_id, block_type, config)
         
         # # Publish data ready event for next blocks
         # if result.get("success") and "data_type" in result.get("result", {}):
@@ -195,16 +157,188 @@ def process_task(block_run_id: int, block_type: str, config: Dict[str, Any]) ->
         #         data=result_data,
         #         target_blocks=result_data.get("next_blocks", [])
         #     )
-        
-        return result
             
     except Exception as e:
-        error_result = {"success": False, "error": str(e), "block_run_id": block_run_id}
         print(f"Task failed for block_run_id: {block_run_id}: {e}")
+        result = {"success": False, "error": str(e), "block_run_id": block_run_id}
+    
+    success = result.get("success", False)
+    if not success:
+        _abort_output_streams(config, result.get("error", "Unknown error"))
+    # Outside the try: a completion that cannot be published fails the job rather than reporting the block failed
+    redis_client.publish_block_completion(
+        block_run_id, result, success=success, pipeline_run_id=config.get("pipeline_run_id")
+    )
+    return result
+
+def process_shard(block_run_id: int, block_type: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one shard (a row range of the block's input) of a data-parallel block run"""
+    shard = config["shard"]
+    try:
+        print(f"Processing {block_type} shard {shard['index']} (rows {shard['start_row']}-{shard['end_row']}) for block_run_id: {block_run_id}")
+        
+        started = time.time()
+        result = _run_block(block_run_id, block_type, config)
+        if result.get("success"):
+            redis_client.record_shard_rate(block_type, time.time() - started, shard["end_row"] - shard["start_row"])
         
-        # Publish failure event
-        redis_client.publish_block_completion(block_run_id, error_result, success=False)
-        return error_result
+    except Exception as e:
+        print(f"Shard {shard['index']} failed for block_run_id: {block_run_id}: {e}")
+        result = {"success": False, "error": str(e), "block_run_id": block_run_id}
+    
+    redis_client.publish_shard_completion(
+        block_run_id, shard["index"], result, success=result.get("success", False), pipeline_run_id=config.get("pipeline_run_id")
+    )
+    return result
+
+def merge_shards(block_run_id: int, block_type: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Concatenate shard outputs in shard order into the block run's single output artifact"""
+    try:
+        shard_results = config["shard_results"]
+        print(f"Merging {len(shard_results)} {block_type} shards for block_run_id: {block_run_id}")
+        
+        # Shard by shard (Arrow record batches are copied without being decoded), never the whole output in memory
+        with artifact_store.table_writer() as merged:
+            for shard_result in shard_results:
+                merged.append(shard_result["artifact"])
+        
+        first = shard_results[0]
+        result = {"success": True, "result": {
+            "data_type": first.get("data_type"),
+            "next_blocks": first.get("next_blocks", []),
+            "result_count": sum(shard_result.get("result_count", 0) for shard_result in shard_results),
+            "shard_count": len(shard_results),
+            **_inference_report(sum((
+                Counter({**shard_result.get("cache", {}), **{
+                    key: shard_result.get("cascade", {}).get(key, 0) for key in ("local_resolved", "escalated")
+                }, **{f"routed:{model}": count for model, count in shard_result.get("routing", {}).items()}})
+                for shard_result in shard_results
+            ), Counter()), merge_usage([shard_result.get("usage", {}) for shard_result in shard_results])),
+            "artifact": merged.ref,
+        }}
+    except Exception as e:
+        print(f"Merge failed for block_run_id: {block_run_id}: {e}")
+        result = {"success": False, "error": f"Error merging shards: {e}", "block_run_id": block_run_id}
+    
+    redis_client.publish_block_completion(
+        block_run_id, result, success=result["success"], pipeline_run_id=config.get("pipeline_run_id")
+    )
+    return result
+
+def process_fused(members: List[Tuple[int, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Run sibling classification blocks over their shared input in one job, asking for every label per text.
+
+    members are the (block_run_id, block_type, config) arguments each block run
+    (or the same shard of each) would have had on its own; every member is
+    reported with its own completion event and output artifact.
+    """
+    block_types = [block_type for _, block_type, _ in members]
+    config = members[0][2]
+    shard = config.get("shard")
+    print(f"Processing fused {'+'.join(block_types)} for block_run_ids: {[block_run_id for block_run_id, _, _ in members]}"
+          + (f" (shard {shard['index']}, rows {shard['start_row']}-{shard['end_row']})" if shard else ""))
+    
+    started = time.time()
+    try:
+        texts, results, report = _analyze_texts(config, FusedClassification([CLASSIFICATION_BLOCKS[t][0] for t in block_types]))
+        if not texts:
+            raise ValueError("No texts provided for classification")
+        # One result tuple per text -> one result list per member, each billed its share of the job's usage
+        outcomes = [
+            _classification_result(block_type, texts, list(member_results), {**report, "usage": usage})
+            for block_type, member_results, usage in zip(block_types, zip(*results), split_usage(report["usage"], len(members)))
+        ]
+        print(f"✅ Fused classification completed for {len(texts)} texts")
+    except Exception as e:
+        print(f"❌ Error in fused classification: {e}")
+        outcomes = [{"success": False, "error": f"Error in fused classification: {e}", "block_run_id": block_run_id}
+                    for block_run_id, _, _ in members]
+    
+    for (block_run_id, block_type, member_config), result in zip(members, outcomes):
+        success = result.get("success", False)
+        if shard:
+            if success:
+                redis_client.record_shard_rate(block_type, time.time() - started, shard["end_row"] - shard["start_row"])
+            redis_client.publish_shard_completion(
+                block_run_id, shard["index"], result, success=success, pipeline_run_id=member_config.get("pipeline_run_id")
+            )
+        else:
+            redis_client.publish_block_completion(
+                block_run_id, result, success=success, pipeline_run_id=member_config.get("pipeline_run_id")
+            )
+    return outcomes
+
+def _run_block(block_run_id: int, block_type: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    if block_type == BlockType.CSV_READER:
+        return _process_csv_reader(block_run_id, config)
+    elif block_type == BlockType.SENTIMENT_ANALYSIS:
+        return _process_sentiment_analysis(block_run_id, config)
+    elif block_type == BlockType.TOXICITY_DETECTION:
+        return _process_toxicity_detection(block_run_id, config)
+    elif block_type == BlockType.FILE_WRITER:
+        return _process_file_writer(block_run_id, config)
+    else:
+        raise ValueError(f"Unknown block type: {block_type}")
+
+def _load_input(config: Dict[str, Any], data_type: str, columns: list = None):
+    """Load an upstream block's output from the artifact store (inputs hold references only);
+    `columns` limits the columns decoded from a table artifact"""
+    ref = config.get("inputs", {}).get(data_type)
+    if not ref:
+        return None
+    return artifact_store.get(ref, columns)
+
+def _iter_input_batches(config: Dict[str, Any], batch_size: int):
+    """Yield input items in batches: from the upstream edge stream as they arrive, else from the upstream artifact"""
+    if config.get("input_stream"):
+        reader = EdgeStreamReader(redis_client.redis_client, config["input_stream"])
+        for items in reader:
+            for i in range(0, len(items), batch_size):
+                reader.heartbeat()
+                yield items[i:i + batch_size]
+        return
+    
+    csv_data = config.get("inputs", {}).get("csv_data")
+    if not config.get("texts") and csv_data and csv_data.get("format") == "arrow":
+        # Sliced from the memory-mapped table and decoded a batch at a time, never as one list
+        shard = config.get("shard") or {}
+        yield from artifact_store.iter_column(csv_data, "texts", batch_size, shard.get("start_row", 0), shard.get("end_row"))
+        return
+    
+    texts = _get_input_texts(config)
+    for i in range(0, len(texts), batch_size):
+        yield texts[i:i + batch_size]
+
+def _open_output_streams(config: Dict[str, Any]) -> EdgeStreamWriter:
+    """Writer for the block's streaming out-edges (a no-op when it has none)"""
+    return EdgeStreamWriter(redis_client.redis_client, config.get("output_streams", []))
+
+def _abort_output_streams(config: Dict[str, Any], error: str):
+    # Streaming consumers may already be running; fail them instead of letting them wait for data
+    if config.get("output_streams"):
+        try:
+            _open_output_streams(config).abort(error)
+        except Exception as e:
+            print(f"Error aborting output streams: {e}")
+
+def _get_input_texts(config: Dict[str, Any]) -> list:
+    """Texts from inline config (legacy pipelines) or from the upstream CSV artifact, cut to the shard's rows"""
+    shard = config.get("shard")
+    if config.get("texts"):
+        texts = config["texts"]
+    else:
+        csv_data = _load_input(config, "csv_data", ["texts"])
+        if csv_data and csv_data.get("row_index"):
+            # Indexed input: parse only this job's byte range of the file
+            index = ensure_row_index(csv_data["file_path"])
+            start, end = (shard["start_row"], shard["end_row"]) if shard else (0, index["row_count"])
+            text_column = csv_data["text_column"]
+            return read_row_range(csv_data["file_path"], index, csv_data["columns"], [text_column], start, end)[text_column].tolist()
+        texts = csv_data.get("texts", []) if csv_data else []
+    
+    if shard:
+        texts = texts[shard["start_row"]:shard["end_row"]]
+    return texts
 
 def _process_csv_reader(block_run_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
     """Process CSV Reader tasks - REAL CSV READING VERSION"""
@@ -219,31 +353,41 @@ def _process_csv_reader(block_run_id: int, config: Dict[str, Any]) -> Dict[str,
             return {"success": False, "error": error_msg}
         
         print(f"📁 Reading CSV file from: {file_path}")
+        columns = read_header(file_path)
+        text_column, id_column = pick_columns(columns)
+        indexed = config.get("indexed")
+        if indexed is None:
+            indexed = os.path.getsize(file_path) >= CSV_INDEX_MIN_BYTES
+        if indexed and not config.get("output_streams"):
+            # Large files are only indexed; consumers (and each of their shards) parse just the rows they need
+            index = ensure_row_index(file_path)
+            row_count = index["row_count"]
+            artifact = artifact_store.put_json({
+                "columns": columns, "text_column": text_column, "id_column": id_column,
+                "file_path": file_path, "row_index": index_path(file_path), "row_count": row_count,
+            })
+            print(f"🗂️  Indexed {row_count} rows ({len(index['offsets'])} offsets) without parsing")
+        else:
+            # Only the text and id columns are parsed, chunk by chunk, and written straight into the artifact
+            chunk_rows = EDGE_STREAM_BATCH_ROWS if config.get("output_streams") else CSV_READER_CHUNK_ROWS
+            artifact, row_count = _write_csv_artifact(config, file_path, columns, text_column, id_column, chunk_rows)
         
-        # Read CSV file using pandas
-        df = pd.read_csv(file_path)
-        csv_data = df.to_dict('records')
-        columns = df.columns.tolist()
-        text_column = 'text' if 'text' in columns else columns[0]
-        texts = df[text_column].astype(str).tolist()
-        
-        print(f"✅ Successfully read {len(csv_data)} rows with {len(columns)} columns")
+        print(f"✅ Successfully read {row_count} rows with {len(columns)} columns")
         print(f"📊 Columns: {columns}")
         print(f"📝 Text column: {text_column}")
         
         # Enhanced result structure with real data flow information
         result = {
-            "rows": csv_data,
             "columns": columns,
-            "row_count": len(csv_data),
+            "row_count": row_count,
             "file_path": file_path,
             "data_type": "csv_data",
             "next_blocks": [BlockType.SENTIMENT_ANALYSIS.value, BlockType.TOXICITY_DETECTION.value],
-            "texts": texts, # Extract texts for next blocks
             "text_column": text_column,
+            "artifact": artifact,
         }
         
-        print(f"🚀 CSV Reader Completed - Ready to process {len(texts)} texts")
+        print(f"🚀 CSV Reader Completed - Ready to process {row_count} texts")
         return {"success": True, "result": result}
         
     except FileNotFoundError:
@@ -266,62 +410,43 @@ def _process_csv_reader(block_run_id: int, config: Dict[str, Any]) -> Dict[str,
         print(f"❌ {error_msg}")
         return {"success": False, "error": error_msg}
 
+def _write_csv_artifact(config: Dict[str, Any], file_path: str, columns: list, text_column: str, id_column: str,
+                        chunk_rows: int) -> Tuple[Dict[str, Any], int]:
+    """Stream the file's texts (and ids) into the csv_data table artifact and to streaming out-edges, one chunk at a time.
+
+    The artifact holds the "texts" column ("ids" too when the file has an id column)
+    plus "columns", "text_column" and "id_column".
+    """
+    usecols = [column for column in columns if column in (text_column, id_column)]
+    row_count = 0
+    with _open_output_streams(config) as stream_out, artifact_store.table_writer(
+            {"columns": columns, "text_column": text_column, "id_column": id_column}) as out:
+        for df in iter_csv_chunks(file_path, usecols, chunk_rows):
+            if df.empty:
+                continue
+            chunk_texts = df[text_column].tolist()
+            batch = {"texts": chunk_texts}
+            if id_column:
+                batch["ids"] = df[id_column].tolist()
+            out.write_batch(batch)
+            row_count += len(chunk_texts)
+            stream_out.write(chunk_texts)
+    return out.ref, row_count
+
 def _process_sentiment_analysis(block_run_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
-    """Process Sentiment Analysis tasks using OpenAI API"""
+    """Process Sentiment Analysis tasks with the block's inference backend"""
     print(f"Processing Sentiment Analysis for block_run_id: {block_run_id}")
     
-    # Get texts from config (should be populated by orchestrator)
-    texts = config.get("texts", [])
-    print(f"*********Sentiment Analysis: {texts}")
-    
-    if not texts:
-        error_msg = "No texts provided for sentiment analysis"
-        print(f"❌ {error_msg}")
-        return {"success": False, "error": error_msg}
-    
-    print(f"📝 Analyzing sentiment for {len(texts)} texts using OpenAI")
-    
     try:
-        results = []
-        batch_size = 10  # Process in batches to avoid rate limits
+        texts, results, report = _analyze_texts(config, SENTIMENT)
         
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            print(f" Processing batch {i//batch_size + 1}: texts {i+1}-{min(i+batch_size, len(texts))}")
-            
-            for j, text in enumerate(batch_texts):
-                try:
-                    # Use the separate function
-                    result = analyze_sentiment_with_openai(text)
-                    results.append(result)
-                    # results.append({
-                    #     "text": text,
-                    #     "sentiment": "POSITIVE",
-                    #     "score": 0.8,
-                    # })                    
-                except Exception as e:
-                    print(f"⚠️  Error processing text {i+j+1}: {str(e)}")
-                    # Fallback result
-                    results.append({
-                        "text": text,
-                        "sentiment": "NEUTRAL",
-                        "score": 0.5,
-                        "error": str(e)
-                    })
-            
-            # Small delay between batches to respect OpenAI rate limits
-            if i + batch_size < len(texts):
-                time.sleep(0.5)
-
-        
-        result = {
-            "sentiments_results": results,
-            "data_type": "sentiment_data",
-            "next_blocks": [BlockType.FILE_WRITER.value],
-        }
+        if not texts:
+            error_msg = "No texts provided for sentiment analysis"
+            print(f"❌ {error_msg}")
+            return {"success": False, "error": error_msg}
         
-        print(f"✅ Sentiment Analysis Completed!")
-        return {"success": True, "result": result}
+        print("✅ Sentiment Analysis Completed!")
+        return _classification_result(BlockType.SENTIMENT_ANALYSIS, texts, results, report)
         
     except Exception as e:
         error_msg = f"Error in sentiment analysis: {str(e)}"
@@ -329,165 +454,164 @@ def _process_sentiment_analysis(block_run_id: int, config: Dict[str, Any]) -> Di
         return {"success": False, "error": error_msg}
 
 def _process_toxicity_detection(block_run_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
-    """Process Toxicity Detection tasks using OpenAI API"""
+    """Process Toxicity Detection tasks with the block's inference backend"""
     print(f"Processing Toxicity Detection for block_run_id: {block_run_id}")
     
-    # Get texts from config (should be populated by orchestrator)
-    texts = config.get("texts", [])
-    print(f"*********Toxicity Detection: {texts}")
-    
-    if not texts:
-        error_msg = "No texts provided for toxicity detection"
-        print(f"❌ {error_msg}")
-        return {"success": False, "error": error_msg}
-    
-    print(f" Detecting toxicity for {len(texts)} texts using OpenAI")
-    
     try:
-        results = []
-        batch_size = 10  # Process in batches to avoid rate limits
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            print(f" Processing batch {i//batch_size + 1}: texts {i+1}-{min(i+batch_size, len(texts))}")
-            
-            for j, text in enumerate(batch_texts):
-                try:
-                    # Use the separate function
-                    result = detect_toxicity_with_openai(text)
-                    results.append(result)
-                    # results.append({
-                    #     "text": text,
-                    #     "toxicity": "NON_TOXIC",
-                    #     "score": 0.8,
-                    # })
-                    
-                except Exception as e:
-                    print(f"⚠️  Error processing text {i+j+1}: {str(e)}")
-                    # Fallback result
-                    results.append({
-                        "text": text,
-                        "toxicity": "NON_TOXIC",
-                        "score": 0.1,
-                        "error": str(e)
-                    })
-            
-            # Small delay between batches to respect rate limits
-            if i + batch_size < len(texts):
-                time.sleep(0.5)
-        
-        # Calculate summary statistics
+        texts, results, report = _analyze_texts(config, TOXICITY)
         
-        result = {
-            "toxicity_results": results,
-            "data_type": "toxicity_data",
-            "next_blocks": [BlockType.FILE_WRITER.value],
-        }
+        if not texts:
+            error_msg = "No texts provided for toxicity detection"
+            print(f"❌ {error_msg}")
+            return {"success": False, "error": error_msg}
         
-        print(f"✅ Toxicity Detection Completed!")
-        return {"success": True, "result": result}
+        print("✅ Toxicity Detection Completed!")
+        return _classification_result(BlockType.TOXICITY_DETECTION, texts, results, report)
         
     except Exception as e:
         error_msg = f"Error in toxicity detection: {str(e)}"
         print(f"❌ {error_msg}")
         return {"success": False, "error": error_msg}
 
+def _classification_result(block_type: str, texts: list, results: list, report: dict = None) -> Dict[str, Any]:
+    """Store a classification block's results and build its task result"""
+    _, results_key, data_type = CLASSIFICATION_BLOCKS[block_type]
+    artifact = artifact_store.put_table({results_key: results, "texts": texts})
+    return {"success": True, "result": {
+        "data_type": data_type,
+        "next_blocks": [BlockType.FILE_WRITER.value],
+        "result_count": len(results),
+        **(report or {}),
+        "artifact": artifact,
+    }}
+
+def _analyze_texts(config: Dict[str, Any], task: ClassificationTask) -> Tuple[list, list, dict]:
+    """Classify the block's input texts with its inference backend, streaming results downstream per batch.
+
+    Identical texts in a batch are classified once; returns the texts, their
+    results and the backend's counters (cache hits, rows resolved locally, ...).
+    """
+    texts, results = [], []
+    stats = Counter()
+    backend = get_backend(config.get("backend"))
+    routing = config.get("routing") or {}
+    if routing.get("deadline_seconds") is not None:
+        # A relative deadline counts from when this job starts classifying
+        config = {**config, "routing": {**routing, "deadline_at": time.time() + float(routing["deadline_seconds"])}}
+    
+    try:
+        with metered() as meter, _open_output_streams(config) as stream_out:
+            for batch_number, batch_texts in enumerate(_iter_input_batches(config, LLM_BATCH_SIZE)):
+                # One representative per distinct (normalized) text
+                representatives = {}
+                for text in batch_texts:
+                    representatives.setdefault(normalize_text(text), text)
+                unique_texts = list(representatives.values())
+                stats["deduplicated"] += len(batch_texts) - len(unique_texts)
+                print(f" Processing batch {batch_number + 1}: texts {len(texts) + 1}-{len(texts) + len(batch_texts)} "
+                      f"({len(unique_texts)} distinct) with the {backend.name} backend")
+                
+                resolved = dict(zip(unique_texts, backend.classify(task, unique_texts, config, stats)))
+                batch_results = [_with_text(resolved[representatives[normalize_text(text)]], text) for text in batch_texts]
+                texts.extend(batch_texts)
+                results.extend(batch_results)
+                stream_out.write(batch_results)
+            
+            if not texts:
+                stream_out.abort("No input texts")
+    finally:
+        # A process pool the backend started must not outlive this job
+        backend.close()
+    
+    report = _inference_report(stats, meter.totals())
+    usage = report["usage"]
+    print(f"🧾 LLM usage: {usage['llm_calls']} calls, {usage['prompt_tokens']}+{usage['completion_tokens']} tokens, "
+          f"{usage['llm_seconds']}s, {usage['llm_retries']} retries, {usage['cache_hits']} cache hits, ${usage['cost_usd']}")
+    if report["cache"]:
+        print(f"🗃️  LLM cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+              f"{stats['deduplicated']} duplicates, {stats['near_duplicates']} near duplicates")
+    if "cascade" in report:
+        print(f"🪜 Cascade: {report['cascade']['local_share']:.0%} of rows resolved locally")
+    if "routing" in report:
+        print(f"🧭 Routing: {', '.join(f'{count} texts to {model}' for model, count in report['routing'].items())}")
+    return texts, results, report
+
+def _inference_report(stats: Dict[str, int], usage: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-run counters: cache/dedup counts and LLM usage, plus the cascade's local vs LLM split and the texts per
+    model when they apply"""
+    stats = {key: value for key, value in stats.items() if value}
+    # Merged shard usage already carries its (possibly fused-split) cache hits
+    usage = {"cache_hits": stats.get("hits", 0) + stats.get("near_duplicates", 0), **usage}
+    local, escalated = stats.pop("local_resolved", 0), stats.pop("escalated", 0)
+    routed = {key.split(":", 1)[1]: stats.pop(key) for key in list(stats) if key.startswith("routed:")}
+    report = {"cache": stats, "usage": usage}
+    if local or escalated:
+        report["cascade"] = {"local_resolved": local, "escalated": escalated, "local_share": round(local / (local + escalated), 4)}
+    if routed:
+        report["routing"] = routed
+    return report
+
+def _with_text(result, text: str):
+    """A copy of a (possibly deduplicated) result for this exact text; fused results are tuples of results"""
+    if isinstance(result, tuple):
+        return tuple({**member_result, "text": text} for member_result in result)
+    return {**result, "text": text}
+
 def _process_file_writer(block_run_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
-    """Process File Writer tasks - Create real CSV files with analysis results"""
+    """Process File Writer tasks - stream the analysis results into an output file"""
     print(f"Processing File Writer for block_run_id: {block_run_id}")
     print(f"*********File Writer: config***********: {config}")
     try:
-        # Get input data from config (should be populated by orchestrator)
-        input_data = config.get("input_data", [])
-        output_format = config.get("output_format", "csv")
-        
-        if not input_data:
-            print(f"⚠️  No input data found for file writer")
-            print(f"🔍 Available config keys: {list(config.keys())}")
-            return {"success": False, "error": "No input data provided"}
-        
-        print(f" Writing {len(input_data)} records to CSV file")
-        
-        # Create output directory
-        output_dir = "/app/outputs"
-        os.makedirs(output_dir, exist_ok=True)
+        output_format = config.get("output_format", FILE_WRITER_FORMAT)
         
         # Determine file type based on config
         block_purpose = config.get("purpose", "output")
         file_prefix = config.get("file_prefix", "results")
         
-        # Generate filename with timestamp
+        # Generate filename with timestamp (the sink adds the format's extension)
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         if "sentiment" in block_purpose:
-            filename = f"sentiment_results_{block_run_id}_{timestamp}.csv"
+            name = f"sentiment_results_{block_run_id}_{timestamp}"
         elif "toxicity" in block_purpose:
-            filename = f"toxicity_results_{block_run_id}_{timestamp}.csv"
+            name = f"toxicity_results_{block_run_id}_{timestamp}"
         else:
-            filename = f"{file_prefix}_{block_run_id}_{timestamp}.csv"
-        
-        output_path = os.path.join(output_dir, filename)
-        print(f"Output path: {output_path}")
-
-        # Create CSV data
-        csv_rows = []
-        for index, item in enumerate(input_data, start=1):  # start=1 makes IDs start from 1
-            # Handle different data structures
-            if "toxicity" in item:
-                # Toxicity detection results
-                row = {
-                    "id": index,  # Add ID field
-                    "text": item.get("text", ""),
-                    "toxicity_label": item.get("toxicity", ""),
-                }
-                # Only add error field if there's an actual error
-                if item.get("error"):
-                    row["error"] = item.get("error")
-                csv_rows.append(row)
-                
-            elif "sentiment" in item:
-                # Sentiment analysis results
-                row = {
-                    "id": index,  # Add ID field
-                    "text": item.get("text", ""),
-                    "sentiment_label": item.get("sentiment", ""),
-                }
-                # Only add error field if there's an actual error
-                if item.get("error"):
-                    row["error"] = item.get("error")
-                csv_rows.append(row)
-                
-            else:
-                # Generic data - filter out empty error fields and add ID
-                filtered_item = {k: v for k, v in item.items() if not (k == "error" and not v)}
-                filtered_item["id"] = index  # Add ID field at the beginning
-                csv_rows.append(filtered_item)
-        
-        # Write to CSV file
-        df = pd.DataFrame(csv_rows)
-        df.to_csv(output_path, index=False)
-        
-        # Get file size
-        file_size = os.path.getsize(output_path)
-        file_size_kb = round(file_size / 1024, 2)
-        
+            name = f"{file_prefix}_{block_run_id}_{timestamp}"
+        
+        # Rows reach the file batch by batch; it is renamed into place only once complete
+        with open_file_sink(os.path.join(OUTPUT_DIR, name), output_format, config.get("partition_by")) as sink:
+            print(f"Output path: {sink.path}")
+            for items in _iter_file_writer_input(config, EDGE_STREAM_BATCH_ROWS):
+                sink.write_rows([
+                    _to_csv_row(index, item) for index, item in enumerate(items, start=sink.records_written + 1)  # IDs start from 1
+                ])
+            if not sink.records_written:
+                sink.discard()
+                print("⚠️  No input data found for file writer")
+                print(f"🔍 Available config keys: {list(config.keys())}")
+                return {"success": False, "error": "No input data provided"}
+        
+        # Only file metadata goes back through Redis and output_data, never the rows
+        file_info = sink.info()
+        file_size_kb = round(file_info["file_size_bytes"] / 1024, 2)
+        # Served by the downloads API; a parquet directory is downloaded one part file at a time
+        download_base = f"/api/v1/downloads/pipeline/{config.get('pipeline_run_id')}/file"
+        downloads = {"download_url": f"{download_base}/{sink.filename}"}
+        if "part_files" in file_info:
+            downloads = {"download_urls": [f"{download_base}/{part}" for part in file_info["part_files"]]}
         result = {
             "file_info": {
-                "output_path": output_path,
-                "filename": filename,
+                **file_info,
                 "file_size": f"{file_size_kb} KB",
-                "records_written": len(csv_rows),
-                "format": "csv",
                 "status": "completed",
-                "download_url": f"/api/v1/pipelines/download/{filename}"  # Add download URL
+                **downloads,
             },
             "data_type": "file_output",
             "next_blocks": [],  # End of pipeline
-            "input_data": input_data,
-            "csv_data": csv_rows  # Include the actual CSV data
+            "result_count": sink.records_written,
         }
         
-        print(f"✅ CSV file created successfully: {output_path}")
-        print(f" Records written: {len(csv_rows)}")
+        print(f"✅ {output_format} output created successfully: {sink.path}")
+        print(f" Records written: {sink.records_written}")
         print(f"📁 File size: {file_size_kb} KB")
         
         return {"success": True, "result": result}
@@ -495,4 +619,50 @@ def _process_file_writer(block_run_id: int, config: Dict[str, Any]) -> Dict[str,
     except Exception as e:
         error_msg = f"Error in file writer: {str(e)}"
         print(f"❌ {error_msg}")
-        return {"success": False, "error": error_msg}
\ No newline at end of file
+        return {"success": False, "error": error_msg}
+
+def _iter_file_writer_input(config: Dict[str, Any], batch_size: int):
+    """Analysis results in batches: inline input_data (legacy pipelines), the upstream edge stream,
+    or the results column of the upstream analysis artifact"""
+    if config.get("input_data"):
+        input_data = config["input_data"]
+        for i in range(0, len(input_data), batch_size):
+            yield input_data[i:i + batch_size]
+        return
+    if config.get("input_stream"):
+        yield from _iter_input_batches(config, batch_size)
+        return
+    
+    inputs = config.get("inputs", {})
+    for data_type, results_key in (("sentiment_data", "sentiments_results"), ("toxicity_data", "toxicity_results")):
+        if inputs.get(data_type):
+            yield from artifact_store.iter_column(inputs[data_type], results_key, batch_size)
+            return
+
+def _to_csv_row(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    """Output CSV row for one analysis result"""
+    # Handle different data structures
+    if "toxicity" in item:
+        # Toxicity detection results
+        row = {
+            "id": index,  # Add ID field
+            "text": item.get("text", ""),
+            "toxicity_label": item.get("toxicity", ""),
+        }
+    elif "sentiment" in item:
+        # Sentiment analysis results
+        row = {
+            "id": index,  # Add ID field
+            "text": item.get("text", ""),
+            "sentiment_label": item.get("sentiment", ""),
+        }
+    else:
+        # Generic data - filter out empty error fields and add ID
+        row = {k: v for k, v in item.items() if not (k == "error" and not v)}
+        row["id"] = index  # Add ID field at the beginning
+        return row
+    
+    # Only add error field if there's an actual error
+    if item.get("error"):
+        row["error"] = item.get("error")
+    return row